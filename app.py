@@ -12,6 +12,7 @@ from years.endpoints import Endpoint
 from years.background import BackgroundTask
 from years import Years
 from years.exceptions import HTTPException
+from years.staticfiles import StaticFiles
 
 
 @asynccontextmanager
@@ -106,7 +107,9 @@ async def request4(request: Request):
 
 @sub.post("/read_file")
 async def read_file(request: Request):
-    return StreamingResponse(request.stream(), media_type="text/html")
+    return StreamingResponse(
+        request.stream(), media_type="text/html", watch_disconnect=False
+    )
 
 
 @sub.get("/debug")
@@ -137,6 +140,7 @@ async def background_task(request: Request):
 app = Years(lifespan=lifespan, debug=True)
 
 app.mount("/sub/{name}", sub)
+app.mount("/statics", StaticFiles(directory="statics"))
 app.debug = False
 
 
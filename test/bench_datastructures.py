@@ -0,0 +1,54 @@
+"""
+Headers 查找的基准测试，在项目根目录下运行：
+
+    PYTHONPATH=. python test/bench_datastructures.py
+
+模拟一个带 30 个请求头的请求，中间件读取其中 5 个头。
+"""
+
+import time
+
+from years.datastructures import Headers
+
+ROUNDS = 20000
+RAW = [(f"x-custom-{idx}".encode(), f"value-{idx}".encode()) for idx in range(25)]
+RAW += [
+    (b"host", b"example.org"),
+    (b"accept", b"*/*"),
+    (b"accept-encoding", b"gzip, deflate, br"),
+    (b"user-agent", b"bench"),
+    (b"cookie", b"session=abc"),
+]
+LOOKUPS = ["host", "accept-encoding", "cookie", "x-custom-3", "authorization"]
+
+
+def legacy_get(raw, name: str, default=None):
+    """建立索引之前 Headers.get 的做法：每次都解码并扫描所有头"""
+    scan = [(key.decode("latin-1").lower(), value.decode("latin-1")) for key, value in raw]
+    for key, value in scan:
+        if key == name.lower():
+            return value
+    return default
+
+
+def main():
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        for name in LOOKUPS:
+            legacy_get(RAW, name)
+    before = (time.perf_counter() - start) / ROUNDS
+
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        headers = Headers(raw=RAW)
+        for name in LOOKUPS:
+            headers.get(name)
+    after = (time.perf_counter() - start) / ROUNDS
+
+    print(f"30 headers, {len(LOOKUPS)} lookups per request")
+    print(f"{'scan(us)':>12} {'index(us)':>12}")
+    print(f"{before * 1e6:>12.2f} {after * 1e6:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
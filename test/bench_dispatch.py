@@ -0,0 +1,76 @@
+"""
+路由函数分发的基准测试，在项目根目录下运行：
+
+    PYTHONPATH=. python test/bench_dispatch.py
+
+对比每次请求都用 inspect 判断 endpoint 类型、每次实例化类视图、
+在方法列表里线性查找，和注册时决定好调用方式、类只实例化一次、
+方法集合用 frozenset 的做法，测的是一个最简单的 hello world 请求。
+"""
+
+import time
+import asyncio
+import inspect
+
+from years.requests import Request
+from years.responses import Response
+from years.routing import Route
+
+ROUNDS = 50000
+RESPONSE = Response("hello, world", media_type="text/plain")
+METHODS = ["GET", "POST", "PUT", "PATCH", "DELETE"]
+
+
+async def hello(request):
+    return RESPONSE
+
+
+class HelloView:
+    async def __call__(self, request):
+        return RESPONSE
+
+
+def legacy_request_response(endpoint):
+    """注册时不做任何准备的旧写法"""
+
+    async def wrapper(scope, receive, send):
+        request = Request(scope, receive)
+        if inspect.isclass(endpoint):
+            response = await endpoint()(request)
+        elif inspect.iscoroutinefunction(endpoint):
+            response = await endpoint(request)
+        else:
+            response = await asyncio.to_thread(endpoint, request)
+        await response(scope, receive, send)
+
+    return wrapper
+
+
+async def receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+async def send(message):
+    pass
+
+
+async def run(app, methods):
+    scope = {"type": "http", "method": "DELETE", "path": "/", "headers": []}
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        if scope["method"] in methods:
+            await app(scope, receive, send)
+    return (time.perf_counter() - start) / ROUNDS
+
+
+async def main():
+    print(f"{'endpoint':>10} {'before(us)':>12} {'after(us)':>12}")
+    for name, endpoint in (("function", hello), ("class", HelloView)):
+        before = await run(legacy_request_response(endpoint), METHODS)
+        route = Route("/", endpoint, methods=METHODS)
+        after = await run(route.endpoint, route.methods)
+        print(f"{name:>10} {before * 1e6:>12.2f} {after * 1e6:>12.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
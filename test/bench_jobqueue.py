@@ -0,0 +1,57 @@
+"""
+持久化任务队列入队吞吐的基准测试，在项目根目录下运行：
+
+    PYTHONPATH=. python test/bench_jobqueue.py
+
+分别测试打开和关闭 fsync（SQLite 的 synchronous=FULL / OFF），
+以及每个任务单独提交（batch_size=1）和批量提交的入队速度。
+并发入队模拟很多请求同时往队列里写任务。
+"""
+
+import os
+import time
+import asyncio
+import tempfile
+
+from years.jobqueue import JobQueue
+
+JOBS = 5000
+CONCURRENCY = 500
+
+
+async def bench(fsync: bool, batch_size: int, jobs: int) -> float:
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "jobs.db")
+        queue = JobQueue(path, fsync=fsync, batch_size=batch_size)
+
+        @queue.task(name="noop")
+        async def noop(n):
+            pass
+
+        semaphore = asyncio.Semaphore(CONCURRENCY)
+
+        async def enqueue(n):
+            async with semaphore:
+                await queue.enqueue(noop, n)
+
+        # 第一次连接会建表，不计入时间
+        await queue.enqueue(noop, -1)
+        start = time.perf_counter()
+        await asyncio.gather(*(enqueue(n) for n in range(jobs)))
+        elapsed = time.perf_counter() - start
+        await queue.stop()
+        return jobs / elapsed
+
+
+async def main():
+    print(f"{'fsync':>6} {'batch':>6} {'jobs/s':>10}")
+    for fsync in (True, False):
+        for batch_size in (1, 256):
+            # 逐条提交并且打开 fsync 时很慢，减少任务数
+            jobs = JOBS // 10 if batch_size == 1 else JOBS
+            rate = await bench(fsync, batch_size, jobs)
+            print(f"{str(fsync):>6} {batch_size:>6} {rate:>10.0f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,61 @@
+"""
+JSON 序列化的基准测试，在项目根目录下运行：
+
+    PYTHONPATH=. python test/bench_jsoncodec.py
+
+分别测试 1 KB、100 KB、10 MB 的负载：旧的 json.dumps 出 str 再编码成 UTF-8，
+标准库编解码器，以及安装了 orjson 时的 OrjsonCodec。
+"""
+
+import json
+import time
+import asyncio
+
+from years.jsoncodec import OrjsonCodec, StdlibJSONCodec, orjson
+from years.responses import JSONResponse, Response
+
+
+def payload(size: int) -> dict:
+    item = {"id": 12345, "name": "用户名称", "tags": ["a", "b", "c"], "score": 9.5}
+    count = max(1, size // len(json.dumps(item, ensure_ascii=False).encode()))
+    return {"items": [dict(item, id=idx) for idx in range(count)]}
+
+
+async def send(message):
+    pass
+
+
+def legacy(content):
+    """使用编解码器之前 JSONResponse 的做法"""
+    text = json.dumps(dict(content), ensure_ascii=False)
+    return Response(text, media_type="application/json")
+
+
+def timeit(factory, content, rounds: int) -> float:
+    scope = {"type": "http", "method": "GET", "headers": []}
+
+    async def run():
+        for _ in range(rounds):
+            await factory(content)(scope, None, send)
+
+    start = time.perf_counter()
+    asyncio.run(run())
+    return (time.perf_counter() - start) / rounds
+
+
+def main():
+    codecs = {"legacy": legacy}
+    codecs["stdlib"] = lambda content: JSONResponse(content, codec=StdlibJSONCodec())
+    if orjson is not None:
+        codecs["orjson"] = lambda content: JSONResponse(content, codec=OrjsonCodec())
+
+    print(f"{'payload':>8} " + " ".join(f"{name + '(ms)':>12}" for name in codecs))
+    sizes = [("1KB", 1024, 2000), ("100KB", 100 * 1024, 100), ("10MB", 10 << 20, 3)]
+    for label, size, rounds in sizes:
+        content = payload(size)
+        results = [timeit(factory, content, rounds) for factory in codecs.values()]
+        print(f"{label:>8} " + " ".join(f"{result * 1e3:>12.3f}" for result in results))
+
+
+if __name__ == "__main__":
+    main()
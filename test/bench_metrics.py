@@ -0,0 +1,108 @@
+"""
+路由指标的基准测试，在项目根目录下运行：
+
+    PYTHONPATH=. python test/bench_metrics.py
+
+对比三种情况下一个 hello world 请求经过 Router 的耗时：
+没有统计代码的分发路径（baseline）、关闭统计（off）、打开统计（on）。
+关闭统计时和 baseline 的差别在测量误差范围内（只多了两次 None 判断）。
+"""
+
+import time
+import asyncio
+
+from years.concurrency import ExecutorSaturated
+from years.formparsers import MultiPartException
+from years.metrics import Metrics
+from years.requests import Request, RequestTooLarge
+from years.responses import Response
+from years.routing import Mathched, Route, Router, normalize_path
+
+ROUNDS = 50000
+REPEAT = 5
+RESPONSE = Response("hello, world", media_type="text/plain")
+
+
+async def hello(request):
+    return RESPONSE
+
+
+class BaselineRouter(Router):
+    """加入指标统计之前的 Router.__call__ 和 request_response"""
+
+    def compile(self):
+        for route in self.routes:
+            route.endpoint = baseline_request_response(route.handler)
+        return super().compile()
+
+    async def __call__(self, scope, receive, send):
+        tree = self.tree or self.compile()
+        ret, route = tree.search(scope, normalize_path(scope["path"]))
+        if ret is Mathched.FULL:
+            await route(scope, receive, send)
+        else:
+            await self.not_found(ret, scope, receive, send)
+
+
+def baseline_request_response(endpoint):
+    async def wrapper(scope, receive, send):
+        request = Request(scope, receive)
+
+        try:
+            response = await endpoint(request)
+        except RequestTooLarge:
+            response = Response("请求体过大", 413)
+        except MultiPartException as exc:
+            response = Response(str(exc), exc.status_code)
+        except ExecutorSaturated:
+            response = Response("服务繁忙", 503, headers={"retry-after": "1"})
+
+        await response(scope, receive, send)
+
+    return wrapper
+
+
+async def receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+async def send(message):
+    pass
+
+
+def build(router_class, metrics=None) -> Router:
+    router = router_class([Route("/users/{id}", endpoint=hello)])
+    if metrics is not None:
+        router.instrument(metrics)
+    router.compile()
+    return router
+
+
+async def run(router: Router) -> float:
+    best = float("inf")
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        for _ in range(ROUNDS):
+            scope = {"type": "http", "method": "GET", "path": "/users/1"}
+            await router(scope, receive, send)
+        best = min(best, (time.perf_counter() - start) / ROUNDS)
+    return best
+
+
+async def main():
+    metrics = Metrics()
+    results = {
+        "baseline": await run(build(BaselineRouter)),
+        "off": await run(build(Router)),
+        "on": await run(build(Router, metrics)),
+    }
+    print(f"{'metrics':>10} {'dispatch(us)':>14}")
+    for name, elapsed in results.items():
+        print(f"{name:>10} {elapsed * 1e6:>14.2f}")
+
+    handler = metrics.routes["/users/{id}"].handler
+    print(f"\nhandler p50 <= {handler.quantile(0.5) * 1e6:.2f}us")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
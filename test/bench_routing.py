@@ -0,0 +1,129 @@
+"""
+路由分发的基准测试，在项目根目录下运行：
+
+    PYTHONPATH=. python test/bench_routing.py
+
+对比线性扫描和编译后的路由树，路由数量从 10 增加到 10000 时，
+路由树的分发耗时应该基本保持不变。
+
+另外对比单个 Route.matches：每次拼接路径再用字符串正则匹配，
+和预编译正则、路径只规范化一次、字面量路径直接比较字符串。
+"""
+
+import re
+import time
+import asyncio
+
+from years.responses import Response
+from years.routing import Mathched, Route, Router
+
+ROUNDS = 2000
+RESPONSE = Response("ok", media_type="text/plain")
+
+
+async def endpoint(request):
+    return RESPONSE
+
+
+def build_router(count: int) -> Router:
+    routes = []
+    for idx in range(count):
+        if idx % 2:
+            routes.append(Route(f"/static{idx}/items", endpoint=endpoint))
+        else:
+            routes.append(Route(f"/users{idx}/{{username}}", endpoint=endpoint))
+    return Router(routes)
+
+
+async def receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+async def send(message):
+    pass
+
+
+def linear_search(router: Router, scope: dict):
+    for route in router.routes:
+        ret, _ = route.matches(scope)
+        if ret is Mathched.FULL:
+            return route
+
+
+def bench(count: int):
+    router = build_router(count)
+    path = f"/users{count - 2}/tom"
+
+    # 线性扫描在路由很多时太慢，按路由数量减少轮数
+    rounds = max(5, ROUNDS * 10 // count)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        linear_search(router, {"type": "http", "method": "GET", "path": path})
+    linear = (time.perf_counter() - start) / rounds
+
+    router.compile()
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        router.tree.search({"type": "http", "method": "GET", "path": path})
+    tree = (time.perf_counter() - start) / ROUNDS
+
+    async def dispatch():
+        for _ in range(ROUNDS):
+            scope = {"type": "http", "method": "GET", "path": path}
+            await router(scope, receive, send)
+
+    start = time.perf_counter()
+    asyncio.run(dispatch())
+    full = (time.perf_counter() - start) / ROUNDS
+
+    return linear, tree, full
+
+
+def legacy_matches(regex: str, scope: dict):
+    """预编译之前 Route.matches 的做法"""
+    path: str = scope["path"]
+
+    if not path.endswith("/"):
+        path += "/"
+
+    if not path.startswith("/"):
+        path = "/" + path
+
+    return re.fullmatch(regex, path)
+
+
+def bench_matches(template: str, path: str, rounds: int = 100000):
+    route = Route(template, endpoint=endpoint)
+    legacy = (template + "/").replace("{", "(?P<").replace("}", ">[^/]+)")
+    # 只匹配不上的路由才能体现每条路由的固定开销
+    scope = {"type": "http", "method": "GET", "path": path}
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        legacy_matches(legacy, scope)
+    before = (time.perf_counter() - start) / rounds
+
+    normalize = path + "/"
+    start = time.perf_counter()
+    for _ in range(rounds):
+        route.matches(scope, normalize)
+    after = (time.perf_counter() - start) / rounds
+
+    return before, after
+
+
+def main():
+    print(f"{'routes':>8} {'linear(us)':>12} {'tree(us)':>10} {'dispatch(us)':>14}")
+    for count in (10, 100, 1000, 10000):
+        linear, tree, full = bench(count)
+        print(f"{count:>8} {linear * 1e6:>12.2f} {tree * 1e6:>10.2f} {full * 1e6:>14.2f}")
+
+    print()
+    print(f"{'route':>20} {'before(ns)':>12} {'after(ns)':>12}")
+    for template in ("/users/me", "/users/{username}"):
+        before, after = bench_matches(template, "/static/nomatch")
+        print(f"{template:>20} {before * 1e9:>12.0f} {after * 1e9:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
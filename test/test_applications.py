@@ -0,0 +1,206 @@
+import pytest
+import asyncio
+import threading
+
+from years import Years
+from years.exceptions import ExceptionMiddleware, HTTPException
+from years.middleware import Middleware
+from years.background import BackgroundTask
+from years.concurrency import BoundedExecutor
+from years.jsoncodec import StdlibJSONCodec
+from years.responses import JSONResponse, PlainTextResponse
+from years.testclient import TestClient
+
+
+class RecordMiddleware:
+    def __init__(self, app, name, calls):
+        self.app = app
+        self.name = name
+        self.calls = calls
+
+    async def __call__(self, scope, receive, send):
+        self.calls.append(self.name)
+        await self.app(scope, receive, send)
+
+
+@pytest.mark.asyncio
+async def test_middleware_stack_built_once():
+    app = Years(debug=True)
+
+    @app.get("/")
+    async def homepage(request):
+        return PlainTextResponse("Hello, world!")
+
+    client = TestClient(app)
+    for _ in range(3):
+        response = await client.get("/")
+        assert response.text == "Hello, world!"
+
+    stack = app.middleware_stack
+    assert isinstance(stack, ExceptionMiddleware)
+    assert stack.endpoint is app.router
+    assert (await client.get("/")).status_code == 200
+    assert app.middleware_stack is stack
+
+
+@pytest.mark.asyncio
+async def test_middleware_order():
+    calls = []
+    app = Years(middleware=[Middleware(RecordMiddleware, name="inner", calls=calls)])
+    app.add_middleware(RecordMiddleware, name="outer", calls=calls)
+
+    @app.get("/")
+    async def homepage(request):
+        return PlainTextResponse("Hello, world!")
+
+    client = TestClient(app)
+    await client.get("/")
+    assert calls == ["outer", "inner"]
+
+    with pytest.raises(RuntimeError):
+        app.add_middleware(RecordMiddleware, name="late", calls=calls)
+
+
+@pytest.mark.asyncio
+async def test_http_exception_handlers():
+    async def teapot(request, exc):
+        return PlainTextResponse("I'm a teapot", status_code=exc.status_code)
+
+    app = Years(exception_handlers={418: teapot})
+
+    @app.get("/teapot")
+    async def raise_teapot(request):
+        raise HTTPException(418, "teapot")
+
+    @app.get("/forbidden")
+    async def raise_forbidden(request):
+        raise HTTPException(403, "forbidden")
+
+    client = TestClient(app)
+    response = await client.get("/teapot")
+    assert response.status_code == 418
+    assert response.text == "I'm a teapot"
+
+    response = await client.get("/forbidden")
+    assert response.status_code == 403
+
+
+@pytest.mark.asyncio
+async def test_debug_traceback():
+    app = Years(debug=True)
+
+    @app.get("/debug")
+    async def debug(request):
+        return 1 / 0
+
+    client = TestClient(app)
+    response = await client.get("/debug")
+    assert response.status_code == 500
+    assert "ZeroDivisionError" in response.text
+
+
+@pytest.mark.asyncio
+async def test_json_codec():
+    class UpperCodec(StdlibJSONCodec):
+        def dumps(self, obj):
+            return super().dumps(obj).upper()
+
+        def loads(self, data):
+            return {"decoded": super().loads(data)}
+
+    app = Years(json_codec=UpperCodec())
+
+    @app.post("/")
+    async def echo(request):
+        return JSONResponse(await request.json())
+
+    @app.post("/sync")
+    def sync_echo(request):
+        return JSONResponse({"sync": "ok"})
+
+    client = TestClient(app)
+    response = await client.post("/", json={"a": "b"})
+    assert response.json() == {"DECODED": {"A": "B"}}
+
+    response = await client.post("/sync")
+    assert response.json() == {"SYNC": "OK"}
+
+    # 应用之外使用默认的编解码器
+    assert JSONResponse({"a": "b"}).body == b'{"a":"b"}'
+
+
+@pytest.mark.asyncio
+async def test_websocket_decorator():
+    app = Years(middleware=[Middleware(ExceptionMiddleware, {})])
+
+    @app.websocket("/ws")
+    async def echo(websocket):
+        await websocket.accept()
+        data = await websocket.receive_json()
+        await websocket.send_json({"echo": data})
+        await websocket.close()
+
+    incoming = [
+        {"type": "websocket.connect"},
+        {"type": "websocket.receive", "text": '{"a": 1}'},
+    ]
+    sent = []
+
+    async def receive():
+        return incoming.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "websocket", "path": "/ws", "query_string": b"", "headers": []}
+    await app(scope, receive, send)
+    assert scope["app"] is app
+    assert sent[1] == {"type": "websocket.send", "text": '{"echo":{"a":1}}'}
+    assert sent[-1]["type"] == "websocket.close"
+
+
+@pytest.mark.asyncio
+async def test_sync_endpoint_executors():
+    threads = {}
+    release = threading.Event()
+    app = Years(
+        endpoint_executor=BoundedExecutor(1, max_queue=0, name="endpoint"),
+        background_executor=BoundedExecutor(1, name="background"),
+    )
+    reports = BoundedExecutor(1, name="reports")
+
+    def record(name):
+        threads[name] = threading.current_thread().name
+
+    @app.get("/")
+    def homepage(request):
+        record("endpoint")
+        return PlainTextResponse("ok", background=BackgroundTask(record, "background"))
+
+    @app.get("/report", executor=reports)
+    def report(request):
+        record("report")
+        return PlainTextResponse("report")
+
+    @app.get("/slow")
+    def slow(request):
+        release.wait()
+        return PlainTextResponse("slow")
+
+    client = TestClient(app)
+    assert (await client.get("/")).text == "ok"
+    assert (await client.get("/report")).text == "report"
+    await app.background_runner.drain()
+    assert threads["endpoint"].startswith("endpoint")
+    assert threads["background"].startswith("background")
+    assert threads["report"].startswith("reports")
+
+    # 唯一的线程被占住并且不允许排队时，新的请求直接得到 503
+    pending = asyncio.ensure_future(client.get("/slow"))
+    while app.endpoint_executor.stats()["active"] == 0:
+        await asyncio.sleep(0.001)
+    response = await client.get("/")
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+    release.set()
+    assert (await pending).text == "slow"
@@ -1,5 +1,13 @@
 import pytest
-from years.background import BackgroundTask, BackgroundTasks
+import asyncio
+
+from years import Years
+from years.background import (
+    BackgroundRunner,
+    BackgroundTask,
+    BackgroundTasks,
+    ParallelBackgroundTasks,
+)
 from years.responses import Response
 from years.testclient import TestClient
 
@@ -66,3 +74,153 @@ async def test_multiple_tasks():
     response = await client.get("/")
     assert response.text == "tasks initiated"
     assert TASK_COUNTER == 1 + 2 + 3
+
+
+@pytest.mark.asyncio
+async def test_parallel_tasks():
+    running = 0
+    peak = 0
+
+    async def job():
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+
+    tasks = ParallelBackgroundTasks()
+    for _ in range(5):
+        tasks.add_task(job)
+    await tasks()
+    assert peak == 5
+
+    peak = 0
+    tasks = BackgroundTasks()
+    for _ in range(5):
+        tasks.add_task(job)
+    await tasks()
+    assert peak == 1 and running == 0
+
+
+@pytest.mark.asyncio
+async def test_parallel_tasks_failure(caplog):
+    finished = []
+
+    async def broken():
+        raise ValueError("boom")
+
+    async def slow():
+        await asyncio.sleep(0.1)
+        finished.append("slow")
+
+    # 失败的任务不会取消其他任务
+    tasks = ParallelBackgroundTasks()
+    tasks.add_task(broken)
+    tasks.add_task(slow)
+    tasks.add_task(broken)
+    await tasks()
+    assert finished == ["slow"]
+    errors = [record for record in caplog.records if record.exc_info]
+    assert len(errors) == 2
+
+
+@pytest.mark.asyncio
+async def test_background_runner(caplog):
+    runner = BackgroundRunner(max_concurrency=2)
+    running = 0
+    peak = 0
+
+    async def job():
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+
+    async def broken():
+        raise ValueError("boom")
+
+    for _ in range(5):
+        runner.submit(BackgroundTask(job))
+    runner.submit(BackgroundTask(broken))
+    assert len(runner) == 6
+    assert await runner.drain() == 0
+    assert len(runner) == 0
+    assert peak == 2
+    assert "boom" in caplog.text
+
+    runner.submit(BackgroundTask(asyncio.sleep, 10))
+    assert await runner.drain(timeout=0.01) == 1
+    assert len(runner) == 0
+
+
+@pytest.mark.asyncio
+async def test_app_runs_background_after_response():
+    release = asyncio.Event()
+    done = []
+
+    async def job():
+        await release.wait()
+        done.append(True)
+
+    app = Years()
+
+    @app.get("/")
+    async def homepage(request):
+        return Response("ok", media_type="text/plain", background=BackgroundTask(job))
+
+    # 后台任务还没完成时响应已经返回
+    response = await TestClient(app).get("/")
+    assert response.text == "ok"
+    assert done == [] and len(app.background_runner) == 1
+
+    # 没有 lifespan 函数时也要处理 shutdown，并在这之前等待后台任务
+    messages = [{"type": "lifespan.startup"}, {"type": "lifespan.shutdown"}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message["type"])
+        if message["type"] == "lifespan.startup.complete":
+            release.set()
+
+    await app({"type": "lifespan"}, receive, send)
+    assert sent == ["lifespan.startup.complete", "lifespan.shutdown.complete"]
+    assert done == [True]
+
+
+@pytest.mark.asyncio
+async def test_mounted_app_background_drained():
+    release = asyncio.Event()
+    done = []
+
+    async def job():
+        await release.wait()
+        done.append(True)
+
+    sub = Years()
+
+    @sub.get("/")
+    async def homepage(request):
+        return Response("ok", media_type="text/plain", background=BackgroundTask(job))
+
+    app = Years()
+    app.mount("/sub/{name}", sub)
+
+    # 子应用收不到 lifespan 事件，后台任务交给最外层的应用
+    assert (await TestClient(app).get("/sub/x/")).text == "ok"
+    assert len(app.background_runner) == 1 and len(sub.background_runner) == 0
+
+    messages = [{"type": "lifespan.startup"}, {"type": "lifespan.shutdown"}]
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        if message["type"] == "lifespan.startup.complete":
+            release.set()
+
+    await app({"type": "lifespan"}, receive, send)
+    assert done == [True]
@@ -0,0 +1,178 @@
+import pytest
+import asyncio
+
+from years import Years
+from years.middleware.cache import (
+    CacheMiddleware,
+    CachedResponse,
+    MemoryCacheStore,
+    parse_cache_control,
+)
+from years.responses import PlainTextResponse, Response, StreamingResponse
+from years.testclient import TestClient
+
+
+def build_app(**options):
+    app = Years()
+    calls = []
+
+    @app.get("/items")
+    async def items(request):
+        calls.append(request.url.path)
+        await asyncio.sleep(0.01)
+        return PlainTextResponse(f"items {len(calls)}")
+
+    @app.get("/private")
+    async def private(request):
+        calls.append("private")
+        return PlainTextResponse("me", headers={"cache-control": "private"})
+
+    @app.get("/short")
+    async def short(request):
+        calls.append("short")
+        return PlainTextResponse("short", headers={"cache-control": "max-age=0"})
+
+    @app.get("/lang")
+    async def lang(request):
+        calls.append("lang")
+        language = request.headers.get("accept-language", "en")
+        return PlainTextResponse(language, headers={"vary": "Accept-Language"})
+
+    @app.get("/stream")
+    async def stream(request):
+        calls.append("stream")
+        return StreamingResponse(iter(["a", "b", "c"]), media_type="text/plain")
+
+    app.add_middleware(CacheMiddleware, **options)
+    return app, calls
+
+
+def test_parse_cache_control():
+    assert parse_cache_control('max-age=60, No-Cache, foo="bar"') == {
+        "max-age": "60",
+        "no-cache": None,
+        "foo": "bar",
+    }
+
+
+@pytest.mark.asyncio
+async def test_cache_hit_and_query_params():
+    app, calls = build_app(query_params=["page"])
+    client = TestClient(app)
+
+    response = await client.get("/items?page=1&utm=x")
+    assert response.text == "items 1"
+    assert response.headers["x-cache"] == "MISS"
+
+    response = await client.get("/items?utm=y&page=1")
+    assert response.text == "items 1"
+    assert response.headers["x-cache"] == "HIT"
+    assert "age" in response.headers
+
+    response = await client.get("/items?page=2")
+    assert response.text == "items 2"
+
+    # POST 不经过缓存
+    assert (await client.post("/items")).status_code == 405
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_cache_control():
+    app, calls = build_app()
+    client = TestClient(app)
+
+    await client.get("/items")
+    response = await client.get("/items", headers={"cache-control": "no-cache"})
+    assert response.text == "items 2"
+    assert (await client.get("/items")).text == "items 2"
+    response = await client.get("/items", headers={"cache-control": "no-store"})
+    assert response.text == "items 3"
+    response = await client.get("/items", headers={"authorization": "Bearer x"})
+    assert response.text == "items 4"
+    # 带 Cookie 的请求可能拿到按用户生成的页面，同样不经过缓存
+    response = await client.get("/items", headers={"cookie": "session=a"})
+    assert response.text == "items 5"
+    assert "x-cache" not in response.headers
+    assert (await client.get("/items")).text == "items 2"
+
+    for path in ("/private", "/short"):
+        await client.get(path)
+        assert (await client.get(path)).headers["x-cache"] == "MISS"
+    assert calls.count("private") == 2 and calls.count("short") == 2
+
+    # 站点的 Cookie 和页面内容无关时可以关掉这条规则
+    app, _ = build_app(bypass_headers=["authorization"])
+    client = TestClient(app)
+    await client.get("/items")
+    response = await client.get("/items", headers={"cookie": "theme=dark"})
+    assert response.headers["x-cache"] == "HIT"
+
+
+@pytest.mark.asyncio
+async def test_cache_vary():
+    app, calls = build_app()
+    client = TestClient(app)
+
+    for language in ("zh", "en", "zh", "en"):
+        response = await client.get("/lang", headers={"accept-language": language})
+        assert response.text == language
+    assert calls.count("lang") == 2
+
+
+@pytest.mark.asyncio
+async def test_cache_streaming_and_max_body_size():
+    app, calls = build_app()
+    client = TestClient(app)
+    assert (await client.get("/stream")).text == "abc"
+    response = await client.get("/stream")
+    assert response.text == "abc"
+    assert response.headers["x-cache"] == "HIT"
+
+    app, calls = build_app(max_body_size=2)
+    client = TestClient(app)
+    await client.get("/stream")
+    assert (await client.get("/stream")).text == "abc"
+    assert calls == ["stream", "stream"]
+
+
+@pytest.mark.asyncio
+async def test_cache_conditional_hit():
+    async def endpoint(scope, receive, send):
+        response = Response("x", headers={"etag": '"v1"'})
+        await response(scope, receive, send)
+
+    client = TestClient(CacheMiddleware(endpoint))
+    await client.get("/")
+    response = await client.get("/", headers={"if-none-match": '"v1"'})
+    assert response.status_code == 304
+
+
+@pytest.mark.asyncio
+async def test_cache_coalesces_concurrent_misses():
+    app, calls = build_app()
+    client = TestClient(app)
+    responses = await asyncio.gather(*(client.get("/items") for _ in range(100)))
+    assert {response.text for response in responses} == {"items 1"}
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_memory_store_lru_and_ttl():
+    def entry(body):
+        return CachedResponse(200, [], body, (), (), 0)
+
+    store = MemoryCacheStore(maxsize=2, max_bytes=10)
+    await store.set("a", entry(b"1"), 60)
+    await store.set("b", entry(b"2"), 60)
+    await store.get("a")
+    await store.set("c", entry(b"3"), 60)
+    assert await store.get("b") is None
+    assert await store.get("a") is not None
+
+    await store.set("big", entry(b"x" * 9), 60)
+    assert len(store) == 2 and store.size == 10
+    assert await store.get("c") is None
+
+    await store.set("gone", entry(b""), -1)
+    assert await store.get("gone") is None
@@ -0,0 +1,137 @@
+import os
+import gzip
+import pytest
+
+from years import Years
+from years.middleware import Middleware
+from years.middleware.compression import CompressionMiddleware, brotli
+from years.responses import (
+    FileResponse,
+    PlainTextResponse,
+    Response,
+    StreamingResponse,
+)
+from years.testclient import TestClient
+
+
+def build_app(**options):
+    app = Years(middleware=[Middleware(CompressionMiddleware, **options)])
+
+    @app.get("/large")
+    async def large(request):
+        return PlainTextResponse("x" * 4000, headers={"vary": "Cookie"})
+
+    @app.get("/small")
+    async def small(request):
+        return PlainTextResponse("x" * 10)
+
+    @app.get("/image")
+    async def image(request):
+        return Response(b"x" * 4000, media_type="image/png")
+
+    @app.get("/stream")
+    async def stream(request):
+        async def numbers():
+            for number in range(100):
+                yield f"{number}, "
+
+        return StreamingResponse(numbers(), media_type="text/plain")
+
+    return app
+
+
+@pytest.mark.asyncio
+async def test_gzip_response():
+    client = TestClient(build_app(encodings=["gzip"]))
+
+    response = await client.get("/large", headers={"accept-encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.text == "x" * 4000
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Cookie, Accept-Encoding"
+    assert int(response.headers["content-length"]) < 4000
+
+    response = await client.get("/small", headers={"accept-encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+    assert response.text == "x" * 10
+
+    response = await client.get("/image", headers={"accept-encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+
+    response = await client.get("/large", headers={"accept-encoding": "identity"})
+    assert "content-encoding" not in response.headers
+    assert response.headers["content-length"] == "4000"
+
+
+@pytest.mark.asyncio
+async def test_gzip_streaming_response():
+    app = build_app(encodings=["gzip"], offload_size=0)
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": "/stream",
+        "headers": [(b"accept-encoding", b"gzip")],
+    }
+    await app(scope, None, send)
+
+    start, *bodies = messages
+    headers = dict(start["headers"])
+    assert headers[b"content-encoding"] == b"gzip"
+    assert b"content-length" not in headers
+    # 每一块都单独压缩发送，而不是缓存到最后
+    assert len(bodies) > 2
+    assert all(message["body"] for message in bodies[:-1])
+    data = gzip.decompress(b"".join(message["body"] for message in bodies))
+    assert data == "".join(f"{number}, " for number in range(100)).encode()
+
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(brotli is None, reason="需要安装 brotli")
+async def test_brotli_response():
+    client = TestClient(build_app())
+    response = await client.get("/large", headers={"accept-encoding": "gzip, br"})
+    assert response.headers["content-encoding"] == "br"
+    assert response.text == "x" * 4000
+
+
+@pytest.mark.asyncio
+async def test_range_response_not_compressed(tmpdir):
+    path = os.path.join(tmpdir, "range.txt")
+    content = b"0123456789" * 500
+    with open(path, "wb") as file:
+        file.write(content)
+
+    app = Years(middleware=[Middleware(CompressionMiddleware, encodings=["gzip"])])
+
+    @app.get("/file")
+    async def file(request):
+        return FileResponse(path)
+
+    client = TestClient(app)
+    headers = {"accept-encoding": "gzip", "range": "bytes=0-99"}
+    response = await client.get("/file", headers=headers)
+    assert response.status_code == 206
+    assert response.headers["content-range"] == "bytes 0-99/5000"
+    assert "content-encoding" not in response.headers
+    assert response.content == content[:100]
+
+    headers["range"] = "bytes=0-99, 200-299"
+    response = await client.get("/file", headers=headers)
+    assert response.status_code == 206
+    assert "content-encoding" not in response.headers
+
+    headers["range"] = "bytes=9000-"
+    response = await client.get("/file", headers=headers)
+    assert response.status_code == 416
+    assert "content-encoding" not in response.headers
+
+    # 完整的响应照常压缩，但不再声明支持范围请求
+    response = await client.get("/file", headers={"accept-encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert "accept-ranges" not in response.headers
+    assert response.content == content
@@ -0,0 +1,60 @@
+import pytest
+import asyncio
+import threading
+import contextvars
+
+from years.concurrency import BoundedExecutor, ExecutorSaturated
+
+
+@pytest.mark.asyncio
+async def test_bounded_executor_run():
+    executor = BoundedExecutor(max_workers=2, name="test")
+    var = contextvars.ContextVar("var")
+    var.set("caller")
+
+    def work(a, b=0):
+        return a + b, var.get(), threading.current_thread().name
+
+    total, value, thread = await executor.run(work, 1, b=2)
+    assert total == 3
+    # 和 asyncio.to_thread 一样带着调用方的 contextvars
+    assert value == "caller"
+    assert thread.startswith("test")
+
+    stats = executor.stats()
+    assert stats["completed"] == 1
+    assert stats["active"] == 0
+    assert stats["queue_depth"] == 0
+    executor.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_bounded_executor_saturated():
+    executor = BoundedExecutor(max_workers=1, max_queue=1)
+    release = threading.Event()
+    started = threading.Event()
+
+    def block():
+        started.set()
+        release.wait()
+
+    first = asyncio.ensure_future(executor.run(block))
+    await asyncio.to_thread(started.wait)
+    second = asyncio.ensure_future(executor.run(block))
+    await asyncio.sleep(0)
+
+    stats = executor.stats()
+    assert stats["active"] == 1
+    assert stats["queue_depth"] == 1
+
+    with pytest.raises(ExecutorSaturated):
+        await executor.run(block)
+    assert executor.stats()["rejected"] == 1
+
+    release.set()
+    await asyncio.gather(first, second)
+    stats = executor.stats()
+    assert stats["completed"] == 2
+    assert stats["queue_depth"] == 0
+    assert stats["max_wait"] > 0
+    executor.shutdown()
@@ -1,4 +1,10 @@
-from years.datastructures import URL, Headers, MutableHeaders, QueryParams
+from years.datastructures import (
+    URL,
+    Headers,
+    MutableHeaders,
+    QueryParams,
+    choose_encoding,
+)
 
 
 def test_url():
@@ -112,11 +118,34 @@ def test_mutable_headers():
     assert h.raw == [(b"b", b"4")]
 
 
+def test_mutable_headers_index():
+    h = MutableHeaders(raw=[(b"A", b"1"), (b"b", b"2"), (b"a", b"3")])
+    assert h.getlist("a") == ["1", "3"]
+
+    h["a"] = "4"
+    assert h.raw == [(b"a", b"4"), (b"b", b"2")]
+    assert h.getlist("a") == ["4"]
+
+    h.append("c", "5")
+    h.append("c", "6")
+    assert h.getlist("c") == ["5", "6"]
+    assert h.setdefault("c", "7") == "5"
+
+    del h["C"]
+    del h["missing"]
+    assert "c" not in h
+    assert h.raw == [(b"a", b"4"), (b"b", b"2")]
+    # 就地维护的索引和重新建立的索引一致
+    assert h.index == Headers(raw=list(h.raw)).index
+
+
 def test_headers_mutablecopy():
     h = Headers(raw=[(b"a", b"123"), (b"a", b"456"), (b"b", b"789")])
     c = h.mutablecopy()
     assert c.items() == [("a", "123"), ("a", "456"), ("b", "789")]
     c["a"] = "abc"
+    assert h["a"] == "123"
+    assert c["a"] == "abc"
 
 
 def test_queryparams():
@@ -150,3 +179,13 @@ def test_queryparams():
 
     q = QueryParams([("a", "123"), ("a", "456")])
     assert QueryParams(q) == q
+
+
+def test_choose_encoding():
+    assert choose_encoding("gzip, br", ["br", "gzip"]) == "br"
+    assert choose_encoding("GZIP ; q=0.5", ["br", "gzip"]) == "gzip"
+    assert choose_encoding("br;q=0, gzip", ["br", "gzip"]) == "gzip"
+    assert choose_encoding("*", ["br", "gzip"]) == "br"
+    assert choose_encoding("gzip;q=0, *", ["gzip"]) is None
+    assert choose_encoding("identity", ["gzip"]) is None
+    assert choose_encoding("", ["gzip"]) is None
@@ -0,0 +1,118 @@
+import pytest
+
+from years.datastructures import Headers, UploadFile
+from years.formparsers import MultiPartException, MultiPartParser
+from years.requests import Request
+from years.responses import JSONResponse
+from years.routing import Route, Router
+from years.testclient import TestClient
+
+
+async def form_app(scope, receive, send):
+    request = Request(scope, receive)
+    form = await request.form()
+    data = {}
+    for key, value in form.items():
+        if isinstance(value, UploadFile):
+            content = await value.read()
+            data[key] = {
+                "filename": value.filename,
+                "content": content.decode(),
+                "content_type": value.content_type,
+            }
+        else:
+            data[key] = value
+    await form.close()
+    response = JSONResponse(data)
+    await response(scope, receive, send)
+
+
+@pytest.mark.asyncio
+async def test_multipart_form():
+    client = TestClient(form_app)
+    response = await client.post(
+        "/",
+        data={"abc": "123 @", "name": "中文"},
+        files={"file": ("test.txt", b"<file content>", "text/plain")},
+    )
+    assert response.json() == {
+        "abc": "123 @",
+        "name": "中文",
+        "file": {
+            "filename": "test.txt",
+            "content": "<file content>",
+            "content_type": "text/plain",
+        },
+    }
+
+
+def multipart_body(boundary: bytes, parts: list[tuple[str, bytes, str | None]]):
+    body = b""
+    for name, content, filename in parts:
+        body += b"--" + boundary + b"\r\n"
+        disposition = f'Content-Disposition: form-data; name="{name}"'
+        if filename is not None:
+            disposition += f'; filename="{filename}"'
+        body += disposition.encode() + b"\r\n\r\n" + content + b"\r\n"
+    return body + b"--" + boundary + b"--\r\n"
+
+
+def parser_for(body: bytes, chunk_size: int, **limits):
+    headers = Headers({"content-type": "multipart/form-data; boundary=xyz"})
+
+    async def stream():
+        for idx in range(0, len(body), chunk_size):
+            yield body[idx : idx + chunk_size]
+
+    return MultiPartParser(headers, stream(), **limits)
+
+
+@pytest.mark.asyncio
+async def test_multipart_parser_small_chunks():
+    content = b"\r\n--xy" * 1000
+    body = multipart_body(b"xyz", [("a", b"1", None), ("f", content, "f.bin")])
+
+    # 每次只给一个字节，分隔符会被切在任意位置
+    parser = parser_for(body, chunk_size=1, spool_max_size=100)
+    items = [item async for item in parser.parse()]
+    assert items[0] == ("a", "1")
+    name, upload = items[1]
+    assert name == "f"
+    assert not upload.in_memory
+    assert upload.size == len(content)
+    assert await upload.read() == content
+    await upload.close()
+
+
+@pytest.mark.asyncio
+async def test_multipart_parser_limits():
+    body = multipart_body(b"xyz", [("a", b"1", None), ("b", b"2" * 10, None)])
+
+    with pytest.raises(MultiPartException):
+        [item async for item in parser_for(body, 7, max_parts=1).parse()]
+
+    with pytest.raises(MultiPartException):
+        [item async for item in parser_for(body, 7, max_field_size=5).parse()]
+
+    with pytest.raises(MultiPartException):
+        [item async for item in parser_for(body, 7, max_size=20).parse()]
+
+    with pytest.raises(MultiPartException):
+        [item async for item in parser_for(body[:-10], 7).parse()]
+
+
+@pytest.mark.asyncio
+async def test_multipart_bad_request():
+    async def endpoint(request):
+        await request.form(max_parts=1)
+
+    router = Router([Route("/", endpoint=endpoint, methods=["POST"])])
+    client = TestClient(router)
+    response = await client.post("/", data={"a": "1"}, files={"f": ("f.txt", b"x")})
+    assert response.status_code == 400
+
+    # 普通字段不是合法的 UTF-8 时同样返回 400
+    body = multipart_body(b"xyz", [("a", b"\xff\xfe", None)])
+    headers = {"content-type": "multipart/form-data; boundary=xyz"}
+    response = await client.post("/", content=body, headers=headers)
+    assert response.status_code == 400
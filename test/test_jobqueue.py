@@ -0,0 +1,287 @@
+import pytest
+import asyncio
+import sqlite3
+
+from years import Years
+from years.jobqueue import DurableBackgroundTasks, JobQueue
+from years.responses import PlainTextResponse
+from years.testclient import TestClient
+
+
+async def wait_for_status(queue: JobQueue, status: str, count: int):
+    for _ in range(500):
+        if (await queue.stats())[status] >= count:
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError(await queue.stats())
+
+
+@pytest.mark.asyncio
+async def test_enqueue_batches_and_runs(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"), fsync=False, poll_interval=0.01)
+    done = []
+
+    @queue.task
+    async def send_email(address, subject=""):
+        done.append((address, subject))
+
+    @queue.task(name="sync-job")
+    def sync_job(n):
+        done.append(n)
+
+    ids = await asyncio.gather(
+        *(queue.enqueue(send_email, f"{i}@x.com", subject="hi") for i in range(50))
+    )
+    assert len(set(ids)) == 50
+    await queue.enqueue("sync-job", 7)
+
+    async with queue:
+        await wait_for_status(queue, "done", 51)
+    assert ("0@x.com", "hi") in done and 7 in done
+    assert (await queue.stats())["pending"] == 0
+
+
+@pytest.mark.asyncio
+async def test_idempotency_key(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"), fsync=False)
+
+    @queue.task
+    async def webhook(url):
+        pass
+
+    first = await queue.enqueue(webhook, "a", idempotency_key="order-1")
+    again = await queue.enqueue(webhook, "b", idempotency_key="order-1")
+    other = await queue.enqueue(webhook, "c", idempotency_key="order-2")
+    assert first == again != other
+    assert (await queue.stats())["pending"] == 2
+    await queue.stop()
+
+
+@pytest.mark.asyncio
+async def test_retry_with_backoff(tmp_path):
+    queue = JobQueue(
+        str(tmp_path / "jobs.db"),
+        fsync=False,
+        max_attempts=3,
+        backoff=0.01,
+        poll_interval=0.01,
+    )
+    attempts = []
+
+    @queue.task
+    async def flaky():
+        attempts.append(1)
+        if len(attempts) < 2:
+            raise RuntimeError("try again")
+
+    @queue.task
+    async def broken():
+        raise RuntimeError("never works")
+
+    await queue.enqueue(flaky)
+    await queue.enqueue(broken)
+    async with queue:
+        await wait_for_status(queue, "failed", 1)
+        await wait_for_status(queue, "done", 1)
+    assert len(attempts) == 2
+
+
+@pytest.mark.asyncio
+async def test_survives_restart(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    queue = JobQueue(path, poll_interval=0.01)
+
+    @queue.task(name="job")
+    async def job(n):
+        pass
+
+    await queue.enqueue(job, 1)
+    await queue.stop()
+
+    done = []
+    restarted = JobQueue(path, poll_interval=0.01)
+
+    @restarted.task(name="job")
+    async def job_again(n):
+        done.append(n)
+
+    async with restarted:
+        await wait_for_status(restarted, "done", 1)
+    assert done == [1]
+
+
+@pytest.mark.asyncio
+async def test_recover_only_expired_claims(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    queue = JobQueue(path, fsync=False, lease=30)
+
+    @queue.task(name="job")
+    async def job(n):
+        pass
+
+    await queue.enqueue(job, 1)
+    await queue.enqueue(job, 2)
+    first = await queue.db(queue.claim)
+    second = await queue.db(queue.claim)
+    assert first.args == [1] and second.args == [2]
+
+    # 另一个进程启动时不能把还在租约内的任务放回队列
+    sibling = JobQueue(path, fsync=False, lease=30)
+    assert await sibling.db(sibling.recover) == 0
+    assert await sibling.db(sibling.claim) is None
+
+    # 第一个任务的进程已经退出，租约过期之后可以重新领取
+    queue.connection.execute(
+        "UPDATE jobs SET claimed_at = claimed_at - 60 WHERE id = ?", (first.id,)
+    )
+    await queue.db(queue.renew, second)
+    reclaimed = await sibling.db(sibling.claim)
+    assert reclaimed.id == first.id and reclaimed.attempts == 2
+    assert await sibling.db(sibling.claim) is None
+
+    # 原来的实例不能再改写已经被重新领取的任务
+    await queue.db(queue.complete, first)
+    await queue.db(queue.fail, first, "late")
+    assert await sibling.stats() == {"pending": 0, "running": 2, "done": 0, "failed": 0}
+    await sibling.db(sibling.complete, reclaimed)
+    assert (await sibling.stats())["done"] == 1
+    await sibling.stop()
+    await queue.stop()
+
+
+@pytest.mark.asyncio
+async def test_worker_survives_database_errors(tmp_path, caplog):
+    queue = JobQueue(str(tmp_path / "jobs.db"), fsync=False, poll_interval=0.01)
+    done = []
+
+    @queue.task
+    async def record(n):
+        done.append(n)
+
+    claim = queue.claim
+    failures = [sqlite3.OperationalError("database is locked")] * 2
+
+    def flaky_claim():
+        if failures:
+            raise failures.pop()
+        return claim()
+
+    queue.claim = flaky_claim
+    await queue.enqueue(record, 1)
+    async with queue:
+        await wait_for_status(queue, "done", 1)
+    assert done == [1]
+    assert "database is locked" in caplog.text
+
+
+@pytest.mark.asyncio
+async def test_stop_releases_running_jobs(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"), fsync=False, poll_interval=0.01)
+
+    @queue.task
+    async def slow():
+        await asyncio.sleep(10)
+
+    await queue.enqueue(slow)
+    await queue.start(workers=1)
+    await wait_for_status(queue, "running", 1)
+    await queue.stop(timeout=0.01)
+    assert (await queue.stats())["pending"] == 1
+    await queue.stop()
+
+
+@pytest.mark.asyncio
+async def test_app_job_queue_lifespan(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"), fsync=False, poll_interval=0.01)
+    app = Years(job_queue=queue)
+    assert queue.executor is app.background_executor
+    done = []
+
+    @queue.task
+    def record(n):
+        done.append(n)
+
+    @app.post("/jobs")
+    async def create(request):
+        job_id = await queue.enqueue(record, 1)
+        return PlainTextResponse(str(job_id))
+
+    messages = [{"type": "lifespan.startup"}]
+
+    async def receive():
+        while not messages:
+            await asyncio.sleep(0.01)
+        return messages.pop(0)
+
+    async def send(message):
+        pass
+
+    lifespan = asyncio.ensure_future(app({"type": "lifespan"}, receive, send))
+    assert (await TestClient(app).post("/jobs")).text == "1"
+    await wait_for_status(queue, "done", 1)
+    messages.append({"type": "lifespan.shutdown"})
+    await lifespan
+    assert done == [1]
+    assert queue.workers == []
+
+
+@pytest.mark.asyncio
+async def test_purge_finished_jobs(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"), fsync=False, poll_interval=0.01)
+
+    @queue.task(name="job")
+    async def job(n):
+        if n == 2:
+            raise RuntimeError("broken")
+
+    queue.max_attempts = 1
+    for n in range(3):
+        await queue.enqueue(job, n, idempotency_key=f"job-{n}")
+    async with queue:
+        await wait_for_status(queue, "done", 2)
+        await wait_for_status(queue, "failed", 1)
+
+    # 还在保留时间之内的任务不删除
+    assert await queue.db(queue.purge, 60) == 0
+    await queue.enqueue(job, 3, delay=3600)
+    assert await queue.db(queue.purge, 0) == 3
+    assert await queue.stats() == {"pending": 1, "running": 0, "done": 0, "failed": 0}
+
+    # 删除之后同样的 idempotency_key 可以再次入队
+    assert await queue.enqueue(job, 0, idempotency_key="job-0") == 5
+    await queue.stop()
+
+
+@pytest.mark.asyncio
+async def test_durable_background_tasks(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    queue = JobQueue(path, fsync=False, poll_interval=0.01)
+    app = Years()
+
+    @queue.task(name="notify")
+    def notify(user, channel="email"):
+        pass
+
+    @app.post("/signup")
+    async def signup(request):
+        tasks = DurableBackgroundTasks(queue, notify, "alice")
+        tasks.add_task(notify, "alice", channel="sms")
+        return PlainTextResponse("ok", background=tasks)
+
+    assert (await TestClient(app).post("/signup")).text == "ok"
+    await app.background_runner.drain()
+    # 响应结束之后任务已经写进数据库，不依赖当前进程
+    assert (await queue.stats())["pending"] == 2
+    await queue.stop()
+
+    done = []
+    restarted = JobQueue(path, fsync=False, poll_interval=0.01)
+
+    @restarted.task(name="notify")
+    def notify_again(user, channel="email"):
+        done.append((user, channel))
+
+    async with restarted:
+        await wait_for_status(restarted, "done", 2)
+    assert sorted(done) == [("alice", "email"), ("alice", "sms")]
+
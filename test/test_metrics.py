@@ -0,0 +1,118 @@
+import pytest
+
+from years import Years
+from years.exceptions import HTTPException
+from years.metrics import Histogram, Metrics, MetricsApp, log_linear_bounds
+from years.responses import PlainTextResponse
+from years.routing import Mount, Route, Router
+from years.testclient import TestClient
+
+
+def test_histogram():
+    bounds = log_linear_bounds(lowest=1, highest=8, sub_buckets=2)
+    assert bounds == (1.5, 2.0, 3.0, 4.0, 6.0, 8.0)
+
+    histogram = Histogram(bounds)
+    for value in (1, 2, 2, 5, 100):
+        histogram.observe(value)
+    assert histogram.counts == [1, 2, 0, 0, 1, 0, 1]
+    assert histogram.count == 5 and histogram.sum == 110
+    assert histogram.quantile(0.5) == 2.0
+    assert histogram.quantile(1) == float("inf")
+
+
+@pytest.mark.asyncio
+async def test_route_metrics():
+    metrics = Metrics()
+
+    async def user(request):
+        return PlainTextResponse("user " + request.path_params["id"])
+
+    def forbidden(request):
+        raise HTTPException(403, "forbidden")
+
+    app = Years(
+        router=Router([Mount("/api", routes=[Route("/users/{id}", endpoint=user)])]),
+        metrics=metrics,
+    )
+    app.route("/forbidden")(forbidden)
+    app.mount("/metrics", MetricsApp(metrics))
+
+    client = TestClient(app)
+    for idx in range(3):
+        assert (await client.get(f"/api/users/{idx}")).text == f"user {idx}"
+    assert (await client.post("/api/users/1")).status_code == 405
+    assert (await client.get("/nothing")).status_code == 404
+    assert (await client.get("/forbidden")).status_code == 403
+
+    route = metrics.routes["/api/users/{id}"]
+    assert route.statuses == {"GET": {200: 3}}
+    assert route.match.count == route.handler.count == route.send.count == 3
+    assert route.in_flight == 0 and metrics.in_flight == 0
+    assert metrics.routes["/api<unmatched>"].statuses == {"POST": {405: 1}}
+    assert metrics.routes["<unmatched>"].statuses == {"GET": {404: 1}}
+    assert metrics.routes["/forbidden"].statuses == {"GET": {403: 1}}
+    assert metrics.routes["/metrics"].statuses == {}
+
+    response = await client.get("/metrics")
+    # 挂载的 ASGI 应用记在挂载前缀下面
+    mounted = metrics.routes["/metrics"]
+    assert mounted.statuses == {"GET": {200: 1}}
+    assert mounted.match.count == mounted.handler.count == 1
+    assert mounted.in_flight == 0 and metrics.in_flight == 0
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = response.text
+    assert (
+        'years_requests_total{route="/api/users/{id}",method="GET",status="200"} 3'
+        in text
+    )
+    assert (
+        'years_request_phase_seconds_bucket{route="/api/users/{id}",'
+        'phase="handler",le="+Inf"} 3' in text
+    )
+    count = 'years_request_phase_seconds_count{route="/forbidden",phase="match"} 1'
+    assert count in text
+    assert "# TYPE years_executor_active gauge" in text
+    assert 'years_executor_active{executor="endpoint"}' in text
+    assert "# TYPE years_executor_completed_total counter" in text
+    assert 'years_executor_rejected_total{executor="background"} 0' in text
+    assert "years_executor_completed " not in text
+    assert "years_background_tasks 0" in text
+
+
+@pytest.mark.asyncio
+async def test_metrics_disabled():
+    async def homepage(request):
+        return PlainTextResponse("ok")
+
+    app = Years(router=Router([Route("/", endpoint=homepage)]))
+    assert (await TestClient(app).get("/")).text == "ok"
+    assert app.router.metrics is None
+    assert app.router.routes[0].instrumented is None
+
+
+@pytest.mark.asyncio
+async def test_metrics_count_once_on_send_error():
+    class BrokenResponse(PlainTextResponse):
+        async def __call__(self, scope, receive, send):
+            raise ConnectionResetError("client went away")
+
+    metrics = Metrics()
+    app = Years(metrics=metrics)
+
+    @app.get("/broken")
+    async def broken(request):
+        return BrokenResponse("never sent")
+
+    async def send(message):
+        pass
+
+    scope = {"type": "http", "method": "GET", "path": "/broken", "headers": []}
+    with pytest.raises(ConnectionResetError):
+        await app(scope, None, send)
+    assert metrics.routes["/broken"].statuses == {"GET": {200: 1}}
+
+    text = metrics.render()
+    assert "years_app_requests_in_flight 0" in text
+    assert 'years_requests_in_flight{route="/broken"} 0' in text
+    assert "years_requests_in_flight 0" not in text
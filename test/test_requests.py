@@ -1,8 +1,8 @@
 import pytest
 
-from years import Request, JSONResponse
+from years import Years, Request, JSONResponse
 from years.testclient import TestClient
-from years.requests import ClientDisconnect
+from years.requests import ClientDisconnect, WebSocket, WebSocketDisconnect
 from years.responses import Response
 
 
@@ -246,3 +246,148 @@ async def test_chunked_encoding():
 
     assert response.status_code == 200
     assert response.json() == {"body": "foobar"}
+
+
+@pytest.mark.asyncio
+async def test_request_max_body_size():
+    app = Years(max_body_size=10)
+
+    @app.post("/")
+    async def default_limit(request):
+        body = await request.body()
+        return Response(body, media_type="text/plain")
+
+    @app.post("/large", max_body_size=100)
+    async def route_limit(request):
+        body = await request.body()
+        return Response(body, media_type="text/plain")
+
+    client = TestClient(app)
+    response = await client.post("/", content="0123456789")
+    assert response.status_code == 200
+
+    response = await client.post("/", content="0123456789a")
+    assert response.status_code == 413
+
+    response = await client.post("/large", content="x" * 100)
+    assert response.status_code == 200
+
+    # 分块上传没有 Content-Length，按已经收到的字节数判断
+    async def chunks():
+        for _ in range(20):
+            yield b"0123456789"
+
+    response = await client.post("/large", content=chunks())
+    assert response.status_code == 413
+
+
+@pytest.mark.asyncio
+async def test_request_spooled_body():
+    async def app(scope, receive, send):
+        request = Request(scope, receive)
+        file = await request.spooled_body(max_memory=16)
+        rolled = file._rolled
+        body = await request.body()
+        response = JSONResponse({"body": body.decode(), "rolled": rolled})
+        await response(scope, receive, send)
+
+    client = TestClient(app)
+
+    async def chunks():
+        for idx in range(10):
+            yield str(idx).encode() * 4
+
+    response = await client.post("/", content=chunks())
+    assert response.json() == {
+        "body": "".join(str(idx) * 4 for idx in range(10)),
+        "rolled": True,
+    }
+
+
+async def run_websocket(app, incoming, path="/ws"):
+    """按顺序把 incoming 里的消息交给应用，返回应用发出的所有消息"""
+    scope = {
+        "type": "websocket",
+        "path": path,
+        "query_string": b"",
+        "headers": [],
+    }
+    incoming = list(incoming)
+    sent = []
+
+    async def receive():
+        return incoming.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    await app(scope, receive, send)
+    return sent
+
+
+@pytest.mark.asyncio
+async def test_websocket_text_and_bytes():
+    async def app(scope, receive, send):
+        websocket = WebSocket(scope, receive, send)
+        await websocket.accept(subprotocol="chat")
+        text = await websocket.receive_text()
+        data = await websocket.receive_bytes()
+        await websocket.send_text(text.upper())
+        await websocket.send_bytes(data[::-1])
+        await websocket.send_json({"n": 1})
+        await websocket.close(code=1001)
+
+    sent = await run_websocket(
+        app,
+        [
+            {"type": "websocket.connect"},
+            {"type": "websocket.receive", "text": "hi"},
+            {"type": "websocket.receive", "bytes": b"abc"},
+        ],
+    )
+    assert sent == [
+        {"type": "websocket.accept", "subprotocol": "chat"},
+        {"type": "websocket.send", "text": "HI"},
+        {"type": "websocket.send", "bytes": b"cba"},
+        {"type": "websocket.send", "text": '{"n":1}'},
+        {"type": "websocket.close", "code": 1001, "reason": ""},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_websocket_iterate_until_disconnect():
+    received = []
+
+    async def app(scope, receive, send):
+        websocket = WebSocket(scope, receive, send)
+        await websocket.accept()
+        async for message in websocket:
+            received.append(message)
+        with pytest.raises(RuntimeError):
+            await websocket.receive()
+
+    await run_websocket(
+        app,
+        [
+            {"type": "websocket.connect"},
+            {"type": "websocket.receive", "text": "a"},
+            {"type": "websocket.receive", "bytes": b"b"},
+            {"type": "websocket.disconnect", "code": 1000},
+        ],
+    )
+    assert received == ["a", b"b"]
+
+
+@pytest.mark.asyncio
+async def test_websocket_disconnect_raises():
+    async def app(scope, receive, send):
+        websocket = WebSocket(scope, receive, send)
+        await websocket.accept()
+        with pytest.raises(WebSocketDisconnect) as exc:
+            await websocket.receive_text()
+        assert exc.value.code == 1006
+
+    await run_websocket(
+        app,
+        [{"type": "websocket.connect"}, {"type": "websocket.disconnect", "code": 1006}],
+    )
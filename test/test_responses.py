@@ -1,9 +1,18 @@
 import os
 import pytest
 import asyncio
+import hashlib
 
 from years.testclient import TestClient
-from years.responses import Response, StreamingResponse, FileResponse
+from years.responses import (
+    Response,
+    JSONResponse,
+    PlainTextResponse,
+    StreamingResponse,
+    FileResponse,
+    FileMetadataCache,
+    parse_range_header,
+)
 from years.background import BackgroundTask
 from years.requests import Request
 
@@ -204,3 +213,363 @@ async def test_head_method():
     client = TestClient(app)
     response = await client.head("/")
     assert response.text == ""
+
+
+@pytest.mark.asyncio
+async def test_file_response_chunks(tmpdir):
+    path = os.path.join(tmpdir, "xyz.txt")
+    content = b"0123456789" * 10
+    with open(path, "wb") as file:
+        file.write(content)
+
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    response = FileResponse(path=path, chunk_size=32)
+    await response({"type": "http", "method": "GET"}, None, send)
+
+    start, *bodies = messages
+    assert dict(start["headers"])[b"content-length"] == b"100"
+    assert dict(start["headers"])[b"content-type"] == b"text/plain"
+    assert [len(message["body"]) for message in bodies] == [32, 32, 32, 4]
+    assert [message["more_body"] for message in bodies] == [True, True, True, False]
+    assert b"".join(message["body"] for message in bodies) == content
+
+
+@pytest.mark.asyncio
+async def test_file_response_truncated(tmpdir):
+    path = os.path.join(tmpdir, "xyz.txt")
+    with open(path, "wb") as file:
+        file.write(b"0123456789" * 10000)
+
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+        # 发送过程中文件被截短
+        if message.get("more_body"):
+            with open(path, "r+b") as file:
+                file.truncate(40000)
+
+    response = FileResponse(path=path, chunk_size=32 * 1024)
+    await response({"type": "http", "method": "GET"}, None, send)
+    assert messages[-1] == {"type": "http.response.body", "body": b""}
+    assert sum(len(message.get("body", b"")) for message in messages) == 40000
+
+
+@pytest.mark.asyncio
+async def test_file_response_pathsend(tmpdir):
+    path = os.path.join(tmpdir, "xyz")
+    with open(path, "wb") as file:
+        file.write(b"<file content>")
+
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {"type": "http", "method": "GET", "extensions": {"http.response.pathsend": {}}}
+    await FileResponse(path=path, filename="xyz.txt")(scope, None, send)
+    assert messages[1] == {"type": "http.response.pathsend", "path": path}
+
+    messages.clear()
+    scope["extensions"] = {"http.response.zerocopy": {}}
+    await FileResponse(path=path, filename="xyz.txt")(scope, None, send)
+    assert messages[1]["type"] == "http.response.zerocopy"
+    assert messages[1]["file"].name == path
+
+
+@pytest.mark.asyncio
+async def test_file_response_etag(tmpdir):
+    path = os.path.join(tmpdir, "xyz.txt")
+    with open(path, "wb") as file:
+        file.write(b"<file content>")
+
+    client = TestClient(FileResponse(path=path))
+    response = await client.get("/")
+    assert response.headers["etag"].startswith('W/"')
+    assert response.headers["content-type"] == "text/plain"
+
+    client = TestClient(FileResponse(path=path, strong_etag=True))
+    response = await client.get("/")
+    assert response.headers["etag"] == '"%s"' % hashlib.md5(b"<file content>").hexdigest()
+
+
+@pytest.mark.asyncio
+async def test_file_metadata_cache(tmpdir):
+    cache = FileMetadataCache(maxsize=2)
+    paths = []
+    for name in ("a.txt", "b.txt", "c.txt"):
+        path = os.path.join(tmpdir, name)
+        with open(path, "wb") as file:
+            file.write(b"abc")
+        paths.append(path)
+
+    first = await cache.get(paths[0])
+    assert await cache.get(paths[0]) is first
+
+    # 修改时间变了之后重新计算
+    os.utime(paths[0], ns=(0, 1_000_000_000))
+    second = await cache.get(paths[0])
+    assert second is not first
+    assert second.etag != first.etag
+
+    await cache.get(paths[1])
+    await cache.get(paths[2])
+    assert len(cache) == 2
+    assert await cache.get(paths[2]) is await cache.get(paths[2])
+
+
+@pytest.mark.asyncio
+async def test_file_response_not_modified(tmpdir):
+    path = os.path.join(tmpdir, "xyz.txt")
+    with open(path, "wb") as file:
+        file.write(b"<file content>")
+
+    client = TestClient(FileResponse(path=path))
+    response = await client.get("/")
+    etag = response.headers["etag"]
+    last_modified = response.headers["last-modified"]
+
+    response = await client.get("/", headers={"if-none-match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+    assert "content-length" not in response.headers
+
+    response = await client.get("/", headers={"if-none-match": '"other", ' + etag})
+    assert response.status_code == 304
+
+    response = await client.get("/", headers={"if-none-match": '"other"'})
+    assert response.status_code == 200
+    assert response.content == b"<file content>"
+
+    response = await client.get("/", headers={"if-modified-since": last_modified})
+    assert response.status_code == 304
+
+    response = await client.get(
+        "/", headers={"if-modified-since": "Thu, 01 Jan 1970 00:00:00 GMT"}
+    )
+    assert response.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_response_not_modified():
+    app = Response("hello", media_type="text/plain", headers={"etag": '"v1"'})
+    client = TestClient(app)
+
+    response = await client.get("/", headers={"if-none-match": 'W/"v1"'})
+    assert response.status_code == 304
+    assert response.content == b""
+
+    response = await client.post("/", headers={"if-none-match": '"v1"'})
+    assert response.status_code == 200
+    assert response.text == "hello"
+
+
+@pytest.mark.asyncio
+async def test_file_response_range(tmpdir):
+    path = os.path.join(tmpdir, "xyz.txt")
+    content = bytes(range(256)) * 4
+    with open(path, "wb") as file:
+        file.write(content)
+
+    client = TestClient(FileResponse(path=path, chunk_size=100))
+    response = await client.get("/")
+    assert response.headers["accept-ranges"] == "bytes"
+
+    response = await client.get("/", headers={"range": "bytes=10-309"})
+    assert response.status_code == 206
+    assert response.content == content[10:310]
+    assert response.headers["content-range"] == "bytes 10-309/1024"
+    assert response.headers["content-length"] == "300"
+
+    response = await client.get("/", headers={"range": "bytes=-24"})
+    assert response.status_code == 206
+    assert response.content == content[-24:]
+
+    response = await client.get("/", headers={"range": "bytes=1000-"})
+    assert response.content == content[1000:]
+
+    response = await client.get("/", headers={"range": "bytes=2000-3000"})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == "bytes */1024"
+
+    # 格式不对时忽略 Range
+    response = await client.get("/", headers={"range": "lines=1-2"})
+    assert response.status_code == 200
+    assert response.content == content
+
+    # If-Range 对不上时发送整个文件
+    headers = {"range": "bytes=0-9", "if-range": '"stale"'}
+    response = await client.get("/", headers=headers)
+    assert response.status_code == 200
+    assert response.content == content
+
+    # 默认的 ETag 是弱 ETag，If-Range 不能使用弱比较
+    headers["if-range"] = response.headers["etag"]
+    assert headers["if-range"].startswith("W/")
+    response = await client.get("/", headers=headers)
+    assert response.status_code == 200
+    assert response.content == content
+
+    headers["if-range"] = response.headers["last-modified"]
+    response = await client.get("/", headers=headers)
+    assert response.status_code == 206
+    assert response.content == content[:10]
+
+    client = TestClient(FileResponse(path=path, strong_etag=True))
+    headers["if-range"] = (await client.get("/")).headers["etag"]
+    response = await client.get("/", headers=headers)
+    assert response.status_code == 206
+    assert response.content == content[:10]
+
+
+@pytest.mark.asyncio
+async def test_file_response_multiple_ranges(tmpdir):
+    path = os.path.join(tmpdir, "xyz.txt")
+    content = b"0123456789" * 10
+    with open(path, "wb") as file:
+        file.write(content)
+
+    client = TestClient(FileResponse(path=path))
+    response = await client.get("/", headers={"range": "bytes=0-4, 3-9, 90-"})
+    assert response.status_code == 206
+    content_type = response.headers["content-type"]
+    assert content_type.startswith("multipart/byteranges; boundary=")
+    assert int(response.headers["content-length"]) == len(response.content)
+
+    boundary = content_type.split("boundary=")[1]
+    parts = response.content.split(f"--{boundary}".encode())
+    assert parts[0] == b"" and parts[-1] == b"--\r\n"
+    assert parts[1].endswith(b"\r\n\r\n0123456789\r\n")
+    assert b"Content-Range: bytes 0-9/100" in parts[1]
+    assert parts[2].endswith(b"\r\n\r\n0123456789\r\n")
+    assert b"Content-Range: bytes 90-99/100" in parts[2]
+
+    # 同一个响应再发送一次，不能带上范围请求改写过的头
+    response = await client.get("/")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "text/plain"
+    assert response.headers["content-length"] == "100"
+    assert "content-range" not in response.headers
+    assert response.content == content
+
+
+def test_parse_range_header():
+    assert parse_range_header("bytes=0-0", 10) == [(0, 1)]
+    assert parse_range_header("bytes=5-", 10) == [(5, 10)]
+    assert parse_range_header("bytes=-3", 10) == [(7, 10)]
+    assert parse_range_header("bytes=0-1,1-2,8-20", 10) == [(0, 3), (8, 10)]
+    assert parse_range_header("bytes=10-", 10) == []
+    assert parse_range_header("bytes=3-1", 10) is None
+    assert parse_range_header("bytes=a-b", 10) is None
+
+
+@pytest.mark.asyncio
+async def test_json_response_bytes():
+    app = JSONResponse({"hello": "世界"})
+    assert isinstance(app.body, bytes)
+
+    client = TestClient(app)
+    response = await client.get("/")
+    assert response.json() == {"hello": "世界"}
+    assert response.headers["content-length"] == str(len(response.content))
+
+
+def test_json_codecs_compatible():
+    pytest.importorskip("orjson")
+    from years.jsoncodec import OrjsonCodec, StdlibJSONCodec
+
+    # 装上 orjson 之后默认的编解码器会换成它，输出要和标准库一致
+    stdlib, fast = StdlibJSONCodec(), OrjsonCodec()
+    for content in [{"hello": "世界"}, {1: "a", True: "b", None: "c"}, [1, 2.5, None]]:
+        assert fast.dumps(content) == stdlib.dumps(content)
+        assert fast.loads(fast.dumps(content)) == stdlib.loads(stdlib.dumps(content))
+    assert JSONResponse({1: "a"}, codec=fast).body == b'{"1":"a"}'
+
+
+@pytest.mark.asyncio
+async def test_response_rendered_once():
+    class CountingResponse(JSONResponse):
+        renders = 0
+
+        def render(self, content):
+            CountingResponse.renders += 1
+            return super().render(content)
+
+    app = CountingResponse({"a": 1})
+    client = TestClient(app)
+    assert (await client.get("/")).json() == {"a": 1}
+    assert (await client.get("/")).json() == {"a": 1}
+    assert CountingResponse.renders == 1
+
+    response = PlainTextResponse("你好")
+    assert response.body == "你好".encode()
+    assert response.headers["content-length"] == "6"
+    assert Response(None).body == b""
+
+
+@pytest.mark.asyncio
+async def test_streaming_response_sync_iterator():
+    def numbers():
+        for i in range(1, 6):
+            yield str(i)
+            if i != 5:
+                yield ", "
+
+    app = StreamingResponse(numbers(), media_type="text/plain", batch_size=3)
+    client = TestClient(app)
+    response = await client.get("/")
+    assert response.text == "1, 2, 3, 4, 5"
+
+    app = StreamingResponse(["a", b"b", "c"], media_type="text/plain")
+    response = await TestClient(app).get("/")
+    assert response.text == "abc"
+
+
+@pytest.mark.asyncio
+async def test_streaming_response_disconnect():
+    produced = 0
+
+    async def forever():
+        nonlocal produced
+        while True:
+            produced += 1
+            yield "x"
+            await asyncio.sleep(0.001)
+
+    disconnected = asyncio.Event()
+
+    async def receive():
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if produced >= 10:
+            disconnected.set()
+
+    response = StreamingResponse(forever(), media_type="text/plain")
+    await asyncio.wait_for(response({"type": "http"}, receive, send), timeout=1)
+    stopped_at = produced
+    await asyncio.sleep(0.02)
+    assert produced == stopped_at
+
+
+@pytest.mark.asyncio
+async def test_streaming_response_coalesce():
+    async def tiny():
+        for _ in range(100):
+            yield "x"
+
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    response = StreamingResponse(tiny(), media_type="text/plain", coalesce_size=30)
+    await response({"type": "http"}, None, send)
+    bodies = [message["body"] for message in messages[1:]]
+    assert [len(body) for body in bodies] == [30, 30, 30, 10]
@@ -1,8 +1,9 @@
 import pytest
 
 from years.responses import Response, PlainTextResponse
-from years.routing import Router, Route, Mount
+from years.routing import Router, Route, Mount, Mathched, WebSocketRoute, compile_path
 from years.testclient import TestClient
+from years.convertors import CONVERTOR_TYPES, Convertor, register_url_convertor
 
 
 def homepage(request):
@@ -122,3 +123,212 @@ async def test_mount_urls():
     assert (await client.get("/users/")).status_code == 200
     assert (await client.get("/users/a")).status_code == 200
     assert (await client.get("/usersa")).status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_router_compile():
+    router = Router(
+        [
+            Route("/items/{id}", endpoint=user, methods=["POST"]),
+            Mount("/nested", routes=[Route("/{username}", endpoint=user)]),
+        ]
+    )
+    tree = router.compile()
+    assert router.tree is tree
+    assert "items" in tree.root.static
+
+    client = TestClient(router)
+    assert (await client.get("/items/1")).status_code == 405
+    assert (await client.get("/items/1/2")).status_code == 404
+    response = await client.get("/nested/abc")
+    assert response.status_code == 200
+    assert response.text == "User abc"
+
+    # 编译之后再添加路由，路由树会被重新编译
+    router.add_route(Route("/late", endpoint=homepage))
+    assert router.tree is None
+    assert (await client.get("/late")).text == "Hello, world"
+
+
+@pytest.mark.asyncio
+async def test_router_registration_order():
+    router = Router(
+        [
+            Route("/{username}", endpoint=user),
+            Route("/me", endpoint=user_me),
+            Route("/user-{username}", endpoint=user_me),
+        ]
+    )
+    client = TestClient(router)
+    # 和线性扫描一样，先注册的参数路由优先于后注册的静态路由
+    assert (await client.get("/me")).text == "User me"
+    assert (await client.get("/user-abc")).text == "User user-abc"
+
+
+def test_route_matches_precompiled():
+    literal = Route("/users/me", endpoint=user_me)
+    assert literal.pattern is None
+    assert literal.normalized == "/users/me/"
+
+    scope = {"type": "http", "method": "GET", "path": "/users/me"}
+    assert literal.matches(scope)[0] is Mathched.FULL
+    assert literal.matches(scope, "/users/me/")[0] is Mathched.FULL
+    assert literal.matches(scope, "/users/you/")[0] is Mathched.NONE
+
+    param = Route("/users/{username}.json", endpoint=user, methods=["POST"])
+    scope = {"type": "http", "method": "GET", "path": "/users/tom.json"}
+    ret, scope = param.matches(scope, "/users/tom.json/")
+    assert ret is Mathched.PARTICAL
+    assert scope["path_params"] == {"username": "tom"}
+    # 路径里的 "." 按字面量处理，不再是正则通配符
+    assert param.matches({"method": "POST"}, "/users/tomxjson/")[0] is Mathched.NONE
+
+
+def test_mount_matches_precompiled():
+    mount = Mount("/users", app=ok)
+    scope = {"type": "http", "path": "/users/a"}
+    ret, scope = mount.matches(scope, "/users/a/")
+    assert ret is Mathched.FULL
+    assert scope["path"] == "a/"
+    assert mount.matches({}, "/usersa/")[0] is Mathched.NONE
+
+    mount = Mount("/sub/{name}", app=ok)
+    ret, scope = mount.matches({"path": "/sub/tom/a"})
+    assert ret is Mathched.FULL
+    assert scope["path"] == "a/"
+
+
+def echo_params(request):
+    return Response(str(request.path_params), media_type="text/plain")
+
+
+@pytest.mark.asyncio
+async def test_path_convertors():
+    router = Router(
+        [
+            Route("/int/{id:int}", endpoint=echo_params),
+            Route("/float/{value:float}", endpoint=echo_params),
+            Route("/uuid/{u:uuid}", endpoint=echo_params),
+            Route("/files/{rest:path}", endpoint=echo_params),
+            Route("/slug/{name:slug}/edit", endpoint=echo_params),
+        ]
+    )
+    client = TestClient(router)
+
+    assert (await client.get("/int/42")).text == "{'id': 42}"
+    assert (await client.get("/int/abc")).status_code == 404
+    assert (await client.get("/float/1.5")).text == "{'value': 1.5}"
+
+    uid = "d2a1c0f6-7b1e-4f9b-9d0c-3b8c6c2f9a11"
+    response = await client.get(f"/uuid/{uid}")
+    assert response.text == f"{{'u': UUID('{uid}')}}"
+    assert (await client.get("/uuid/not-a-uuid")).status_code == 404
+
+    assert (await client.get("/files/a/b/c.txt")).text == "{'rest': 'a/b/c.txt'}"
+    assert (await client.get("/slug/hello-world/edit")).text == "{'name': 'hello-world'}"
+    assert (await client.get("/slug/hello world/edit")).status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_register_url_convertor():
+    class HexConvertor(Convertor):
+        regex = "[0-9a-f]+"
+
+        def convert(self, value: str) -> int:
+            return int(value, 16)
+
+        def to_string(self, value: int) -> str:
+            return format(value, "x")
+
+    register_url_convertor("hex", HexConvertor())
+    try:
+        route = Route("/color/{value:hex}", endpoint=echo_params)
+        scope = {"type": "http", "method": "GET", "path": "/color/ff"}
+        ret, scope = route.matches(scope)
+        assert ret is Mathched.FULL
+        assert scope["path_params"] == {"value": 255}
+
+        client = TestClient(Router([route]))
+        assert (await client.get("/color/zz")).status_code == 404
+    finally:
+        # 转换器是全局注册的，不要影响后面的测试
+        del CONVERTOR_TYPES["hex"]
+        compile_path.cache_clear()
+
+
+@pytest.mark.asyncio
+async def test_websocket_route():
+    async def echo(websocket):
+        await websocket.accept()
+        async for message in websocket:
+            await websocket.send_text(websocket.path_params["name"] + ":" + message)
+
+    router = Router(
+        [
+            Route("/ws/{name}", endpoint=homepage),
+            WebSocketRoute("/ws/{name}", endpoint=echo),
+        ]
+    )
+
+    async def session(path, incoming):
+        scope = {"type": "websocket", "path": path, "query_string": b"", "headers": []}
+        sent = []
+
+        async def receive():
+            return incoming.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        await router(scope, receive, send)
+        return sent
+
+    sent = await session(
+        "/ws/tom",
+        [
+            {"type": "websocket.connect"},
+            {"type": "websocket.receive", "text": "hi"},
+            {"type": "websocket.disconnect", "code": 1000},
+        ],
+    )
+    assert sent == [
+        {"type": "websocket.accept", "subprotocol": None},
+        {"type": "websocket.send", "text": "tom:hi"},
+    ]
+
+    # 同一路径上的 HTTP 路由不受影响，也不会因为 WebSocket 路由得到 405
+    client = TestClient(router)
+    assert (await client.get("/ws/tom")).text == "Hello, world"
+    assert (await client.post("/ws/tom")).status_code == 405
+
+    sent = await session("/nothing", [{"type": "websocket.connect"}])
+    assert sent == [{"type": "websocket.close", "code": 1000, "reason": ""}]
+
+
+@pytest.mark.asyncio
+async def test_endpoint_dispatch_resolved_once():
+    created = []
+
+    class Counter:
+        def __init__(self):
+            created.append(self)
+            self.calls = 0
+
+        async def __call__(self, request):
+            self.calls += 1
+            return PlainTextResponse(str(self.calls))
+
+    class SyncView:
+        def __call__(self, request):
+            return PlainTextResponse("sync view")
+
+    route = Route("/count", endpoint=Counter, methods=["GET", "POST"])
+    assert route.methods == frozenset({"GET", "POST"})
+    assert len(created) == 1
+
+    router = Router([route, Route("/view", endpoint=SyncView())])
+    client = TestClient(router)
+    assert (await client.get("/count")).text == "1"
+    assert (await client.post("/count")).text == "2"
+    assert len(created) == 1
+    assert (await client.get("/view")).text == "sync view"
@@ -0,0 +1,213 @@
+import time
+import pytest
+import asyncio
+import threading
+
+from years import Years
+from years.background import BackgroundTask
+from years.concurrency import BoundedExecutor
+from years.metrics import Metrics
+from years.responses import PlainTextResponse, StreamingResponse
+from years.singleflight import SingleFlight, singleflight
+from years.testclient import TestClient
+
+
+@pytest.mark.asyncio
+async def test_singleflight_group():
+    group = SingleFlight()
+    calls = []
+
+    async def load(value):
+        calls.append(value)
+        await asyncio.sleep(0.01)
+        return value * 2
+
+    results = await asyncio.gather(*(group.do("k", load, 21) for _ in range(10)))
+    assert [result for result, _ in results] == [42] * 10
+    assert [shared for _, shared in results].count(False) == 1
+    assert calls == [21]
+    assert group.stats() == {
+        "inflight": 0,
+        "executed": 1,
+        "coalesced": 9,
+        "errors": 0,
+        "timeouts": 0,
+    }
+
+
+@pytest.mark.asyncio
+async def test_singleflight_exception_and_timeout():
+    group = SingleFlight()
+
+    async def broken():
+        await asyncio.sleep(0.01)
+        raise ValueError("upstream")
+
+    results = await asyncio.gather(
+        *(group.do("k", broken) for _ in range(5)), return_exceptions=True
+    )
+    assert all(isinstance(result, ValueError) for result in results)
+    assert group.stats()["errors"] == 1
+
+    async def slow():
+        await asyncio.sleep(1)
+
+    results = await asyncio.gather(
+        *(group.do("k", slow, timeout=0.01) for _ in range(5)),
+        return_exceptions=True,
+    )
+    assert all(isinstance(result, TimeoutError) for result in results)
+    assert group.stats()["timeouts"] == 1
+    assert group.stats()["inflight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_singleflight_leader_cancelled():
+    group = SingleFlight()
+    calls = []
+
+    async def load():
+        calls.append(1)
+        await asyncio.sleep(0.02)
+        return "ok"
+
+    leader = asyncio.ensure_future(group.do("k", load))
+    await asyncio.sleep(0)
+    follower = asyncio.ensure_future(group.do("k", load))
+    await asyncio.sleep(0)
+    leader.cancel()
+    # 等待者接替被取消的调用者重新执行
+    assert await follower == ("ok", False)
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_singleflight_route():
+    app = Years()
+    calls = []
+    background = []
+    group = SingleFlight()
+
+    @app.get("/hot")
+    @singleflight(key=lambda request: request.query_params.get("id"), group=group)
+    async def hot(request):
+        calls.append(request.query_params.get("id"))
+        await asyncio.sleep(0.01)
+        task = BackgroundTask(background.append, 1)
+        return PlainTextResponse(f"hot {len(calls)}", background=task)
+
+    @app.get("/sync")
+    @singleflight()
+    def sync_hot(request):
+        calls.append("sync")
+        return PlainTextResponse("sync")
+
+    @app.get("/stream")
+    @singleflight()
+    async def stream(request):
+        calls.append("stream")
+        await asyncio.sleep(0.01)
+        return StreamingResponse(iter(["a", "b"]), media_type="text/plain")
+
+    client = TestClient(app)
+    responses = await asyncio.gather(
+        *(client.get("/hot?id=1&x=" + str(i)) for i in range(50))
+    )
+    assert {response.text for response in responses} == {"hot 1"}
+    assert {response.headers["content-length"] for response in responses} == {"5"}
+    assert calls == ["1"]
+    assert group.stats()["coalesced"] == 49
+    await app.background_runner.drain()
+    # 后台任务只跟着真正执行的那次请求运行
+    assert background == [1]
+
+    assert (await client.get("/sync")).text == "sync"
+
+    responses = await asyncio.gather(*(client.get("/stream") for _ in range(3)))
+    assert {response.text for response in responses} == {"ab"}
+    assert calls.count("stream") == 3
+
+
+@pytest.mark.asyncio
+async def test_singleflight_per_user_responses():
+    app = Years()
+    calls = []
+
+    @app.get("/me")
+    @singleflight()
+    async def me(request):
+        user = request.headers.get("authorization", "anonymous")
+        calls.append(user)
+        await asyncio.sleep(0.01)
+        return PlainTextResponse(user)
+
+    @app.get("/login")
+    @singleflight()
+    async def login(request):
+        calls.append("login")
+        session = len(calls)
+        await asyncio.sleep(0.01)
+        return PlainTextResponse("ok", headers={"set-cookie": f"session={session}"})
+
+    # 带凭据的请求各自执行，不会拿到别人的响应
+    client = TestClient(app)
+    responses = await asyncio.gather(
+        *(client.get("/me", headers={"authorization": f"user-{i}"}) for i in range(5))
+    )
+    assert [response.text for response in responses] == [f"user-{i}" for i in range(5)]
+    assert len(calls) == 5
+
+    # 带 Set-Cookie 的响应不共享，每个请求拿到自己的 Cookie
+    calls.clear()
+    responses = await asyncio.gather(*(client.get("/login") for _ in range(5)))
+    cookies = {response.headers["set-cookie"] for response in responses}
+    assert len(cookies) == 5
+    assert calls.count("login") == 5
+
+
+@pytest.mark.asyncio
+async def test_singleflight_mounted_paths():
+    sub = Years()
+    calls = []
+
+    @sub.get("/x")
+    @singleflight()
+    async def tenant(request):
+        tenant = request["raw_path"].decode().split("/")[2]
+        calls.append(tenant)
+        await asyncio.sleep(0.01)
+        return PlainTextResponse(tenant)
+
+    app = Years()
+    app.mount("/a/{tenant}", sub)
+
+    # 挂载之后 scope["path"] 都是 /x，但完整路径不同，不能合并
+    client = TestClient(app)
+    one, two = await asyncio.gather(client.get("/a/one/x"), client.get("/a/two/x"))
+    assert (one.text, two.text) == ("one", "two")
+    assert sorted(calls) == ["one", "two"]
+
+
+@pytest.mark.asyncio
+async def test_singleflight_route_executor():
+    app = Years(metrics=Metrics())
+    reports = BoundedExecutor(1, name="reports")
+    threads = []
+
+    @app.get("/report", executor=reports)
+    @singleflight()
+    def report(request):
+        threads.append(threading.current_thread().name)
+        time.sleep(0.01)
+        return PlainTextResponse("report")
+
+    # 路由上的线程池对 @singleflight 包装的同步函数同样生效
+    client = TestClient(app)
+    responses = await asyncio.gather(*(client.get("/report") for _ in range(5)))
+    assert {response.text for response in responses} == {"report"}
+    assert threads and all(name.startswith("reports") for name in threads)
+
+    text = app.metrics.render(app)
+    coalesced = 5 - len(threads)
+    assert f'years_singleflight_coalesced_total{{route="/report"}} {coalesced}' in text
+    assert f'years_singleflight_executed_total{{route="/report"}} {len(threads)}' in text
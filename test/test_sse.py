@@ -0,0 +1,127 @@
+import pytest
+import asyncio
+
+from years.testclient import TestClient
+from years.sse import (
+    BroadcastHub,
+    EventQueue,
+    EventSourceResponse,
+    ServerSentEvent,
+)
+
+
+def test_server_sent_event_encode():
+    event = ServerSentEvent("line1\nline2", event="update", id="7", retry=3000)
+    assert event.encode() == (
+        b"id: 7\nevent: update\nretry: 3000\ndata: line1\ndata: line2\n\n"
+    )
+    assert ServerSentEvent({"a": 1}).encode() == b'data: {"a":1}\n\n'
+    assert ServerSentEvent(comment="hi").encode() == b": hi\n\n"
+
+
+@pytest.mark.asyncio
+async def test_event_source_response():
+    async def events():
+        yield "hello"
+        yield {"data": {"n": 1}, "event": "count"}
+        yield ServerSentEvent("bye", id="2")
+
+    app = EventSourceResponse(events(), retry=1000)
+    response = await TestClient(app).get("/")
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert response.headers["cache-control"] == "no-cache"
+    assert response.text == (
+        "retry: 1000\n\n"
+        "data: hello\n\n"
+        'event: count\ndata: {"n":1}\n\n'
+        "id: 2\ndata: bye\n\n"
+    )
+
+
+@pytest.mark.asyncio
+async def test_event_source_ping():
+    async def slow():
+        await asyncio.sleep(0.05)
+        yield "done"
+
+    app = EventSourceResponse(slow(), ping=0.01)
+    response = await TestClient(app).get("/")
+    assert response.text.startswith(": ping\n\n")
+    assert response.text.endswith("data: done\n\n")
+
+
+@pytest.mark.asyncio
+async def test_event_queue_overflow():
+    queue = EventQueue(maxsize=2)
+    for i in range(5):
+        assert queue.put_nowait(str(i).encode())
+    assert queue.dropped == 3
+    assert await queue.get_batch() == [b"3", b"4"]
+    assert await queue.get_batch(timeout=0.01) == []
+
+    queue = EventQueue(maxsize=2, overflow="disconnect")
+    assert queue.put_nowait(b"1")
+    assert queue.put_nowait(b"2")
+    assert not queue.put_nowait(b"3")
+    assert queue.closed
+    assert await queue.get_batch() == [b"1", b"2"]
+    with pytest.raises(EOFError):
+        await queue.get_batch()
+
+
+@pytest.mark.asyncio
+async def test_broadcast_hub():
+    hub = BroadcastHub(maxsize=4)
+    queues = [hub.subscribe() for _ in range(100)]
+    slow = hub.subscribe(maxsize=1, overflow="disconnect")
+    assert len(hub) == 101
+
+    assert hub.publish("a") == 101
+    assert hub.publish("b") == 100
+    assert len(hub) == 100
+    assert slow.closed
+
+    assert await queues[0].get_batch() == [b"data: a\n\n", b"data: b\n\n"]
+    # 编码只做一次，所有订阅者拿到的是同一个对象
+    assert (await queues[1].get_batch())[0] is (await queues[2].get_batch())[0]
+
+    queues[0].close()
+    assert len(hub) == 99
+
+
+@pytest.mark.asyncio
+async def test_event_source_from_hub():
+    hub = BroadcastHub()
+    queue = hub.subscribe()
+
+    async def publish():
+        await asyncio.sleep(0.01)
+        hub.publish("one")
+        hub.publish("two")
+        await asyncio.sleep(0.01)
+        hub.close()
+
+    task = asyncio.ensure_future(publish())
+    response = await TestClient(EventSourceResponse(queue)).get("/")
+    await task
+    assert response.text == "data: one\n\ndata: two\n\n"
+    assert len(hub) == 0
+
+
+@pytest.mark.asyncio
+async def test_event_source_disconnect_unsubscribes():
+    hub = BroadcastHub()
+    disconnected = asyncio.Event()
+
+    async def receive():
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.body":
+            disconnected.set()
+
+    response = EventSourceResponse(hub.subscribe(), ping=None)
+    hub.publish("hello")
+    await asyncio.wait_for(response({"type": "http"}, receive, send), timeout=1)
+    assert len(hub) == 0
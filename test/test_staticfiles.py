@@ -0,0 +1,86 @@
+import os
+import gzip
+import time
+import pytest
+
+from years import Years
+from years.routing import Mount, Router
+from years.staticfiles import StaticFiles
+from years.testclient import TestClient
+
+
+@pytest.fixture
+def static_dir(tmpdir):
+    os.makedirs(os.path.join(tmpdir, "css"))
+    with open(os.path.join(tmpdir, "css", "style.css"), "w") as file:
+        file.write("body { color: red; }")
+    with open(os.path.join(tmpdir, "app.js"), "w") as file:
+        file.write("console.log('hello');")
+    with open(os.path.join(tmpdir, "app.js.gz"), "wb") as file:
+        file.write(gzip.compress(b"console.log('hello');"))
+    with open(os.path.join(tmpdir, "index.html"), "w") as file:
+        file.write("<h1>Hello</h1>")
+    return str(tmpdir)
+
+
+@pytest.mark.asyncio
+async def test_staticfiles(static_dir):
+    app = Years()
+    app.mount("/static", StaticFiles(directory=static_dir))
+    client = TestClient(app)
+
+    response = await client.get("/static/css/style.css")
+    assert response.status_code == 200
+    assert response.text == "body { color: red; }"
+    assert response.headers["content-type"] == "text/css"
+    assert "etag" in response.headers
+
+    response = await client.get(
+        "/static/css/style.css", headers={"if-none-match": response.headers["etag"]}
+    )
+    assert response.status_code == 304
+
+    assert (await client.get("/static/missing.txt")).status_code == 404
+    assert (await client.get("/static/../test_staticfiles.py")).status_code == 404
+    assert (await client.get("/static/css/%2e%2e/%2e%2e/etc/passwd")).status_code == 404
+    assert (await client.get("/static/")).status_code == 404
+    assert (await client.post("/static/app.js")).status_code == 405
+
+
+@pytest.mark.asyncio
+async def test_staticfiles_precompressed(static_dir):
+    client = TestClient(Router([Mount("/static", app=StaticFiles(directory=static_dir))]))
+
+    response = await client.get("/static/app.js", headers={"accept-encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.headers["content-type"] == "text/javascript"
+    assert response.text == "console.log('hello');"
+
+    response = await client.get(
+        "/static/app.js", headers={"accept-encoding": "gzip;q=0, identity"}
+    )
+    assert "content-encoding" not in response.headers
+    assert response.text == "console.log('hello');"
+
+
+@pytest.mark.asyncio
+async def test_staticfiles_html_and_refresh(static_dir):
+    statics = StaticFiles(directory=static_dir, html=True, refresh_interval=0)
+    client = TestClient(Router([Mount("/", app=statics)]))
+
+    response = await client.get("/")
+    assert response.text == "<h1>Hello</h1>"
+
+    assert (await client.get("/new.txt")).status_code == 404
+    with open(os.path.join(static_dir, "new.txt"), "w") as file:
+        file.write("new")
+    time.sleep(0.01)
+    response = await client.get("/new.txt")
+    assert response.status_code == 200
+    assert response.text == "new"
+
+
+def test_staticfiles_missing_directory(tmpdir):
+    with pytest.raises(RuntimeError):
+        StaticFiles(directory=os.path.join(tmpdir, "missing"))
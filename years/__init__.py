@@ -1,6 +1,6 @@
 from years.applications import Years
 from years.routing import Mount
-from years.requests import Request
+from years.requests import Request, WebSocket
 from years.responses import Response, PlainTextResponse, JSONResponse
 
 
@@ -8,6 +8,7 @@ __all__ = [
     "Mount",
     "Years",
     "Request",
+    "WebSocket",
     "Response",
     "PlainTextResponse",
     "JSONResponse",
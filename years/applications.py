@@ -1,7 +1,13 @@
 from contextlib import AsyncExitStack
-from years.routing import Router, Route, Mount
+from years.background import BackgroundRunner
+from years.concurrency import BoundedExecutor
+from years.jobqueue import JobQueue
+from years.metrics import Metrics
+from years.routing import Router, Route, Mount, WebSocketRoute
 from years.exceptions import ExceptionMiddleware
 from years.endpoints import HTTPEndpoint
+from years.middleware import Middleware
+from years.jsoncodec import JSONCodec, current_json_codec, default_json_codec
 
 
 class Years:
@@ -11,8 +17,36 @@ class Years:
         lifespan=None,
         debug: bool = False,
         exception_handlers: dict = None,
+        middleware: list[Middleware] = None,
+        max_body_size: int = None,
+        json_codec: JSONCodec = None,
+        endpoint_executor: BoundedExecutor = None,
+        background_executor: BoundedExecutor = None,
+        background_concurrency: int = 100,
+        shutdown_timeout: float | None = 30,
+        job_queue: JobQueue = None,
+        metrics: Metrics = None,
     ):
         self.debug = debug
+        # 同步路由函数和同步后台任务各用一个线程池，慢的后台任务不会占满处理请求的线程
+        self.endpoint_executor = endpoint_executor or BoundedExecutor(
+            max_workers=40, max_queue=1000, name="years-endpoint"
+        )
+        self.background_executor = background_executor or BoundedExecutor(
+            max_workers=8, name="years-background"
+        )
+        # 后台任务在响应结束之后由它调度，lifespan.shutdown 时最多等 shutdown_timeout 秒
+        self.background_runner = BackgroundRunner(background_concurrency)
+        self.shutdown_timeout = shutdown_timeout
+        # 持久化任务队列跟着 lifespan 启动和停止，同步任务使用后台线程池
+        self.job_queue = job_queue
+        # 传入 years.metrics.Metrics 时记录每条路由的请求数和各阶段耗时
+        self.metrics = metrics
+        if job_queue is not None and job_queue.executor is None:
+            job_queue.executor = self.background_executor
+        self.json_codec = json_codec or default_json_codec()
+        # 请求体的默认大小限制，路由上可以单独覆盖
+        self.max_body_size = max_body_size
         self.lifespan = lifespan
         if router:
             self.router = router
@@ -20,13 +54,47 @@ class Years:
             self.router = Router()
 
         self.exception_handlers = exception_handlers or {}
-
-    def route(self, path: str, methods=None):
+        self.user_middleware = list(middleware or [])
+        self.middleware_stack = None
+
+    def add_middleware(self, cls, *args, **kwargs):
+        if self.middleware_stack is not None:
+            raise RuntimeError("应用已经开始处理请求，不能再添加中间件")
+        # 后添加的中间件在最外层，先处理请求
+        self.user_middleware.insert(0, Middleware(cls, *args, **kwargs))
+
+    def build_middleware_stack(self):
+        """
+        只在第一次收到请求或 lifespan 事件时组装一次，之后每个请求的中间件层数不变：
+
+            用户中间件 -> ExceptionMiddleware -> Router
+        """
+        if self.metrics is not None:
+            self.router.instrument(self.metrics)
+
+        app = ExceptionMiddleware(self.router, self.exception_handlers, self.debug)
+        for cls, args, kwargs in reversed(self.user_middleware):
+            app = cls(app, *args, **kwargs)
+        return app
+
+    def route(
+        self,
+        path: str,
+        methods=None,
+        max_body_size: int = None,
+        executor: BoundedExecutor = None,
+    ):
         if methods is None:
             methods = ["GET"]
 
         def decorate(endpoint):
-            route = Route(path, endpoint, methods=methods)
+            route = Route(
+                path,
+                endpoint,
+                methods=methods,
+                max_body_size=max_body_size,
+                executor=executor,
+            )
             self.router.add_route(route)
 
         return decorate
@@ -39,45 +107,73 @@ class Years:
 
         return decorate
 
-    def get(self, path: str):
+    def get(self, path: str, executor: BoundedExecutor = None):
         def decorate(endpoint):
-            route = Route(path, endpoint, methods=["GET"])
+            route = Route(path, endpoint, methods=["GET"], executor=executor)
             self.router.add_route(route)
 
         return decorate
 
-    def post(self, path: str):
+    def post(
+        self, path: str, max_body_size: int = None, executor: BoundedExecutor = None
+    ):
         def decorate(endpoint):
-            route = Route(path, endpoint, methods=["POST"])
+            route = Route(
+                path,
+                endpoint,
+                methods=["POST"],
+                max_body_size=max_body_size,
+                executor=executor,
+            )
             self.router.add_route(route)
 
         return decorate
 
+    def websocket(self, path: str):
+        def decorate(endpoint):
+            self.router.add_websocket_route(WebSocketRoute(path, endpoint))
+
+        return decorate
+
     def mount(self, path, app):
         mount = Mount(path, app=app)
         self.router.add_mount(mount)
 
     async def run_lifespan(self, scope, receive, send):
         stack = AsyncExitStack()
-        if self.lifespan is None:
-            return
 
         while True:
             message = await receive()
             if message["type"] == "lifespan.startup":
-                await stack.enter_async_context(self.lifespan())
+                if self.lifespan is not None:
+                    await stack.enter_async_context(self.lifespan())
+                if self.job_queue is not None:
+                    await self.job_queue.start()
                 await send({"type": "lifespan.startup.complete"})
 
             elif message["type"] == "lifespan.shutdown":
+                # 先等后台任务结束，它们可能还在用 lifespan 里准备的资源
+                await self.background_runner.drain(self.shutdown_timeout)
+                if self.job_queue is not None:
+                    await self.job_queue.stop(self.shutdown_timeout)
                 await stack.aclose()
                 await send({"type": "lifespan.shutdown.complete"})
                 return
 
     async def __call__(self, scope, receive, send):
-        if self.debug:
-            self.router = ExceptionMiddleware(self.router, self.exception_handlers)
+        if self.middleware_stack is None:
+            self.middleware_stack = self.build_middleware_stack()
 
         if scope["type"] == "lifespan":
             await self.run_lifespan(scope, receive, send)
         else:
-            await self.router(scope, receive, send)
+            scope["app"] = self
+            # 挂载在别的应用下面时，最外层的应用才会收到 lifespan 事件，
+            # 后台任务要交给它的调度器，关闭时才会被 drain
+            scope.setdefault("root_app", self)
+            # 处理请求期间创建的 JSONResponse 使用这个应用的编解码器
+            token = current_json_codec.set(self.json_codec)
+            try:
+                await self.middleware_stack(scope, receive, send)
+            finally:
+                current_json_codec.reset(token)
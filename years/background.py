@@ -1,6 +1,9 @@
 import typing
 import asyncio
 import inspect
+import logging
+
+logger = logging.getLogger("years.background")
 
 
 class BackgroundTask:
@@ -12,13 +15,81 @@ class BackgroundTask:
     def add_task(self, func: typing.Callable, *args, **kwargs):
         self.tasks.append((func, args, kwargs))
 
-    async def __call__(self):
-        for task in self.tasks:
-            func, args, kwargs = task
-            if inspect.iscoroutinefunction(func):
-                await func(*args, **kwargs)
-            else:
-                await asyncio.to_thread(func, *args, **kwargs)
+    @staticmethod
+    async def run_task(func, args, kwargs, executor=None):
+        """同步函数交给 executor（应用的后台线程池），没有时退回 asyncio.to_thread"""
+        if inspect.iscoroutinefunction(func):
+            await func(*args, **kwargs)
+        elif executor is not None:
+            await executor.run(func, *args, **kwargs)
+        else:
+            await asyncio.to_thread(func, *args, **kwargs)
+
+    async def __call__(self, executor=None):
+        for func, args, kwargs in self.tasks:
+            await self.run_task(func, args, kwargs, executor)
 
 
 BackgroundTasks = BackgroundTask
+
+
+class ParallelBackgroundTasks(BackgroundTask):
+    """
+    add_task 添加的任务互不依赖时使用，所有任务同时执行，而不是一个接一个。
+    一个任务失败不会取消其他任务，每个失败的任务单独记录到日志里。
+    """
+
+    async def __call__(self, executor=None):
+        calls = [
+            self.run_task(func, args, kwargs, executor)
+            for func, args, kwargs in self.tasks
+        ]
+        results = await asyncio.gather(*calls, return_exceptions=True)
+        for (func, _, _), result in zip(self.tasks, results):
+            if isinstance(result, Exception):
+                logger.error("后台任务 %r 执行失败", func, exc_info=result)
+
+
+class BackgroundRunner:
+    """
+    应用持有的后台任务调度器。响应发送完之后把后台任务交给它，
+    ASGI 调用马上返回，不用等后台任务执行完。
+
+    同时执行的后台任务最多 max_concurrency 个，多出来的排队等待；
+    任务抛出的异常记录到 years.background 日志里。
+    lifespan.shutdown 时 drain() 等待还没完成的任务，超过 timeout 之后取消。
+    """
+
+    def __init__(self, max_concurrency: int = 100):
+        self.max_concurrency = max_concurrency
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.tasks: set[asyncio.Task] = set()
+
+    def __len__(self):
+        return len(self.tasks)
+
+    async def run(self, background: BackgroundTask, executor=None):
+        async with self.semaphore:
+            try:
+                await background(executor)
+            except Exception:
+                logger.exception("后台任务 %r 执行失败", background)
+
+    def submit(self, background: BackgroundTask, executor=None) -> asyncio.Task:
+        task = asyncio.ensure_future(self.run(background, executor))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    async def drain(self, timeout: float = None) -> int:
+        """等待所有后台任务完成，返回超时后被取消的任务数"""
+        if not self.tasks:
+            return 0
+
+        _, pending = await asyncio.wait(set(self.tasks), timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            logger.warning("关闭时还有 %d 个后台任务没有完成，已取消", len(pending))
+            await asyncio.wait(pending)
+        return len(pending)
@@ -0,0 +1,125 @@
+import os
+import time
+import asyncio
+import inspect
+import functools
+import threading
+import contextvars
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+def is_async_callable(obj) -> bool:
+    """协程函数，或者 __call__ 是协程函数的对象"""
+    while isinstance(obj, functools.partial):
+        obj = obj.func
+    if inspect.iscoroutinefunction(obj):
+        return True
+    return inspect.iscoroutinefunction(getattr(obj, "__call__", None))
+
+
+def endpoint_handler(endpoint, executor: "BoundedExecutor" = None):
+    """
+    把路由函数变成 async def handle(request)：协程直接返回，同步函数交给线程池。
+    executor（路由上单独指定的线程池）优先，其次是应用的 endpoint_executor，
+    都没有时退回 asyncio.to_thread。
+
+    @singleflight 这类装饰器包装之后是协程函数，通过 bind_executor(executor)
+    把路由上的线程池交给里面的同步函数。
+    """
+    if executor is not None:
+        bind_executor = getattr(endpoint, "bind_executor", None)
+        if bind_executor is not None:
+            return bind_executor(executor)
+
+    if is_async_callable(endpoint):
+        return endpoint
+
+    async def handle(request):
+        pool = executor or getattr(request.get("app"), "endpoint_executor", None)
+        if pool is not None:
+            return await pool.run(endpoint, request)
+        return await asyncio.to_thread(endpoint, request)
+
+    return handle
+
+
+class ExecutorSaturated(Exception):
+    """线程池和等待队列都满了，路由会返回 503"""
+
+
+class BoundedExecutor:
+    """
+    带等待队列上限的线程池，用来跑同步的路由函数和后台任务。
+
+    正在执行的任务数到达 max_workers 之后，新任务进入等待队列，
+    队列里的任务数到达 max_queue 时直接抛出 ExecutorSaturated，不再排队。
+    max_queue 为 None 表示不限制。stats() 返回队列深度、活跃线程数和等待时间，
+    方便在压测时调整大小。
+
+    和 asyncio.to_thread 一样，函数在调用方 contextvars 的副本里执行。
+    """
+
+    def __init__(
+        self, max_workers: int = None, max_queue: int = None, name: str = "years"
+    ):
+        self.max_workers = max_workers or min(32, (os.cpu_count() or 1) + 4)
+        self.max_queue = max_queue
+        self.executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix=name)
+        self.lock = threading.Lock()
+        self.queued = 0
+        self.active = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def stats(self) -> dict:
+        with self.lock:
+            started = self.completed + self.active
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "queue_depth": self.queued,
+                "active": self.active,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "avg_wait": self.total_wait / started if started else 0.0,
+                "max_wait": self.max_wait,
+            }
+
+    def worker(self, submitted: float, call):
+        waited = time.perf_counter() - submitted
+        with self.lock:
+            self.queued -= 1
+            self.active += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+        try:
+            return call()
+        finally:
+            with self.lock:
+                self.active -= 1
+                self.completed += 1
+
+    def discard(self, future: Future):
+        # 还没开始执行就被取消的任务不会进入 worker，这里把它移出队列
+        if future.cancelled():
+            with self.lock:
+                self.queued -= 1
+
+    async def run(self, func, *args, **kwargs):
+        with self.lock:
+            if self.max_queue is not None and self.queued >= self.max_queue:
+                if self.active >= self.max_workers:
+                    self.rejected += 1
+                    raise ExecutorSaturated(f"线程池已满，等待队列长度 {self.queued}")
+            self.queued += 1
+
+        context = contextvars.copy_context()
+        call = functools.partial(context.run, func, *args, **kwargs)
+        future = self.executor.submit(self.worker, time.perf_counter(), call)
+        future.add_done_callback(self.discard)
+        return await asyncio.wrap_future(future)
+
+    def shutdown(self, wait: bool = True):
+        self.executor.shutdown(wait=wait)
@@ -0,0 +1,102 @@
+import uuid
+import typing
+
+
+class Convertor:
+    """路径参数转换器，regex 用来匹配路径，convert 把匹配到的字符串转换成对应的类型"""
+
+    regex: typing.ClassVar[str] = ""
+
+    def convert(self, value: str) -> typing.Any:
+        raise NotImplementedError()
+
+    def to_string(self, value: typing.Any) -> str:
+        raise NotImplementedError()
+
+
+class StringConvertor(Convertor):
+    regex = "[^/]+"
+
+    def convert(self, value: str) -> str:
+        return value
+
+    def to_string(self, value: str) -> str:
+        value = str(value)
+        assert "/" not in value, "字符串参数里不能包含 '/'"
+        assert value, "字符串参数不能为空"
+        return value
+
+
+class PathConvertor(Convertor):
+    """可以跨越多个路径段，一般放在路由的最后，例如 "/files/{rest:path}" """
+
+    regex = ".*"
+
+    def convert(self, value: str) -> str:
+        return value
+
+    def to_string(self, value: str) -> str:
+        return str(value)
+
+
+class IntegerConvertor(Convertor):
+    regex = "[0-9]+"
+
+    def convert(self, value: str) -> int:
+        return int(value)
+
+    def to_string(self, value: int) -> str:
+        value = int(value)
+        assert value >= 0, "不支持负整数"
+        return str(value)
+
+
+class FloatConvertor(Convertor):
+    regex = r"[0-9]+(?:\.[0-9]+)?"
+
+    def convert(self, value: str) -> float:
+        return float(value)
+
+    def to_string(self, value: float) -> str:
+        value = float(value)
+        assert value >= 0.0, "不支持负数"
+        return f"{value:0.20f}".rstrip("0").rstrip(".")
+
+
+class UUIDConvertor(Convertor):
+    regex = "[0-9a-fA-F]{8}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{12}"
+
+    def convert(self, value: str) -> uuid.UUID:
+        return uuid.UUID(value)
+
+    def to_string(self, value: uuid.UUID) -> str:
+        return str(value)
+
+
+class SlugConvertor(Convertor):
+    regex = "[-a-zA-Z0-9_]+"
+
+    def convert(self, value: str) -> str:
+        return value
+
+    def to_string(self, value: str) -> str:
+        return str(value)
+
+
+# 每种转换器在进程里只有一个实例，所有路由共用
+CONVERTOR_TYPES: dict[str, Convertor] = {
+    "str": StringConvertor(),
+    "path": PathConvertor(),
+    "int": IntegerConvertor(),
+    "float": FloatConvertor(),
+    "uuid": UUIDConvertor(),
+    "slug": SlugConvertor(),
+}
+
+
+def register_url_convertor(key: str, convertor: Convertor):
+    from years.routing import compile_path
+
+    CONVERTOR_TYPES[key] = convertor
+    # 已经缓存的路径可能用到了旧的转换器
+    compile_path.cache_clear()
@@ -1,5 +1,7 @@
 import re
+import asyncio
 from copy import deepcopy
+from tempfile import SpooledTemporaryFile
 from collections import defaultdict
 from collections.abc import Mapping, MutableMapping
 from urllib.parse import parse_qs, unquote, urlparse, urlunparse
@@ -110,6 +112,12 @@ class URL:
 
 
 class Headers(Mapping):
+    """
+    第一次访问时建立一个 小写名称 -> 值列表 的索引并缓存在实例上，
+    之后 __getitem__ / __contains__ / getlist 都是 O(1) 的字典查找。
+    索引里保存的是原始字节，取值时才解码。
+    """
+
     def __init__(
         self, headers: dict[str, str] = None, raw: list[list[bytes, bytes]] = None
     ):
@@ -123,8 +131,23 @@ class Headers(Mapping):
         else:
             self.raw = raw or []
 
+        self._index: dict[bytes, list[bytes]] | None = None
+
+    @property
+    def index(self) -> dict[bytes, list[bytes]]:
+        if self._index is None:
+            index = {}
+            for key, value in self.raw:
+                key = key.lower()
+                if key in index:
+                    index[key].append(value)
+                else:
+                    index[key] = [value]
+            self._index = index
+        return self._index
+
     def __iter__(self):
-        return iter([key.decode("latin-1").lower() for key, _ in self.raw])
+        return iter(self.keys())
 
     @property
     def scan(self):
@@ -134,18 +157,13 @@ class Headers(Mapping):
         ]
 
     def __contains__(self, name: str):
-        for key, _ in self.scan:
-            if key == name.lower():
-                return True
-
-        return False
+        return name.lower().encode("latin-1") in self.index
 
     def __getitem__(self, name: str):
-        for key, value in self.scan:
-            if key == name.lower():
-                return value
-
-        raise KeyError(key)
+        values = self.index.get(name.lower().encode("latin-1"))
+        if not values:
+            raise KeyError(name)
+        return values[0].decode("latin-1")
 
     def __len__(self):
         return len(self.raw)
@@ -157,15 +175,11 @@ class Headers(Mapping):
         return [value for _, value in self.scan]
 
     def items(self):
-        return [(key, value) for key, value in self.scan]
+        return self.scan
 
     def getlist(self, name: str):
-        values = []
-        for key, value in self.scan:
-            if key == name.lower():
-                values.append(value)
-
-        return values
+        values = self.index.get(name.lower().encode("latin-1"), ())
+        return [value.decode("latin-1") for value in values]
 
     def __repr__(self):
         if self.headers is not None:
@@ -174,31 +188,81 @@ class Headers(Mapping):
         return f"Headers(raw={self.raw})"
 
     def mutablecopy(self):
-        return MutableHeaders(raw=self.raw)
+        return MutableHeaders(raw=list(self.raw))
 
 
 class MutableHeaders(Headers):
+    """修改 raw 的同时就地更新索引，不需要重新建立"""
+
     def __setitem__(self, name: str, value):
-        setted = False
-        for idx, (key, _) in enumerate(self.raw):
-            if key.decode("latin-1") == name.lower():
-                self.raw[idx] = (key, value.encode("latin-1"))
-                setted = True
+        raw_key = name.lower().encode("latin-1")
+        raw_value = value.encode("latin-1")
 
-        if not setted:
-            self.raw.append((name.lower().encode("latin-1"), value.encode("latin-1")))
+        if raw_key in self.index:
+            found = [
+                idx for idx, (key, _) in enumerate(self.raw) if key.lower() == raw_key
+            ]
+            self.raw[found[0]] = (raw_key, raw_value)
+            for idx in reversed(found[1:]):
+                del self.raw[idx]
+        else:
+            self.raw.append((raw_key, raw_value))
+
+        self.index[raw_key] = [raw_value]
 
     def __delitem__(self, name: str):
-        for idx, (key, _) in enumerate(self.raw):
-            if key.decode("latin-1") == name.lower():
-                del self.raw[idx]
+        raw_key = name.lower().encode("latin-1")
+        if raw_key not in self.index:
+            return
+
+        self.raw[:] = [(key, value) for key, value in self.raw if key.lower() != raw_key]
+        del self.index[raw_key]
 
     def setdefault(self, name: str, value):
-        for key, _ in self.raw:
-            if key.decode("latin-1") == name.lower():
-                break
+        raw_key = name.lower().encode("latin-1")
+        if raw_key in self.index:
+            return self.index[raw_key][0].decode("latin-1")
+
+        raw_value = value.encode("latin-1")
+        self.raw.append((raw_key, raw_value))
+        self.index[raw_key] = [raw_value]
+        return value
+
+    def append(self, name: str, value):
+        """追加一个同名的头，例如多个 Set-Cookie"""
+        raw_key = name.lower().encode("latin-1")
+        raw_value = value.encode("latin-1")
+        self.raw.append((raw_key, raw_value))
+        if raw_key in self.index:
+            self.index[raw_key].append(raw_value)
         else:
-            self.raw.append((name.lower().encode("latin-1"), value.encode("latin-1")))
+            self.index[raw_key] = [raw_value]
+
+
+def choose_encoding(accept_encoding: str, available) -> str | None:
+    """
+    按 available 的顺序返回第一个 Accept-Encoding 接受的编码，都不接受时返回 None。
+    q=0 表示明确拒绝，"*" 匹配没有单独列出的编码。
+    """
+    accepted = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        params = params.replace(" ", "")
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                continue
+        accepted[coding] = quality
+
+    for encoding in available:
+        if accepted.get(encoding, accepted.get("*", 0)) > 0:
+            return encoding
+    return None
 
 
 class QueryParams(Mapping):
@@ -252,6 +316,94 @@ class QueryParams(Mapping):
         return f"QueryParams('{self}')"
 
 
+class UploadFile:
+    """
+    multipart 表单里的文件，内容保存在 SpooledTemporaryFile 里，
+    超过 max_size 之后落到磁盘上，落盘之后的读写放到线程里执行。
+    """
+
+    def __init__(
+        self,
+        filename: str,
+        content_type: str = "",
+        headers: Headers = None,
+        max_size: int = 1024 * 1024,
+    ):
+        self.filename = filename
+        self.content_type = content_type
+        self.headers = headers or Headers()
+        self.file = SpooledTemporaryFile(max_size=max_size)
+        self.size = 0
+
+    @property
+    def in_memory(self) -> bool:
+        return not self.file._rolled
+
+    async def write(self, data: bytes):
+        self.size += len(data)
+        if self.in_memory:
+            self.file.write(data)
+        else:
+            await asyncio.to_thread(self.file.write, data)
+
+    async def read(self, size: int = -1) -> bytes:
+        if self.in_memory:
+            return self.file.read(size)
+        return await asyncio.to_thread(self.file.read, size)
+
+    async def seek(self, offset: int):
+        if self.in_memory:
+            self.file.seek(offset)
+        else:
+            await asyncio.to_thread(self.file.seek, offset)
+
+    async def close(self):
+        if self.in_memory:
+            self.file.close()
+        else:
+            await asyncio.to_thread(self.file.close)
+
+    def __repr__(self):
+        return f"UploadFile(filename={self.filename!r}, size={self.size})"
+
+
+class FormData(Mapping):
+    """和 QueryParams 一样，同名字段取最后一个值，getlist 取全部"""
+
+    def __init__(self, items: list[tuple[str, str | UploadFile]] = None):
+        self.raw = defaultdict(list)
+        for key, value in items or []:
+            self.raw[key].append(value)
+
+    def __contains__(self, key):
+        return key in self.raw
+
+    def __getitem__(self, key):
+        if key not in self.raw:
+            raise KeyError(key)
+
+        return self.raw[key][-1]
+
+    def __len__(self):
+        return len(self.raw)
+
+    def __iter__(self):
+        return iter(self.raw.keys())
+
+    def getlist(self, key):
+        return self.raw.get(key, [])
+
+    async def close(self):
+        for values in self.raw.values():
+            for value in values:
+                if isinstance(value, UploadFile):
+                    await value.close()
+
+    def __repr__(self):
+        items = [(key, value) for key, values in self.raw.items() for value in values]
+        return f"FormData({items!r})"
+
+
 class Cookie(MutableMapping):
     def __init__(self, cookies: str = None):
         if cookies:
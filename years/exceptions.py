@@ -2,12 +2,13 @@ from __future__ import annotations
 import traceback
 from typing import Callable
 
-from years.responses import PlainTextResponse, JSONResponse
+from years.responses import PlainTextResponse
 from years.requests import Request
 
 
 async def default_handlers(request: Request, exc: HTTPException):
-    return JSONResponse(f"异常状态码: {exc.status_code}，异常内容: {exc.msg}")
+    content = f"异常状态码: {exc.status_code}，异常内容: {exc.msg}"
+    return PlainTextResponse(content, status_code=exc.status_code)
 
 
 class HTTPException(Exception):
@@ -18,12 +19,25 @@ class HTTPException(Exception):
 
 
 class ExceptionMiddleware:
-    def __init__(self, endpoint: Callable, exception_handlers: dict):
+    """
+    HTTPException 总是交给对应的处理函数，其它异常只在 debug 模式下渲染成调用栈，
+    否则继续向上抛给服务器。
+    """
+
+    def __init__(
+        self, endpoint: Callable, exception_handlers: dict, debug: bool = False
+    ):
         self.endpoint = endpoint
         self.exception_handlers = exception_handlers
         self.default_handler = default_handlers
+        self.debug = debug
 
     async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            # WebSocket 会话没有 HTTP 响应可以渲染，异常直接交给服务器
+            await self.endpoint(scope, receive, send)
+            return
+
         request = Request(scope, receive)
         try:
             await self.endpoint(scope, receive, send)
@@ -32,8 +46,10 @@ class ExceptionMiddleware:
                 response = await self.exception_handlers[e.status_code](request, e)
             else:
                 response = await self.default_handler(request, e)
-            await response(scope, send)
+            await response(scope, receive, send)
         except Exception:
+            if not self.debug:
+                raise
             err_stack = traceback.format_exc()
-            response = PlainTextResponse(err_stack)
-            await response(scope, send)
+            response = PlainTextResponse(err_stack, status_code=500)
+            await response(scope, receive, send)
@@ -0,0 +1,182 @@
+import typing
+
+from years.datastructures import Headers, UploadFile
+
+
+class MultiPartException(Exception):
+    """multipart 请求体格式错误或者超过了限制，路由会返回 400"""
+
+    status_code = 400
+
+
+def parse_options_header(value: str) -> tuple[str, dict[str, str]]:
+    """
+    解析 'multipart/form-data; boundary="xyz"' 这种带参数的头，
+    返回小写的主值和参数字典，参数值去掉引号。
+    """
+    main, *params = value.split(";")
+    options = {}
+    for param in params:
+        key, sep, option = param.strip().partition("=")
+        if not sep:
+            continue
+        option = option.strip()
+        if len(option) >= 2 and option[0] == option[-1] == '"':
+            option = option[1:-1].replace('\\\\', "\\").replace('\\"', '"')
+        options[key.strip().lower()] = option
+    return main.strip().lower(), options
+
+
+class MultiPartParser:
+    """
+    增量解析 multipart/form-data，直接消费 Request.stream() 的数据块。
+
+    缓冲区里最多只保留一个数据块加上分隔符的长度，普通字段在解析完成后按
+    (name, str) 产出，文件按 (name, UploadFile) 产出，文件内容写进
+    SpooledTemporaryFile，所以内存占用和上传的大小无关。
+    """
+
+    max_header_size = 16 * 1024
+
+    def __init__(
+        self,
+        headers: Headers,
+        stream: typing.AsyncIterator[bytes],
+        *,
+        max_parts: int = 1000,
+        max_field_size: int = 1024 * 1024,
+        max_file_size: int = None,
+        max_size: int = None,
+        spool_max_size: int = 1024 * 1024,
+    ):
+        self.headers = headers
+        self.stream = stream.__aiter__()
+        self.max_parts = max_parts
+        self.max_field_size = max_field_size
+        self.max_file_size = max_file_size
+        self.max_size = max_size
+        self.spool_max_size = spool_max_size
+        self.buffer = bytearray()
+        self.received = 0
+
+    async def fill(self) -> bool:
+        """从请求体里再读一块数据到缓冲区，没有数据了返回 False"""
+        try:
+            chunk = await anext(self.stream)
+        except StopAsyncIteration:
+            return False
+
+        if isinstance(chunk, str):
+            chunk = chunk.encode()
+        self.received += len(chunk)
+        if self.max_size is not None and self.received > self.max_size:
+            raise MultiPartException(f"表单超过了 {self.max_size} 字节")
+        self.buffer += chunk
+        return True
+
+    async def read_until(self, separator: bytes, limit: int = None) -> bytes:
+        while (idx := self.buffer.find(separator)) < 0:
+            if limit is not None and len(self.buffer) > limit:
+                raise MultiPartException("multipart 头部过长")
+            if not await self.fill():
+                raise MultiPartException("multipart 请求体不完整")
+
+        data = bytes(self.buffer[:idx])
+        del self.buffer[: idx + len(separator)]
+        return data
+
+    async def parse(self) -> typing.AsyncIterator[tuple[str, str | UploadFile]]:
+        _, options = parse_options_header(self.headers.get("content-type", ""))
+        boundary = options.get("boundary")
+        if not boundary:
+            raise MultiPartException("缺少 multipart boundary")
+
+        delimiter = b"--" + boundary.encode("latin-1")
+        separator = b"\r\n" + delimiter
+
+        # 跳过第一个分隔符之前的内容
+        await self.read_until(delimiter, limit=self.max_header_size)
+
+        parts = 0
+        while True:
+            while len(self.buffer) < 2:
+                if not await self.fill():
+                    raise MultiPartException("multipart 请求体不完整")
+            if self.buffer[:2] == b"--":
+                return
+            if self.buffer[:2] != b"\r\n":
+                raise MultiPartException("multipart 分隔符格式错误")
+            del self.buffer[:2]
+
+            parts += 1
+            if parts > self.max_parts:
+                raise MultiPartException(f"表单字段超过了 {self.max_parts} 个")
+
+            raw_headers = await self.read_until(b"\r\n\r\n", limit=self.max_header_size)
+            headers = self.parse_part_headers(raw_headers)
+            _, disposition = parse_options_header(
+                headers.get("content-disposition", "")
+            )
+            name = disposition.get("name")
+            if name is None:
+                raise MultiPartException("multipart 字段缺少 name")
+
+            if "filename" in disposition:
+                upload = UploadFile(
+                    disposition["filename"],
+                    content_type=headers.get("content-type", ""),
+                    headers=headers,
+                    max_size=self.spool_max_size,
+                )
+                async for data in self.iter_part(separator):
+                    if self.max_file_size is not None:
+                        if upload.size + len(data) > self.max_file_size:
+                            raise MultiPartException(
+                                f"文件超过了 {self.max_file_size} 字节"
+                            )
+                    await upload.write(data)
+                await upload.seek(0)
+                yield name, upload
+            else:
+                field = bytearray()
+                async for data in self.iter_part(separator):
+                    if len(field) + len(data) > self.max_field_size:
+                        raise MultiPartException(
+                            f"字段超过了 {self.max_field_size} 字节"
+                        )
+                    field += data
+                try:
+                    value = field.decode("utf-8")
+                except UnicodeDecodeError:
+                    raise MultiPartException(f"字段 '{name}' 不是合法的 UTF-8")
+                yield name, value
+
+    async def iter_part(self, separator: bytes) -> typing.AsyncIterator[bytes]:
+        """产出当前字段的数据，直到遇到下一个分隔符"""
+        # 缓冲区末尾可能是分隔符的前半部分，要留着等下一块数据
+        keep = len(separator) - 1
+        while True:
+            idx = self.buffer.find(separator)
+            if idx >= 0:
+                if idx:
+                    yield bytes(self.buffer[:idx])
+                del self.buffer[: idx + len(separator)]
+                return
+
+            safe = len(self.buffer) - keep
+            if safe > 0:
+                yield bytes(self.buffer[:safe])
+                del self.buffer[:safe]
+
+            if not await self.fill():
+                raise MultiPartException("multipart 请求体不完整")
+
+    @staticmethod
+    def parse_part_headers(raw_headers: bytes) -> Headers:
+        raw = []
+        for line in raw_headers.split(b"\r\n"):
+            key, sep, value = line.partition(b":")
+            if not sep:
+                raise MultiPartException("multipart 字段头格式错误")
+            raw.append((key.strip().lower(), value.strip()))
+        return Headers(raw=raw)
@@ -0,0 +1,455 @@
+import json
+import time
+import uuid
+import typing
+import asyncio
+import logging
+import sqlite3
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from years.background import BackgroundTask
+from years.concurrency import is_async_callable
+
+logger = logging.getLogger("years.jobqueue")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    idempotency_key TEXT UNIQUE,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    run_at REAL NOT NULL,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    claimed_at REAL,
+    owner TEXT,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, run_at);
+"""
+
+# 旧版本建的表里没有这些列，连接时补上
+MIGRATIONS = {"claimed_at": "REAL", "owner": "TEXT", "finished_at": "REAL"}
+
+# 两次清理已完成任务之间的最短间隔
+PURGE_INTERVAL = 3600
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class Job(typing.NamedTuple):
+    id: int
+    name: str
+    args: list
+    kwargs: dict
+    attempts: int
+
+
+class JobQueue:
+    """
+    基于 SQLite 的本地持久化任务队列，进程重启或者发布之后还没执行的任务不会丢。
+
+    任务函数要先用 @queue.task 注册，参数必须能用 JSON 序列化。
+    enqueue() 把任务放进缓冲区，同一批（batch_size 条或者 flush_interval 秒内）
+    只提交一次事务，返回时任务已经写进数据库。fsync=False 时关闭 SQLite 的同步写盘，
+    吞吐更高，但是机器掉电时可能丢掉最后几批。
+
+    失败的任务按 backoff * 2 ** (attempts - 1) 秒指数退避重试，最多 max_attempts 次。
+    带 idempotency_key 的任务只会入队一次，重复入队返回已有任务的 id。
+
+    领取任务时记录领取时间和当前实例的 owner，执行期间每 lease / 3 秒续期一次。
+    多个进程共用一个数据库文件时，只有超过 lease 秒没有续期的任务（进程已经退出）
+    才会被其他进程重新领取，不会把别的进程正在执行的任务再执行一遍。
+
+    执行成功（done）和放弃重试（failed）的任务保留 retention 秒之后删除，
+    启动时清理一次，之后空闲时每小时最多清理一次；retention 为 None 时一直保留。
+    idempotency_key 也只在任务保留期间有效。
+
+    所有数据库操作都在一个专用线程里执行，不阻塞事件循环。
+    """
+
+    def __init__(
+        self,
+        path: str = "years-jobs.sqlite3",
+        *,
+        fsync: bool = True,
+        batch_size: int = 256,
+        flush_interval: float = 0.005,
+        max_attempts: int = 5,
+        backoff: float = 1.0,
+        max_backoff: float = 300.0,
+        poll_interval: float = 1.0,
+        lease: float = 60.0,
+        retention: float | None = 7 * 24 * 3600,
+        executor=None,
+    ):
+        self.path = path
+        self.fsync = fsync
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.retention = retention
+        self.last_purge: float | None = None
+        self.owner = uuid.uuid4().hex
+        # 同步任务使用的线程池，交给 Years 管理时使用应用的后台线程池
+        self.executor = executor
+
+        self.registry: dict[str, typing.Callable] = {}
+        self.connection: sqlite3.Connection | None = None
+        self.db_executor = ThreadPoolExecutor(1, thread_name_prefix="years-jobqueue")
+        self.buffer: list[tuple[tuple, asyncio.Future]] = []
+        self.flusher: asyncio.Task | None = None
+        self.workers: list[asyncio.Task] = []
+        self.wakeup = asyncio.Event()
+        self.stopping = False
+
+    def task(self, func: typing.Callable = None, *, name: str = None):
+        """注册任务函数，默认用 模块名.函数名 作为任务名，重启之后按名字找回函数"""
+
+        def decorate(func):
+            key = name or f"{func.__module__}.{func.__qualname__}"
+            self.registry[key] = func
+            func.job_name = key
+            return func
+
+        if func is not None:
+            return decorate(func)
+        return decorate
+
+    async def db(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.db_executor, functools.partial(func, *args)
+        )
+
+    def connect(self) -> sqlite3.Connection:
+        if self.connection is None:
+            connection = sqlite3.connect(
+                self.path, isolation_level=None, check_same_thread=False
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            synchronous = "FULL" if self.fsync else "OFF"
+            connection.execute(f"PRAGMA synchronous={synchronous}")
+            connection.executescript(SCHEMA)
+            columns = {row[1] for row in connection.execute("PRAGMA table_info(jobs)")}
+            for column, column_type in MIGRATIONS.items():
+                if column not in columns:
+                    connection.execute(
+                        f"ALTER TABLE jobs ADD COLUMN {column} {column_type}"
+                    )
+            self.connection = connection
+        return self.connection
+
+    def job_name(self, func) -> str:
+        if isinstance(func, str):
+            return func
+        name = getattr(func, "job_name", None)
+        if name is None:
+            raise LookupError(f"任务 {func!r} 还没有用 @queue.task 注册")
+        return name
+
+    async def enqueue(
+        self,
+        func: typing.Callable | str,
+        *args,
+        idempotency_key: str = None,
+        delay: float = 0,
+        **kwargs,
+    ) -> int:
+        """入队一个任务，等到它所在的批次提交之后返回任务 id"""
+        return await self.submit(
+            func, *args, idempotency_key=idempotency_key, delay=delay, **kwargs
+        )
+
+    def submit(
+        self,
+        func: typing.Callable | str,
+        *args,
+        idempotency_key: str = None,
+        delay: float = 0,
+        **kwargs,
+    ) -> asyncio.Future:
+        """enqueue() 的同步版本：马上放进缓冲区，返回批次提交之后得到任务 id 的 future"""
+        now = time.time()
+        payload = json.dumps([args, kwargs], ensure_ascii=False)
+        row = (self.job_name(func), payload, idempotency_key, now + delay, now)
+
+        future = asyncio.get_running_loop().create_future()
+        self.buffer.append((row, future))
+        if self.flusher is None or self.flusher.done():
+            self.flusher = asyncio.ensure_future(self.flush_soon())
+        return future
+
+    async def flush_soon(self):
+        while self.buffer:
+            if len(self.buffer) < self.batch_size:
+                await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self):
+        batch = self.buffer[: self.batch_size]
+        del self.buffer[: self.batch_size]
+        if not batch:
+            return
+
+        try:
+            ids = await self.db(self.insert, [row for row, _ in batch])
+        except Exception as exc:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+
+        for (_, future), job_id in zip(batch, ids):
+            if not future.done():
+                future.set_result(job_id)
+        self.wakeup.set()
+
+    def insert(self, rows: list[tuple]) -> list[int]:
+        connection = self.connect()
+        ids = []
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            for row in rows:
+                cursor = connection.execute(
+                    "INSERT OR IGNORE INTO jobs"
+                    " (name, payload, idempotency_key, run_at, created_at)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    row,
+                )
+                if cursor.rowcount:
+                    ids.append(cursor.lastrowid)
+                else:
+                    # idempotency_key 重复，返回已有任务的 id
+                    existing = connection.execute(
+                        "SELECT id FROM jobs WHERE idempotency_key = ?", (row[2],)
+                    ).fetchone()
+                    ids.append(existing[0])
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return ids
+
+    def claim(self) -> Job | None:
+        """领取一个到期的任务，租约过期的 running 任务（执行它的进程已经退出）也算"""
+        now = time.time()
+        row = (
+            self.connect()
+            .execute(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1,"
+                " claimed_at = ?, owner = ?"
+                " WHERE id = (SELECT id FROM jobs"
+                " WHERE (status = ? AND run_at <= ?)"
+                " OR (status = ? AND (claimed_at IS NULL OR claimed_at <= ?))"
+                " ORDER BY run_at, id LIMIT 1)"
+                " RETURNING id, name, payload, attempts",
+                (RUNNING, now, self.owner, PENDING, now, RUNNING, now - self.lease),
+            )
+            .fetchone()
+        )
+        if row is None:
+            return None
+        job_id, name, payload, attempts = row
+        args, kwargs = json.loads(payload)
+        return Job(job_id, name, args, kwargs, attempts)
+
+    def renew(self, job: Job):
+        self.connect().execute(
+            "UPDATE jobs SET claimed_at = ? WHERE id = ? AND owner = ? AND status = ?",
+            (time.time(), job.id, self.owner, RUNNING),
+        )
+
+    # complete / fail 和 renew 一样只更新自己领取的任务：租约过期之后任务可能已经
+    # 被别的实例重新领取，这时不能覆盖它的状态
+    def complete(self, job: Job):
+        self.connect().execute(
+            "UPDATE jobs SET status = ?, last_error = NULL, finished_at = ?"
+            " WHERE id = ? AND owner = ?",
+            (DONE, time.time(), job.id, self.owner),
+        )
+
+    def fail(self, job: Job, error: str):
+        now = time.time()
+        if job.attempts >= self.max_attempts:
+            status, run_at, finished_at = FAILED, now, now
+        else:
+            delay = min(self.max_backoff, self.backoff * 2 ** (job.attempts - 1))
+            status, run_at, finished_at = PENDING, now + delay, None
+        self.connect().execute(
+            "UPDATE jobs SET status = ?, run_at = ?, last_error = ?, finished_at = ?"
+            " WHERE id = ? AND owner = ?",
+            (status, run_at, error, finished_at, job.id, self.owner),
+        )
+
+    def recover(self) -> int:
+        """租约已经过期的 running 任务重新放回队列，其他进程正在执行的任务不动"""
+        cursor = self.connect().execute(
+            "UPDATE jobs SET status = ?, claimed_at = NULL, owner = NULL"
+            " WHERE status = ? AND (claimed_at IS NULL OR claimed_at <= ?)",
+            (PENDING, RUNNING, time.time() - self.lease),
+        )
+        return cursor.rowcount
+
+    def release(self) -> int:
+        """当前实例停止时还没执行完的任务放回队列，不用等租约过期"""
+        cursor = self.connect().execute(
+            "UPDATE jobs SET status = ?, claimed_at = NULL, owner = NULL"
+            " WHERE status = ? AND owner = ?",
+            (PENDING, RUNNING, self.owner),
+        )
+        return cursor.rowcount
+
+    def purge(self, older_than: float) -> int:
+        """删除 older_than 秒之前结束的 done / failed 任务，返回删除的条数"""
+        cursor = self.connect().execute(
+            "DELETE FROM jobs WHERE status IN (?, ?)"
+            " AND COALESCE(finished_at, run_at) <= ?",
+            (DONE, FAILED, time.time() - older_than),
+        )
+        return cursor.rowcount
+
+    async def purge_expired(self):
+        if self.retention is None:
+            return
+        now = time.monotonic()
+        if self.last_purge is not None and now - self.last_purge < PURGE_INTERVAL:
+            return
+        self.last_purge = now
+        purged = await self.db(self.purge, self.retention)
+        if purged:
+            logger.info("删除了 %d 个超过保留时间的已完成任务", purged)
+
+    def count_status(self) -> dict[str, int]:
+        rows = self.connect().execute(
+            "SELECT status, COUNT(*) FROM jobs GROUP BY status"
+        )
+        return dict(rows.fetchall())
+
+    async def stats(self) -> dict[str, int]:
+        counts = await self.db(self.count_status)
+        statuses = (PENDING, RUNNING, DONE, FAILED)
+        return {status: counts.get(status, 0) for status in statuses}
+
+    async def keep_alive(self, job: Job):
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            try:
+                await self.db(self.renew, job)
+            except Exception:
+                logger.exception("任务 %s (%d) 续期失败", job.name, job.id)
+
+    async def execute(self, job: Job):
+        keep_alive = asyncio.ensure_future(self.keep_alive(job))
+        try:
+            func = self.registry.get(job.name)
+            if func is None:
+                raise LookupError(f"未注册的任务 '{job.name}'")
+            if is_async_callable(func):
+                await func(*job.args, **job.kwargs)
+            elif self.executor is not None:
+                await self.executor.run(func, *job.args, **job.kwargs)
+            else:
+                await asyncio.to_thread(func, *job.args, **job.kwargs)
+        except Exception as exc:
+            logger.exception("任务 %s (%d) 第 %d 次执行失败", job.name, job.id, job.attempts)
+            await self.db(self.fail, job, repr(exc))
+        else:
+            await self.db(self.complete, job)
+        finally:
+            keep_alive.cancel()
+
+    async def work(self):
+        while not self.stopping:
+            try:
+                job = await self.db(self.claim)
+                if job is not None:
+                    await self.execute(job)
+                    continue
+                await self.purge_expired()
+            except Exception:
+                # 例如多个进程同时写入时的 "database is locked"，等一会儿再试，
+                # 没有更新状态的任务在租约过期之后会被重新领取
+                logger.exception("任务队列读写数据库失败")
+                await asyncio.sleep(self.poll_interval)
+                continue
+
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def start(self, workers: int = 4):
+        recovered = await self.db(self.recover)
+        if recovered:
+            logger.warning("重新放回队列 %d 个上次没有执行完的任务", recovered)
+        self.last_purge = None
+        await self.purge_expired()
+        self.stopping = False
+        self.workers = [asyncio.ensure_future(self.work()) for _ in range(workers)]
+
+    async def stop(self, timeout: float = None):
+        """提交缓冲区里的任务，等待正在执行的任务，超时被取消的任务放回队列"""
+        self.stopping = True
+        self.wakeup.set()
+        if self.flusher is not None:
+            await self.flusher
+
+        if self.workers:
+            _, pending = await asyncio.wait(self.workers, timeout=timeout)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*self.workers, return_exceptions=True)
+            self.workers = []
+            if pending:
+                await self.db(self.release)
+
+        if self.connection is not None:
+            await self.db(self.connection.close)
+            self.connection = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.stop()
+
+
+class DurableBackgroundTasks(BackgroundTask):
+    """
+    用法和 BackgroundTasks 一样，但任务写进 JobQueue，进程重启之后也会执行：
+
+        tasks = DurableBackgroundTasks(queue)
+        tasks.add_task(send_email, "a@example.com")
+        return Response("ok", background=tasks)
+
+    任务函数要先用 @queue.task 注册，参数必须能用 JSON 序列化。add_task 时任务
+    就进入批量写入的缓冲区，不用等响应发送完；响应之后的后台任务只等待写入完成，
+    任务本身由 JobQueue 的 worker 执行。
+    """
+
+    def __init__(self, queue: JobQueue, func: typing.Callable = None, *args, **kwargs):
+        self.queue = queue
+        self.futures: list[asyncio.Future] = []
+        super().__init__()
+        if func is not None:
+            self.add_task(func, *args, **kwargs)
+
+    def add_task(self, func: typing.Callable, *args, **kwargs):
+        self.tasks.append((func, args, kwargs))
+        self.futures.append(self.queue.submit(func, *args, **kwargs))
+
+    async def __call__(self, executor=None):
+        await asyncio.gather(*self.futures)
@@ -0,0 +1,61 @@
+import json
+import typing
+from contextvars import ContextVar
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+class JSONCodec:
+    """JSONResponse 和 Request.json 使用的编解码接口，dumps 直接输出 UTF-8 字节"""
+
+    def dumps(self, obj: typing.Any) -> bytes:
+        raise NotImplementedError()
+
+    def loads(self, data: bytes | str) -> typing.Any:
+        raise NotImplementedError()
+
+
+class StdlibJSONCodec(JSONCodec):
+    def dumps(self, obj: typing.Any) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    def loads(self, data: bytes | str) -> typing.Any:
+        return json.loads(data)
+
+
+class OrjsonCodec(JSONCodec):
+    """
+    需要安装 orjson，序列化结果本身就是 bytes。
+    默认打开 OPT_NON_STR_KEYS，和标准库一样接受 int / bool / None 之类的键。
+    """
+
+    def __init__(self, option: int = None):
+        assert orjson is not None, "使用 OrjsonCodec 需要先安装 orjson"
+        self.option = orjson.OPT_NON_STR_KEYS if option is None else option
+
+    def dumps(self, obj: typing.Any) -> bytes:
+        return orjson.dumps(obj, option=self.option)
+
+    def loads(self, data: bytes | str) -> typing.Any:
+        return orjson.loads(data)
+
+
+def default_json_codec() -> JSONCodec:
+    """安装了 orjson 时使用 orjson，否则使用标准库"""
+    if orjson is not None:
+        return OrjsonCodec()
+    return StdlibJSONCodec()
+
+
+# 当前请求所在应用的编解码器，由 Years 在处理请求时设置
+current_json_codec: ContextVar[JSONCodec | None] = ContextVar(
+    "current_json_codec", default=None
+)
+_default_codec = default_json_codec()
+
+
+def get_json_codec() -> JSONCodec:
+    return current_json_codec.get() or _default_codec
@@ -0,0 +1,263 @@
+import time
+import bisect
+import typing
+
+from years.responses import Response
+
+UNMATCHED = "<unmatched>"
+PHASE_SECONDS = "years_request_phase_seconds"
+# BoundedExecutor.stats() 里的瞬时值按 gauge 输出，只增不减的累计值按 counter 输出
+EXECUTOR_GAUGES = ("queue_depth", "active", "avg_wait", "max_wait")
+EXECUTOR_COUNTERS = ("completed", "rejected")
+
+
+def log_linear_bounds(
+    lowest: float = 1e-6, highest: float = 60.0, sub_buckets: int = 2
+) -> tuple[float, ...]:
+    """
+    HDR 风格的桶边界：每个 2 的幂次区间再线性分成 sub_buckets 份，
+    相对误差固定，从微秒到分钟都能用同一组桶。
+    """
+    bounds = []
+    magnitude = lowest
+    while magnitude < highest:
+        step = magnitude / sub_buckets
+        for idx in range(1, sub_buckets + 1):
+            bounds.append(float(f"{magnitude + step * idx:.3g}"))
+        magnitude *= 2
+    return tuple(bounds)
+
+
+DEFAULT_BOUNDS = log_linear_bounds()
+
+
+class Histogram:
+    """固定桶的直方图，桶在创建时分配好，observe 只做二分查找和计数"""
+
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: tuple[float, ...] = DEFAULT_BOUNDS):
+        self.bounds = bounds
+        # 最后一个桶对应 +Inf
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """估算分位数，返回所在桶的上界"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for idx, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return self.bounds[idx] if idx < len(self.bounds) else float("inf")
+        return float("inf")
+
+
+class RouteMetrics:
+    """
+    一条路由的指标：按方法和状态码的请求数，路由匹配、处理函数、发送响应
+    三个阶段的耗时直方图，以及正在处理的请求数。
+    路由函数用了 @singleflight 时 singleflight 是它的 SingleFlight，一起输出合并的请求数。
+    """
+
+    __slots__ = (
+        "route",
+        "statuses",
+        "match",
+        "handler",
+        "send",
+        "in_flight",
+        "singleflight",
+    )
+
+    def __init__(self, route: str, bounds: tuple[float, ...] = DEFAULT_BOUNDS):
+        self.route = route
+        self.statuses: dict[str, dict[int, int]] = {}
+        self.match = Histogram(bounds)
+        self.handler = Histogram(bounds)
+        self.send = Histogram(bounds)
+        self.in_flight = 0
+        self.singleflight = None
+
+    def count(self, method: str, status: int):
+        by_status = self.statuses.get(method)
+        if by_status is None:
+            by_status = self.statuses[method] = {}
+        by_status[status] = by_status.get(status, 0) + 1
+
+    def time_handler(self, handle: typing.Callable) -> typing.Callable:
+        """处理函数抛出异常时在这里统计请求数，正常返回时由 send_response 统计"""
+        histogram = self.handler
+
+        async def timed(request):
+            start = time.perf_counter()
+            try:
+                return await handle(request)
+            except Exception as exc:
+                self.count(request.method, getattr(exc, "status_code", 500))
+                raise
+            finally:
+                histogram.observe(time.perf_counter() - start)
+
+        return timed
+
+    async def send_response(self, response: Response, scope, receive, send):
+        start = time.perf_counter()
+        try:
+            await response(scope, receive, send)
+        finally:
+            self.send.observe(time.perf_counter() - start)
+            self.count(scope["method"], response.status_code)
+
+    async def call_app(self, app, scope, receive, send):
+        """挂载的 ASGI 应用分不出处理和发送，整个调用记在 handler 阶段"""
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        self.in_flight += 1
+        try:
+            await app(scope, receive, send_wrapper)
+        finally:
+            self.in_flight -= 1
+            self.handler.observe(time.perf_counter() - start)
+            self.count(scope["method"], status)
+
+
+def escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metrics:
+    """
+    路由级别的指标注册表，传给 Years(metrics=...) 之后打开统计，
+    不传时请求路径上只多两次 None 判断。
+    指标按路由模板（包括挂载前缀）区分，匹配不上的请求记在 "<unmatched>" 下面。
+    """
+
+    def __init__(self, bounds: tuple[float, ...] = DEFAULT_BOUNDS):
+        self.bounds = bounds
+        self.routes: dict[str, RouteMetrics] = {}
+        self.in_flight = 0
+
+    def route(self, route: str) -> RouteMetrics:
+        metrics = self.routes.get(route)
+        if metrics is None:
+            metrics = self.routes[route] = RouteMetrics(route, self.bounds)
+        return metrics
+
+    def render(self, app=None) -> str:
+        """Prometheus 文本格式，app 是 Years 时一起输出线程池和后台任务的状态"""
+        lines = [
+            "# HELP years_requests_total 按路由、方法和状态码统计的请求数",
+            "# TYPE years_requests_total counter",
+        ]
+        for metrics in self.routes.values():
+            route = escape_label(metrics.route)
+            for method, by_status in metrics.statuses.items():
+                for status, count in by_status.items():
+                    labels = f'route="{route}",method="{method}",status="{status}"'
+                    lines.append(f"years_requests_total{{{labels}}} {count}")
+
+        lines += [
+            f"# HELP {PHASE_SECONDS} 路由匹配、处理函数、发送响应的耗时",
+            f"# TYPE {PHASE_SECONDS} histogram",
+        ]
+        le = [repr(bound) for bound in self.bounds] + ["+Inf"]
+        for metrics in self.routes.values():
+            route = escape_label(metrics.route)
+            for phase in ("match", "handler", "send"):
+                histogram: Histogram = getattr(metrics, phase)
+                if not histogram.count:
+                    continue
+                labels = f'route="{route}",phase="{phase}"'
+                cumulative = 0
+                for bound, count in zip(le, histogram.counts):
+                    cumulative += count
+                    bucket = f'{labels},le="{bound}"'
+                    lines.append(f"{PHASE_SECONDS}_bucket{{{bucket}}} {cumulative}")
+                lines.append(f"{PHASE_SECONDS}_sum{{{labels}}} {histogram.sum}")
+                lines.append(f"{PHASE_SECONDS}_count{{{labels}}} {histogram.count}")
+
+        # 总数单独一个指标，按路由的 years_requests_in_flight 求和时不会重复计算
+        lines += [
+            "# HELP years_app_requests_in_flight 整个应用正在处理的请求数",
+            "# TYPE years_app_requests_in_flight gauge",
+            f"years_app_requests_in_flight {self.in_flight}",
+            "# HELP years_requests_in_flight 每条路由正在处理的请求数",
+            "# TYPE years_requests_in_flight gauge",
+        ]
+        for metrics in self.routes.values():
+            route = escape_label(metrics.route)
+            in_flight = metrics.in_flight
+            lines.append(f'years_requests_in_flight{{route="{route}"}} {in_flight}')
+
+        flights = [
+            (escape_label(metrics.route), metrics.singleflight.stats())
+            for metrics in self.routes.values()
+            if metrics.singleflight is not None
+        ]
+        descriptions = {
+            "coalesced": "@singleflight 合并到别的请求上、没有执行路由函数的请求数",
+            "executed": "@singleflight 真正执行路由函数的次数",
+        }
+        for key, description in descriptions.items() if flights else ():
+            metric = f"years_singleflight_{key}_total"
+            lines += [f"# HELP {metric} {description}", f"# TYPE {metric} counter"]
+            for route, stats in flights:
+                lines.append(f'{metric}{{route="{route}"}} {stats[key]}')
+
+        lines += self.render_app(app)
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def render_app(app) -> list[str]:
+        lines = []
+        executors = [
+            (name, getattr(app, f"{name}_executor", None))
+            for name in ("endpoint", "background")
+        ]
+        stats = {name: executor.stats() for name, executor in executors if executor}
+        metric_types = [(key, key, "gauge") for key in EXECUTOR_GAUGES]
+        metric_types += [(key, f"{key}_total", "counter") for key in EXECUTOR_COUNTERS]
+        for key, name, metric_type in metric_types if stats else ():
+            metric = f"years_executor_{name}"
+            lines.append(f"# TYPE {metric} {metric_type}")
+            for executor, values in stats.items():
+                lines.append(f'{metric}{{executor="{executor}"}} {values[key]}')
+
+        runner = getattr(app, "background_runner", None)
+        if runner is not None:
+            lines += [
+                "# HELP years_background_tasks 还没有完成的后台任务数",
+                "# TYPE years_background_tasks gauge",
+                f"years_background_tasks {len(runner)}",
+            ]
+        return lines
+
+
+class MetricsApp:
+    """可以挂载的指标接口：app.mount("/metrics", MetricsApp(metrics))"""
+
+    media_type = "text/plain; version=0.0.4"
+
+    def __init__(self, metrics: Metrics):
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        content = self.metrics.render(scope.get("app"))
+        response = Response(content, media_type=self.media_type)
+        await response(scope, receive, send)
@@ -0,0 +1,23 @@
+import typing
+
+
+class Middleware:
+    """
+    记录中间件类和它的参数，真正的实例在应用第一次收到请求时才创建：
+
+        app = Years(middleware=[Middleware(SomeMiddleware, option=1)])
+    """
+
+    def __init__(self, cls: typing.Callable, *args, **kwargs):
+        self.cls = cls
+        self.args = args
+        self.kwargs = kwargs
+
+    def __iter__(self):
+        return iter((self.cls, self.args, self.kwargs))
+
+    def __repr__(self):
+        name = getattr(self.cls, "__name__", repr(self.cls))
+        options = [repr(arg) for arg in self.args]
+        options += [f"{key}={value!r}" for key, value in self.kwargs.items()]
+        return f"Middleware({', '.join([name, *options])})"
@@ -0,0 +1,268 @@
+import time
+import typing
+from collections import OrderedDict
+from urllib.parse import parse_qsl, urlencode
+
+from years.datastructures import Headers
+from years.responses import NOT_MODIFIED_HEADERS, is_not_modified
+from years.singleflight import CREDENTIAL_HEADERS, SingleFlight
+
+# 默认只缓存这些状态码的响应
+CACHEABLE_STATUS = frozenset([200, 203, 300, 301, 308, 404, 410])
+
+
+def parse_cache_control(value: str) -> dict[str, str | None]:
+    """"max-age=60, no-cache" -> {"max-age": "60", "no-cache": None}"""
+    directives = {}
+    for item in value.split(","):
+        name, _, arg = item.strip().partition("=")
+        if name:
+            directives[name.lower()] = arg.strip('"') if arg else None
+    return directives
+
+
+class CachedResponse(typing.NamedTuple):
+    status: int
+    headers: list[tuple[bytes, bytes]]
+    body: bytes
+    # 响应 Vary 里的请求头（小写）以及生成这个响应时请求里对应的值
+    vary: tuple[str, ...]
+    vary_values: tuple[str | None, ...]
+    created: float
+
+
+class CacheStore:
+    """
+    缓存存储的接口，值可以是 CachedResponse 或者 Vary 头名字组成的元组。
+    要换成共享内存或者文件实现时继承这个类，实现下面三个方法即可。
+    """
+
+    async def get(self, key: str):
+        raise NotImplementedError()
+
+    async def set(self, key: str, value, ttl: float):
+        raise NotImplementedError()
+
+    async def delete(self, key: str):
+        raise NotImplementedError()
+
+
+class MemoryCacheStore(CacheStore):
+    """进程内的 LRU 缓存，条目数不超过 maxsize，响应体总大小不超过 max_bytes，过期的条目读取时删除"""
+
+    def __init__(self, maxsize: int = 1024, max_bytes: int = 64 * 1024 * 1024):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.data: OrderedDict[str, tuple[float, typing.Any, int]] = OrderedDict()
+
+    def __len__(self):
+        return len(self.data)
+
+    async def get(self, key: str):
+        item = self.data.get(key)
+        if item is None:
+            return None
+
+        expires, value, _ = item
+        if expires <= time.monotonic():
+            await self.delete(key)
+            return None
+
+        self.data.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value, ttl: float):
+        size = len(value.body) if isinstance(value, CachedResponse) else 0
+        if size > self.max_bytes:
+            return
+
+        await self.delete(key)
+        self.data[key] = (time.monotonic() + ttl, value, size)
+        self.size += size
+        while len(self.data) > self.maxsize or self.size > self.max_bytes:
+            _, (_, _, evicted) = self.data.popitem(last=False)
+            self.size -= evicted
+
+    async def delete(self, key: str):
+        item = self.data.pop(key, None)
+        if item is not None:
+            self.size -= item[2]
+
+
+class CacheMiddleware:
+    """
+    缓存完整的响应（状态码、响应头和响应体），缓存键由方法、路径、
+    选定的查询参数以及响应 Vary 里列出的请求头组成。
+
+    query_params 为 None 时使用全部查询参数（排序之后），给出列表时只使用这些参数。
+    请求带 Cache-Control: no-store 或者 bypass_headers 里的请求头（默认是
+    Authorization 和 Cookie，响应可能是按用户生成的）时不经过缓存，no-cache /
+    max-age=0 时跳过读取、重新生成并更新缓存。响应的 no-store / no-cache / private、
+    Set-Cookie 和 Vary: * 不会缓存，max-age / s-maxage 覆盖默认的 ttl。
+
+    同一个键同时未命中时只有第一个请求执行处理函数，其余请求等它完成之后直接使用结果，
+    它抛出的异常也会交给这些请求。
+    """
+
+    def __init__(
+        self,
+        app,
+        store: CacheStore = None,
+        ttl: float = 60,
+        methods: typing.Iterable[str] = ("GET", "HEAD"),
+        query_params: typing.Iterable[str] = None,
+        max_body_size: int = 1024 * 1024,
+        bypass_headers: typing.Iterable[str] = CREDENTIAL_HEADERS,
+    ):
+        self.app = app
+        self.store = store or MemoryCacheStore()
+        self.ttl = ttl
+        self.methods = frozenset(methods)
+        self.query_params = None if query_params is None else frozenset(query_params)
+        self.max_body_size = max_body_size
+        self.bypass_headers = tuple(name.lower() for name in bypass_headers)
+        # 同一个键的并发未命中只执行一次，统计在 self.flights.stats()
+        self.flights = SingleFlight()
+
+    def base_key(self, scope) -> str:
+        params = parse_qsl(scope.get("query_string", b"").decode("latin-1"), True)
+        if self.query_params is not None:
+            params = [item for item in params if item[0] in self.query_params]
+        return f"{scope['method']} {scope['path']}?{urlencode(sorted(params))}"
+
+    @staticmethod
+    def vary_values(vary: tuple[str, ...], headers: Headers):
+        return tuple(headers.get(name) for name in vary)
+
+    @staticmethod
+    def cache_key(base: str, vary: tuple[str, ...], values: tuple) -> str:
+        if not vary:
+            return base
+        return base + "|" + "|".join(f"{k}={v}" for k, v in zip(vary, values))
+
+    def response_ttl(self, status: int, headers: Headers) -> float | None:
+        """返回这个响应可以缓存的秒数，不能缓存时返回 None"""
+        if status not in CACHEABLE_STATUS or "set-cookie" in headers:
+            return None
+
+        directives = parse_cache_control(headers.get("cache-control", ""))
+        if directives.keys() & {"no-store", "no-cache", "private"}:
+            return None
+        if headers.get("vary", "").strip() == "*":
+            return None
+
+        for name in ("s-maxage", "max-age"):
+            if name in directives:
+                try:
+                    ttl = int(directives[name])
+                except (TypeError, ValueError):
+                    return None
+                return ttl if ttl > 0 else None
+        return self.ttl
+
+    async def send_cached(self, entry: CachedResponse, headers: Headers, send):
+        response_headers = Headers(raw=entry.headers)
+        if is_not_modified(response_headers, headers):
+            raw = [item for item in entry.headers if item[0] in NOT_MODIFIED_HEADERS]
+            await send({"type": "http.response.start", "status": 304, "headers": raw})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        age = str(int(time.time() - entry.created)).encode()
+        raw = [*entry.headers, (b"age", age), (b"x-cache", b"HIT")]
+        start = {"type": "http.response.start", "status": entry.status, "headers": raw}
+        await send(start)
+        await send({"type": "http.response.body", "body": entry.body})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in self.methods:
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(raw=scope.get("headers"))
+        directives = parse_cache_control(headers.get("cache-control", ""))
+        bypass = any(name in headers for name in self.bypass_headers)
+        if bypass or "no-store" in directives:
+            await self.app(scope, receive, send)
+            return
+
+        base = self.base_key(scope)
+        vary = await self.store.get("vary:" + base) or ()
+        key = self.cache_key(base, vary, self.vary_values(vary, headers))
+
+        if "no-cache" in directives or directives.get("max-age") == "0":
+            await self.fill(scope, receive, send, base, headers)
+            return
+
+        entry = await self.store.get(key)
+        if entry is not None:
+            await self.send_cached(entry, headers, send)
+            return
+
+        entry, shared = await self.flights.do(
+            key, self.fill, scope, receive, send, base, headers
+        )
+        if not shared:
+            return
+
+        # 响应不能缓存，或者按 Vary 之后和当前请求不匹配时自己执行
+        if entry is None or entry.vary_values != self.vary_values(entry.vary, headers):
+            await self.app(scope, receive, send)
+        else:
+            await self.send_cached(entry, headers, send)
+
+    async def fill(self, scope, receive, send, base: str, headers: Headers):
+        """执行处理函数并把响应写进缓存，返回缓存的条目，不能缓存时返回 None"""
+        start = None
+        ttl = None
+        chunks = []
+        size = 0
+        complete = False
+
+        async def capture(message):
+            nonlocal start, ttl, size, complete
+            if message["type"] == "http.response.start":
+                start = message
+                ttl = self.response_ttl(
+                    message["status"], Headers(raw=message.get("headers", []))
+                )
+                raw = [*message.get("headers", []), (b"x-cache", b"MISS")]
+                message = {**message, "headers": raw}
+            elif message["type"] == "http.response.body" and ttl is not None:
+                body = message.get("body", b"")
+                size += len(body)
+                if size > self.max_body_size:
+                    ttl = None
+                    chunks.clear()
+                else:
+                    chunks.append(body)
+                    complete = not message.get("more_body", False)
+            await send(message)
+
+        await self.app(scope, receive, capture)
+        if ttl is None or not complete:
+            return None
+
+        raw = list(start.get("headers", []))
+        response_headers = Headers(raw=raw)
+        vary = tuple(
+            sorted(
+                {
+                    name.strip().lower()
+                    for value in response_headers.getlist("vary")
+                    for name in value.split(",")
+                    if name.strip()
+                }
+            )
+        )
+        values = self.vary_values(vary, headers)
+        body = b"".join(chunks)
+        entry = CachedResponse(start["status"], raw, body, vary, values, time.time())
+
+        await self.store.set(self.cache_key(base, vary, values), entry, ttl)
+        if vary:
+            await self.store.set("vary:" + base, vary, ttl)
+        else:
+            await self.store.delete("vary:" + base)
+        return entry
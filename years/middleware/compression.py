@@ -0,0 +1,238 @@
+import zlib
+import asyncio
+
+from years.datastructures import Headers, MutableHeaders, choose_encoding
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+try:
+    from compression import zstd
+except ImportError:  # pragma: no cover
+    zstd = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+
+# 本身已经压缩过的类型，再压缩只会浪费 CPU
+DEFAULT_EXCLUDED_MEDIA_TYPES = (
+    "image/",
+    "video/",
+    "audio/",
+    "font/woff",
+    "application/zip",
+    "application/gzip",
+    "application/x-gzip",
+    "application/zstd",
+    "application/x-7z-compressed",
+    "application/x-rar-compressed",
+    "text/event-stream",
+)
+
+
+class GzipCompressor:
+    def __init__(self, level: int):
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        # 同步刷新，流式响应的每一块都能马上发给客户端
+        return self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self.compressor.flush()
+
+
+class BrotliCompressor:
+    def __init__(self, quality: int):
+        self.compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self.compressor.process(data) + self.compressor.flush()
+
+    def finish(self) -> bytes:
+        return self.compressor.finish()
+
+
+class ZstdCompressor:
+    def __init__(self, level: int):
+        if zstd is not None:
+            self.compressor = zstd.ZstdCompressor(level=level)
+            self.flush_block = zstd.ZstdCompressor.FLUSH_BLOCK
+        else:
+            self.compressor = zstandard.ZstdCompressor(level=level).compressobj()
+            self.flush_block = zstandard.COMPRESSOBJ_FLUSH_BLOCK
+
+    def compress(self, data: bytes) -> bytes:
+        if zstd is not None:
+            return self.compressor.compress(data, mode=self.flush_block)
+        return self.compressor.compress(data) + self.compressor.flush(self.flush_block)
+
+    def finish(self) -> bytes:
+        return self.compressor.flush()
+
+
+def available_encodings() -> list[str]:
+    """按优先级排列、当前环境可用的编码"""
+    encodings = []
+    if brotli is not None:
+        encodings.append("br")
+    if zstd is not None or zstandard is not None:
+        encodings.append("zstd")
+    encodings.append("gzip")
+    return encodings
+
+
+class CompressionMiddleware:
+    """
+    根据 Accept-Encoding 选择 br / zstd / gzip 压缩响应：
+
+        app.add_middleware(CompressionMiddleware, minimum_size=500)
+
+    - 一次性发送且小于 minimum_size 的响应、已经压缩过的类型、已经带有
+      Content-Encoding 的响应都原样发送；
+    - 流式响应逐块压缩并刷新，不会先缓存整个响应；
+    - 单块数据不小于 offload_size 时放到线程里压缩，避免阻塞事件循环，
+      offload_size 为 None 时全部在事件循环里压缩。
+    """
+
+    def __init__(
+        self,
+        app,
+        minimum_size: int = 500,
+        encodings: list[str] = None,
+        excluded_media_types: tuple[str, ...] = DEFAULT_EXCLUDED_MEDIA_TYPES,
+        gzip_level: int = 6,
+        brotli_quality: int = 4,
+        zstd_level: int = 3,
+        offload_size: int | None = 64 * 1024,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        supported = available_encodings()
+        if encodings is None:
+            encodings = supported
+        self.encodings = [encoding for encoding in encodings if encoding in supported]
+        self.excluded_media_types = tuple(excluded_media_types)
+        self.levels = {"gzip": gzip_level, "br": brotli_quality, "zstd": zstd_level}
+        self.offload_size = offload_size
+
+    def create_compressor(self, encoding: str):
+        level = self.levels[encoding]
+        if encoding == "br":
+            return BrotliCompressor(level)
+        if encoding == "zstd":
+            return ZstdCompressor(level)
+        return GzipCompressor(level)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = Headers(raw=scope.get("headers")).get("accept-encoding", "")
+        encoding = choose_encoding(accept_encoding, self.encodings)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = CompressionResponder(self, encoding, send)
+        await self.app(scope, receive, responder.send)
+
+
+class CompressionResponder:
+    def __init__(self, middleware: CompressionMiddleware, encoding: str, send):
+        self.middleware = middleware
+        self.encoding = encoding
+        self.downstream = send
+        self.start_message = None
+        # None 表示还没决定，True 压缩，False 原样发送
+        self.compressing = None
+        self.compressor = None
+
+    def should_compress(self, headers: Headers) -> bool:
+        # 部分响应的 Content-Range 按原始字节计算，压缩之后就对不上了
+        if self.start_message["status"] in (204, 206, 304, 416):
+            return False
+        if "content-encoding" in headers or "content-range" in headers:
+            return False
+        content_type = headers.get("content-type", "")
+        return not content_type.startswith(self.middleware.excluded_media_types)
+
+    async def compress(self, data: bytes) -> bytes:
+        offload_size = self.middleware.offload_size
+        if offload_size is not None and len(data) >= offload_size:
+            return await asyncio.to_thread(self.compressor.compress, data)
+        return self.compressor.compress(data)
+
+    async def send(self, message):
+        message_type = message["type"]
+        if message_type == "http.response.start":
+            # 先留着，看到第一块数据之后才知道要不要压缩
+            self.start_message = message
+            return
+
+        if self.compressing is None:
+            await self.start(message)
+            return
+
+        if not self.compressing:
+            await self.downstream(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        data = await self.compress(body) if body else b""
+        if not more_body:
+            data += self.compressor.finish()
+        await self.downstream(
+            {"type": "http.response.body", "body": data, "more_body": more_body}
+        )
+
+    async def start(self, message):
+        headers = MutableHeaders(raw=list(self.start_message["headers"]))
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        # pathsend / zerocopy 这类消息由服务器直接发送文件，不能压缩
+        if message["type"] != "http.response.body" or not self.should_compress(headers):
+            self.compressing = False
+        elif not more_body and len(body) < self.middleware.minimum_size:
+            self.compressing = False
+        else:
+            self.compressing = True
+
+        if not self.compressing:
+            await self.downstream(self.start_message)
+            await self.downstream(message)
+            return
+
+        self.compressor = self.middleware.create_compressor(self.encoding)
+        headers["Content-Encoding"] = self.encoding
+        # 压缩之后的字节不能再按范围请求
+        del headers["Accept-Ranges"]
+        vary = headers.get("vary")
+        if vary is None:
+            headers["Vary"] = "Accept-Encoding"
+        elif "accept-encoding" not in vary.lower():
+            headers["Vary"] = f"{vary}, Accept-Encoding"
+
+        data = await self.compress(body) if body else b""
+        if more_body:
+            # 流式响应压缩之后的长度未知
+            del headers["Content-Length"]
+        else:
+            data += self.compressor.finish()
+            headers["Content-Length"] = str(len(data))
+
+        await self.downstream({**self.start_message, "headers": headers.raw})
+        await self.downstream(
+            {"type": "http.response.body", "body": data, "more_body": more_body}
+        )
@@ -1,22 +1,34 @@
-import json
+import enum
+import asyncio
+from tempfile import SpooledTemporaryFile
 from urllib.parse import parse_qs
 from collections.abc import Mapping
-from years.datastructures import Headers, QueryParams, URL, Cookie
+from years.datastructures import Headers, QueryParams, URL, Cookie, FormData
+from years.formparsers import MultiPartParser, parse_options_header
+from years.jsoncodec import get_json_codec
 
 
 class ClientDisconnect(Exception):
     """客户端断开连接异常"""
 
 
+class RequestTooLarge(Exception):
+    """请求体超过了 max_body_size，路由会返回 413"""
+
+    def __init__(self, max_body_size: int):
+        self.max_body_size = max_body_size
+        super().__init__(f"请求体超过了 {max_body_size} 字节")
+
+
 class State:
     """用户自己设置的状态"""
 
 
-class Request(Mapping):
-    def __init__(self, scope, receive=None):
+class HTTPConnection(Mapping):
+    """Request 和 WebSocket 共用的部分，都只依赖 scope"""
+
+    def __init__(self, scope):
         self._scope = scope
-        self._receive = receive
-        self.customed = False
 
     def __getitem__(self, key):
         return self._scope[key]
@@ -27,10 +39,6 @@ class Request(Mapping):
     def __len__(self):
         return len(self._scope)
 
-    @property
-    def method(self):
-        return self["method"]
-
     @property
     def path_params(self):
         return self._scope["path_params"]
@@ -68,11 +76,33 @@ class Request(Mapping):
             self._headers = Headers(raw=self._scope["headers"])
         return self._headers
 
+
+class Request(HTTPConnection):
+    def __init__(self, scope, receive=None, max_body_size: int = None):
+        super().__init__(scope)
+        self._receive = receive
+        self.customed = False
+        # 路由上没有单独设置时，使用应用上的 max_body_size
+        if max_body_size is None and "app" in scope:
+            max_body_size = getattr(scope["app"], "max_body_size", None)
+        self.max_body_size = max_body_size
+
+    @property
+    def method(self):
+        return self["method"]
+
     async def stream(self):
         if hasattr(self, "_body"):
             yield self._body
             return
 
+        if hasattr(self, "_body_file"):
+            await asyncio.to_thread(self._body_file.seek, 0)
+            while chunk := await asyncio.to_thread(self._body_file.read, 64 * 1024):
+                yield chunk
+            await asyncio.to_thread(self._body_file.seek, 0)
+            return
+
         if self.customed:
             raise RuntimeError("该请求体的数据已被消费")
 
@@ -81,11 +111,25 @@ class Request(Mapping):
 
         self.customed = True
 
+        max_body_size = self.max_body_size
+        if max_body_size is not None:
+            # 声明的长度已经超过限制时，不用等数据传过来
+            content_length = self.headers.get("content-length")
+            if content_length and content_length.isdigit():
+                if int(content_length) > max_body_size:
+                    raise RequestTooLarge(max_body_size)
+
+        received = 0
         while True:
             current = await self._receive()
             if current["type"] == "http.request":
-                yield current["body"]
-                if not current["more_body"]:
+                chunk = current.get("body", b"")
+                if max_body_size is not None:
+                    received += len(chunk)
+                    if received > max_body_size:
+                        raise RequestTooLarge(max_body_size)
+                yield chunk
+                if not current.get("more_body", False):
                     break
 
             if current["type"] == "http.disconnect":
@@ -93,21 +137,197 @@ class Request(Mapping):
 
     async def body(self) -> bytes:
         if not hasattr(self, "_body"):
-            _body = b""
+            # 先收集所有块再一次性拼接，避免 += 带来的平方级复制
+            chunks = []
             async for chunk in self.stream():
                 if isinstance(chunk, bytes):
-                    _body += chunk
+                    chunks.append(chunk)
                 else:
-                    _body += chunk.encode()
+                    chunks.append(chunk.encode())
 
-            self._body = _body
+            self._body = b"".join(chunks)
         return self._body
 
-    async def form(self):
+    async def spooled_body(self, max_memory: int = 1024 * 1024):
+        """
+        把请求体写进 SpooledTemporaryFile，超过 max_memory 之后落到磁盘上，
+        适合不想把大请求体放在内存里的场景。返回的文件已经回到开头。
+        """
+        if not hasattr(self, "_body_file"):
+            file = SpooledTemporaryFile(max_size=max_memory)
+            async for chunk in self.stream():
+                if isinstance(chunk, str):
+                    chunk = chunk.encode()
+                if file._rolled:
+                    await asyncio.to_thread(file.write, chunk)
+                else:
+                    file.write(chunk)
+            file.seek(0)
+            self._body_file = file
+        return self._body_file
+
+    async def iter_form(self, **limits):
+        """
+        按到达顺序逐个产出表单字段。multipart 表单直接从 stream() 增量解析，
+        文件字段是 UploadFile；limits 会传给 MultiPartParser，例如 max_parts、
+        max_field_size、max_file_size、max_size。
+        """
+        content_type, _ = parse_options_header(self.headers.get("content-type", ""))
+        if content_type == "multipart/form-data":
+            parser = MultiPartParser(self.headers, self.stream(), **limits)
+            async for item in parser.parse():
+                yield item
+            return
+
         raw_data = await self.body()
-        data = parse_qs(raw_data)
-        return {k.decode(): v[-1].decode() for k, v in data.items()}
+        for key, values in parse_qs(raw_data).items():
+            for value in values:
+                yield key.decode(), value.decode()
+
+    async def form(self, **limits) -> FormData:
+        if not hasattr(self, "_form"):
+            self._form = FormData([item async for item in self.iter_form(**limits)])
+        return self._form
 
     async def json(self):
         raw_data = await self.body()
-        return json.loads(raw_data)
+        app = self._scope.get("app")
+        codec = getattr(app, "json_codec", None) or get_json_codec()
+        return codec.loads(raw_data)
+
+
+class WebSocketState(enum.Enum):
+    CONNECTING = 0
+    CONNECTED = 1
+    DISCONNECTED = 2
+
+
+class WebSocketDisconnect(Exception):
+    """客户端断开了 WebSocket 连接，路由会把它当作会话正常结束"""
+
+    def __init__(self, code: int = 1000, reason: str = None):
+        self.code = code
+        self.reason = reason or ""
+        super().__init__(f"WebSocket 连接已断开，code: {code}")
+
+
+class WebSocket(HTTPConnection):
+    """
+    WebSocket 会话，和 Request 一样直接包着 scope，不额外起任务或者缓冲区，
+    空闲连接只占一个挂起的 receive() 调用。
+
+    async for message in websocket 会逐条产出文本或字节消息，直到客户端断开。
+    """
+
+    def __init__(self, scope, receive, send):
+        assert scope["type"] == "websocket", "WebSocket 只能用于 websocket 连接"
+        super().__init__(scope)
+        self._receive = receive
+        self._send = send
+        self.client_state = WebSocketState.CONNECTING
+        self.application_state = WebSocketState.CONNECTING
+
+    async def receive(self) -> dict:
+        if self.client_state is WebSocketState.DISCONNECTED:
+            raise RuntimeError("WebSocket 连接已经断开，不能再接收消息")
+
+        message = await self._receive()
+        message_type = message["type"]
+        if self.client_state is WebSocketState.CONNECTING:
+            assert message_type == "websocket.connect", f"未预期的消息 {message_type}"
+            self.client_state = WebSocketState.CONNECTED
+        elif message_type == "websocket.disconnect":
+            self.client_state = WebSocketState.DISCONNECTED
+        return message
+
+    async def send(self, message: dict):
+        if self.application_state is WebSocketState.DISCONNECTED:
+            raise RuntimeError("WebSocket 连接已经关闭，不能再发送消息")
+
+        message_type = message["type"]
+        if self.application_state is WebSocketState.CONNECTING:
+            assert message_type in (
+                "websocket.accept",
+                "websocket.close",
+            ), f"握手完成之前不能发送 {message_type}"
+            if message_type == "websocket.accept":
+                self.application_state = WebSocketState.CONNECTED
+            else:
+                self.application_state = WebSocketState.DISCONNECTED
+        elif message_type == "websocket.close":
+            self.application_state = WebSocketState.DISCONNECTED
+        await self._send(message)
+
+    async def accept(self, subprotocol: str = None, headers=None):
+        if self.client_state is WebSocketState.CONNECTING:
+            # 先收下 websocket.connect，再回复握手
+            await self.receive()
+
+        message = {"type": "websocket.accept", "subprotocol": subprotocol}
+        if headers:
+            message["headers"] = [
+                (key.lower().encode("latin-1"), value.encode("latin-1"))
+                for key, value in dict(headers).items()
+            ]
+        await self.send(message)
+
+    async def receive_message(self) -> dict:
+        if self.application_state is not WebSocketState.CONNECTED:
+            raise RuntimeError("WebSocket 还没有 accept")
+
+        message = await self.receive()
+        if message["type"] == "websocket.disconnect":
+            raise WebSocketDisconnect(message.get("code", 1000), message.get("reason"))
+        return message
+
+    async def receive_text(self) -> str:
+        message = await self.receive_message()
+        if message.get("text") is not None:
+            return message["text"]
+        return message["bytes"].decode()
+
+    async def receive_bytes(self) -> bytes:
+        message = await self.receive_message()
+        if message.get("bytes") is not None:
+            return message["bytes"]
+        return message["text"].encode()
+
+    async def receive_json(self):
+        message = await self.receive_message()
+        data = message.get("text")
+        if data is None:
+            data = message["bytes"]
+        app = self._scope.get("app")
+        codec = getattr(app, "json_codec", None) or get_json_codec()
+        return codec.loads(data)
+
+    async def send_text(self, data: str):
+        await self.send({"type": "websocket.send", "text": data})
+
+    async def send_bytes(self, data: bytes):
+        await self.send({"type": "websocket.send", "bytes": data})
+
+    async def send_json(self, data, mode: str = "text"):
+        assert mode in ("text", "binary"), "mode 只能是 text 或 binary"
+        app = self._scope.get("app")
+        codec = getattr(app, "json_codec", None) or get_json_codec()
+        raw = codec.dumps(data)
+        if mode == "text":
+            await self.send_text(raw.decode())
+        else:
+            await self.send_bytes(raw)
+
+    async def close(self, code: int = 1000, reason: str = None):
+        await self.send({"type": "websocket.close", "code": code, "reason": reason or ""})
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            message = await self.receive_message()
+        except WebSocketDisconnect:
+            raise StopAsyncIteration
+        if message.get("text") is not None:
+            return message["text"]
+        return message["bytes"]
@@ -1,11 +1,52 @@
-import json
+import os
+import stat
+import asyncio
 import hashlib
+import secrets
 import aiofiles
+import itertools
+import typing
 import mimetypes
-import pathlib
-from email.utils import formatdate
-
-from years.datastructures import MutableHeaders
+from collections import OrderedDict
+from collections.abc import Mapping
+from email.utils import formatdate, parsedate_to_datetime
+
+from years.datastructures import Headers, MutableHeaders
+from years.jsoncodec import JSONCodec, get_json_codec
+
+# 304 响应只保留这些头，其余和实体相关的头（Content-Length 等）都要去掉
+NOT_MODIFIED_HEADERS = frozenset(
+    [b"cache-control", b"content-location", b"date", b"etag", b"expires", b"vary"]
+)
+
+
+def is_not_modified(response_headers: Headers, request_headers: Headers) -> bool:
+    """
+    根据请求里的 If-None-Match / If-Modified-Since 判断是否可以返回 304。
+    同时存在时以 If-None-Match 为准，ETag 使用弱比较。
+    """
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match is not None:
+        etag = response_headers.get("etag")
+        if etag is None:
+            return False
+        if if_none_match.strip() == "*":
+            return True
+        etag = etag.removeprefix("W/")
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return etag in tags
+
+    if_modified_since = request_headers.get("if-modified-since")
+    last_modified = response_headers.get("last-modified")
+    if if_modified_since is None or last_modified is None:
+        return False
+
+    try:
+        return parsedate_to_datetime(last_modified) <= parsedate_to_datetime(
+            if_modified_since
+        )
+    except (TypeError, ValueError):
+        return False
 
 
 class Response:
@@ -24,17 +65,28 @@ class Response:
         if media_type:
             self.media_type = media_type
         self.background = background
+        # 只在构造时渲染一次，之后发送或者被中间件读取都直接使用 body
+        self.body = self.render(content)
 
         # 实例化 headers 要放到上面，因为 init_headers 方法有可能会被重载
         self.headers = MutableHeaders(headers)
         self.init_headers()
 
+    def render(self, content) -> bytes:
+        if content is None:
+            return b""
+        if isinstance(content, bytes):
+            return content
+        if isinstance(content, (bytearray, memoryview)):
+            return bytes(content)
+        return str(content).encode("utf-8")
+
     def init_headers(self):
         if self.media_type:
             self.headers["Content-Type"] = f"{self.media_type}; charset=utf-8"
 
-        if hasattr(self, "content"):
-            self.headers["Content-Length"] = str(len(self.content))
+        if hasattr(self, "body"):
+            self.headers["Content-Length"] = str(len(self.body))
 
     def set_cookie(self, key, value):
         self.headers["Set-Cookie"] = f"{key}={value}"
@@ -42,7 +94,43 @@ class Response:
     def delete_cookie(self, key):
         del self.headers["Set-Cookie"]
 
+    def is_not_modified(self, scope) -> bool:
+        if self.status_code != 200 or scope.get("method") not in ("GET", "HEAD"):
+            return False
+
+        # 响应本身没有校验器时不用解析请求头
+        if "etag" not in self.headers and "last-modified" not in self.headers:
+            return False
+
+        return is_not_modified(self.headers, Headers(raw=scope.get("headers")))
+
+    async def run_background(self, scope):
+        """在应用里时交给应用的后台调度器，响应马上结束；单独使用时直接执行"""
+        if self.background:
+            app = scope.get("app")
+            executor = getattr(app, "background_executor", None)
+            root_app = scope.get("root_app", app)
+            runner = getattr(root_app, "background_runner", None)
+            if runner is not None:
+                runner.submit(self.background, executor)
+            else:
+                await self.background(executor)
+
+    async def send_not_modified(self, scope, send):
+        headers = [
+            (key, value)
+            for key, value in self.headers.raw
+            if key in NOT_MODIFIED_HEADERS
+        ]
+        await send({"type": "http.response.start", "status": 304, "headers": headers})
+        await send({"type": "http.response.body", "body": b""})
+        await self.run_background(scope)
+
     async def __call__(self, scope, receive, send):
+        if self.is_not_modified(scope):
+            await self.send_not_modified(scope, send)
+            return
+
         await send(
             {
                 "type": "http.response.start",
@@ -51,14 +139,8 @@ class Response:
             }
         )
 
-        if isinstance(self.content, bytes):
-            body = self.content
-        else:
-            body = self.content.encode("utf-8")
-
-        await send({"type": "http.response.body", "body": body})
-        if self.background:
-            await self.background()
+        await send({"type": "http.response.body", "body": self.body})
+        await self.run_background(scope)
 
 
 class HTMLResponse(Response):
@@ -70,14 +152,62 @@ class PlainTextResponse(Response):
 
 
 class JSONResponse(Response):
+    """
+    构造时就用编解码器直接渲染成 bytes，不再经过 str -> bytes 的转换。
+    没有指定 codec 时使用当前应用的 Years(json_codec=...)，再没有就用默认的。
+    """
+
     media_type = "application/json"
 
-    async def __call__(self, scope, receive, send):
-        self.content = json.dumps(dict(self.content), ensure_ascii=False)
-        return await super().__call__(scope, receive, send)
+    def __init__(
+        self,
+        content,
+        status_code: int = 200,
+        media_type: str = None,
+        background=None,
+        headers=None,
+        codec: JSONCodec = None,
+    ):
+        self.codec = codec or get_json_codec()
+        super().__init__(content, status_code, media_type, background, headers)
+
+    def render(self, content) -> bytes:
+        if isinstance(content, Mapping) and not isinstance(content, dict):
+            content = dict(content)
+        return self.codec.dumps(content)
+
+
+async def iterate_in_threadpool(iterator: typing.Iterator, batch_size: int = 16):
+    """在线程池里推进同步迭代器，每次取一批，减少线程切换的次数"""
+
+    def next_batch():
+        return list(itertools.islice(iterator, batch_size))
+
+    try:
+        while batch := await asyncio.to_thread(next_batch):
+            for item in batch:
+                yield item
+    finally:
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            try:
+                close()
+            except ValueError:
+                # 线程里还在执行这个生成器，没办法关闭，它取完这一批就不会再被推进了
+                pass
 
 
 class StreamingResponse(Response):
+    """
+    streamio 可以是异步迭代器，也可以是同步迭代器（在线程池里按 batch_size 批量推进）。
+
+    发送的同时会监听 http.disconnect，客户端断开后马上取消生产者，不再继续生成数据。
+    生产者自己要读取请求体时（例如直接转发 request.stream()），监听会和它抢
+    receive 的消息，这时需要传 watch_disconnect=False。
+
+    设置 coalesce_size 后会把小块数据攒到这个大小再发送，减少 send 的次数。
+    """
+
     def __init__(
         self,
         streamio,
@@ -85,16 +215,30 @@ class StreamingResponse(Response):
         media_type=None,
         background=None,
         headers=None,
+        batch_size: int = 16,
+        coalesce_size: int = None,
+        watch_disconnect: bool = True,
     ):
-        self.streamio = streamio
+        if hasattr(streamio, "__aiter__"):
+            self.streamio = streamio
+        else:
+            self.streamio = iterate_in_threadpool(iter(streamio), batch_size)
         self.status_code = status_code
         if media_type:
             self.media_type = media_type
         self.background = background
+        self.coalesce_size = coalesce_size
+        self.watch_disconnect = watch_disconnect
         self.headers = MutableHeaders(headers)
         self.init_headers()
 
-    async def __call__(self, scope, receive, send):
+    async def listen_for_disconnect(self, receive):
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+
+    async def stream_response(self, send):
         await send(
             {
                 "type": "http.response.start",
@@ -103,11 +247,21 @@ class StreamingResponse(Response):
             }
         )
 
-        # 你这里相当于用户只能传异步生成器，不可以传同步生成器的
+        buffer = []
+        buffered = 0
         async for chunk in self.streamio:
             if isinstance(chunk, str):
                 chunk = chunk.encode()
 
+            if self.coalesce_size:
+                buffer.append(chunk)
+                buffered += len(chunk)
+                if buffered < self.coalesce_size:
+                    continue
+                chunk = b"".join(buffer)
+                buffer.clear()
+                buffered = 0
+
             await send(
                 {
                     "type": "http.response.body",
@@ -116,12 +270,168 @@ class StreamingResponse(Response):
                 }
             )
 
-        await send({"type": "http.response.body"})
-        if self.background:
-            await self.background()
+        await send({"type": "http.response.body", "body": b"".join(buffer)})
+
+    async def __call__(self, scope, receive, send):
+        if self.is_not_modified(scope):
+            await self.send_not_modified(scope, send)
+            return
+
+        if receive is None or not self.watch_disconnect:
+            await self.stream_response(send)
+        else:
+            stream = asyncio.ensure_future(self.stream_response(send))
+            disconnect = asyncio.ensure_future(self.listen_for_disconnect(receive))
+            try:
+                await asyncio.wait(
+                    [stream, disconnect], return_when=asyncio.FIRST_COMPLETED
+                )
+            finally:
+                # 客户端断开时取消生产者，正常结束时停止监听
+                for task in (stream, disconnect):
+                    task.cancel()
+                await asyncio.gather(stream, disconnect, return_exceptions=True)
+                aclose = getattr(self.streamio, "aclose", None)
+                if aclose is not None:
+                    await aclose()
+
+            if not stream.cancelled() and stream.exception() is not None:
+                raise stream.exception()
+
+        await self.run_background(scope)
+
+
+def md5_file(path: str, chunk_size: int) -> str:
+    """分块计算文件的 md5，内存占用只有一个块的大小"""
+    digest = hashlib.md5()
+    with open(path, "rb") as fp:
+        while chunk := fp.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def parse_range_header(value: str, size: int) -> list[tuple[int, int]] | None:
+    """
+    解析 "bytes=0-99,200-,-50" 这样的 Range 头，返回合并之后的 [start, stop) 列表。
+    格式不对时返回 None（按没有 Range 处理），范围都无法满足时返回空列表。
+    """
+    unit, _, specs = value.partition("=")
+    if unit.strip().lower() != "bytes" or not specs.strip():
+        return None
+
+    ranges = []
+    for spec in specs.split(","):
+        first, sep, last = spec.strip().partition("-")
+        if not sep:
+            return None
+        try:
+            if not first:
+                # 后缀范围，表示最后的若干字节
+                length = int(last)
+                if length == 0:
+                    continue
+                start, stop = max(size - length, 0), size
+            else:
+                start = int(first)
+                stop = int(last) + 1 if last else size
+                if last and stop <= start:
+                    return None
+        except ValueError:
+            return None
+
+        if start >= size:
+            continue
+        ranges.append((start, min(stop, size)))
+
+    # 合并重叠或相邻的范围
+    merged = []
+    for start, stop in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], stop))
+        else:
+            merged.append((start, stop))
+    return merged
+
+
+class FileMetadata(typing.NamedTuple):
+    stat_result: os.stat_result
+    media_type: str | None
+    last_modified: str
+    etag: str
+
+
+class FileMetadataCache:
+    """
+    进程内共享的文件元数据缓存（stat 结果、MIME 类型、ETag），按路径做 LRU 淘汰。
+
+    每次查询只做一次 stat，修改时间、大小或 inode 变了就重新计算，
+    所以热点文件既不用重复猜 MIME 类型，也不用重复计算内容哈希。
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._entries: OrderedDict[tuple[str, bool], FileMetadata] = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        self._entries.clear()
+
+    @staticmethod
+    def weak_etag(stat_result: os.stat_result) -> str:
+        return 'W/"%x-%x-%x"' % (
+            stat_result.st_mtime_ns,
+            stat_result.st_size,
+            stat_result.st_ino,
+        )
+
+    async def get(
+        self, path: str, strong_etag: bool = False, chunk_size: int = 64 * 1024
+    ) -> FileMetadata:
+        try:
+            stat_result = os.stat(path)
+        except FileNotFoundError:
+            raise RuntimeError(f"{path} does not exist")
+
+        if not stat.S_ISREG(stat_result.st_mode):
+            raise RuntimeError(f"{path} is not a file")
+
+        key = (os.fspath(path), strong_etag)
+        entry = self._entries.get(key)
+        if entry is not None:
+            cached = entry.stat_result
+            if (
+                cached.st_mtime_ns == stat_result.st_mtime_ns
+                and cached.st_size == stat_result.st_size
+                and cached.st_ino == stat_result.st_ino
+            ):
+                self._entries.move_to_end(key)
+                return entry
+
+        if strong_etag:
+            digest = await asyncio.to_thread(md5_file, path, chunk_size)
+            etag = f'"{digest}"'
+        else:
+            etag = self.weak_etag(stat_result)
+
+        media_type, _ = mimetypes.guess_type(key[0])
+        last_modified = formatdate(stat_result.st_mtime, usegmt=True)
+        entry = FileMetadata(stat_result, media_type, last_modified, etag)
+
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return entry
+
+
+file_metadata_cache = FileMetadataCache()
 
 
 class FileResponse(Response):
+    chunk_size = 64 * 1024
+
     def __init__(
         self,
         path: str,
@@ -130,13 +440,23 @@ class FileResponse(Response):
         filename: str = None,
         background=None,
         headers=None,
+        chunk_size: int = None,
+        strong_etag: bool = False,
+        metadata_cache: FileMetadataCache = None,
+        metadata: FileMetadata = None,
     ):
         self.status_code = status_code
         self.path = path
         if media_type:
             self.media_type = media_type
-        if filename:
-            self.filename = filename
+        self.filename = filename
+        if chunk_size:
+            self.chunk_size = chunk_size
+        # 默认使用根据 stat 生成的弱 ETag，需要内容哈希时再打开 strong_etag
+        self.strong_etag = strong_etag
+        self.metadata_cache = metadata_cache or file_metadata_cache
+        # 调用方已经有元数据（例如 StaticFiles 的索引）时，发送时不再 stat
+        self.metadata = metadata
         self.background = background
         self.headers = MutableHeaders(headers)
         self.init_headers()
@@ -144,9 +464,10 @@ class FileResponse(Response):
     def init_headers(self):
         if self.media_type:
             self.headers["Content-Type"] = f"{self.media_type}; charset=utf-8"
-        else:
+        elif self.filename:
             mime_type, charset = mimetypes.guess_type(self.filename)
             self.headers["Content-Type"] = f"{mime_type}"
+        # 两者都没有时，在发送时使用元数据缓存里按路径猜出的类型
 
         if self.filename:
             self.headers["Content-Disposition"] = (
@@ -154,27 +475,169 @@ class FileResponse(Response):
             )
 
     async def __call__(self, scope, receive, send):
-        try:
-            async with aiofiles.open(self.path, mode="rb") as fp:
-                content = await fp.read()
+        metadata = self.metadata or await self.metadata_cache.get(
+            self.path, self.strong_etag, self.chunk_size
+        )
+        size = metadata.stat_result.st_size
+        self.headers["Etag"] = metadata.etag
+        self.headers["Content-Length"] = str(size)
+        self.headers["Last-Modified"] = metadata.last_modified
+        self.headers["Accept-Ranges"] = "bytes"
+        media_type = metadata.media_type or "application/octet-stream"
+        self.headers.setdefault("Content-Type", media_type)
+
+        # 校验通过时直接返回 304，不打开文件
+        if self.is_not_modified(scope):
+            await self.send_not_modified(scope, send)
+            return
+
+        # 范围请求要改写 Content-Range / Content-Length / Content-Type，
+        # 在副本上修改，同一个响应再次发送时不会带上这次的值
+        headers = self.headers.mutablecopy()
+        ranges = self.requested_ranges(scope, size)
+        if ranges is None:
+            await self.send_file(scope, send, headers, size)
+        elif not ranges:
+            await self.send_range_not_satisfiable(send, headers, size)
+        elif len(ranges) == 1:
+            await self.send_single_range(scope, send, headers, size, *ranges[0])
+        else:
+            await self.send_multiple_ranges(scope, send, headers, size, ranges)
 
-                self.headers["Etag"] = hashlib.md5(content).hexdigest()
-                self.headers["Content-Length"] = str(len(content))
-                mtime = pathlib.Path(self.path).stat().st_mtime
-                self.headers["Last-Modified"] = formatdate(mtime, usegmt=True)
+        await self.run_background(scope)
 
-                start = {
-                    "type": "http.response.start",
-                    "status": self.status_code,
-                    "headers": self.headers.raw,
-                }
-                await send(start)
-        except IsADirectoryError:
-            raise RuntimeError(f"{self.path} is not a file")
+    def requested_ranges(self, scope, size: int) -> list[tuple[int, int]] | None:
+        """返回 None 表示发送整个文件，空列表表示范围无法满足"""
+        if self.status_code != 200 or scope.get("method") not in ("GET", "HEAD"):
+            return None
 
-        except FileNotFoundError:
-            raise RuntimeError(f"{self.path} does not exist")
+        headers = Headers(raw=scope.get("headers"))
+        range_header = headers.get("range")
+        if range_header is None:
+            return None
 
-        await send({"type": "http.response.body", "body": content})
-        if self.background:
-            await self.background()
+        # If-Range 对不上说明文件已经变了，发送整个文件；
+        # RFC 9110 要求强比较，弱 ETag 永远不算匹配
+        if_range = headers.get("if-range")
+        if if_range is not None:
+            if if_range.startswith("W/"):
+                return None
+            if if_range not in (self.headers["etag"], self.headers["last-modified"]):
+                return None
+
+        return parse_range_header(range_header, size)
+
+    async def send_start(self, send, headers: MutableHeaders, status_code: int):
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status_code,
+                "headers": headers.raw,
+            }
+        )
+
+    async def send_file(self, scope, send, headers: MutableHeaders, size: int):
+        await self.send_start(send, headers, self.status_code)
+
+        extensions = scope.get("extensions") or {}
+        if scope.get("method") == "HEAD" or size == 0:
+            await send({"type": "http.response.body", "body": b""})
+        elif "http.response.pathsend" in extensions:
+            # 服务器直接发送文件，数据不经过 Python
+            path = os.path.abspath(self.path)
+            await send({"type": "http.response.pathsend", "path": path})
+        elif "http.response.zerocopy" in extensions:
+            with open(self.path, "rb") as fp:
+                await send({"type": "http.response.zerocopy", "file": fp})
+        else:
+            async with aiofiles.open(self.path, mode="rb") as fp:
+                await self.send_chunks(fp, send, 0, size)
+
+    async def send_range_not_satisfiable(
+        self, send, headers: MutableHeaders, size: int
+    ):
+        headers["Content-Range"] = f"bytes */{size}"
+        headers["Content-Length"] = "0"
+        await self.send_start(send, headers, 416)
+        await send({"type": "http.response.body", "body": b""})
+
+    async def send_single_range(
+        self, scope, send, headers: MutableHeaders, size: int, start: int, stop: int
+    ):
+        headers["Content-Range"] = f"bytes {start}-{stop - 1}/{size}"
+        headers["Content-Length"] = str(stop - start)
+        await self.send_start(send, headers, 206)
+
+        extensions = scope.get("extensions") or {}
+        if scope.get("method") == "HEAD":
+            await send({"type": "http.response.body", "body": b""})
+        elif "http.response.zerocopy" in extensions:
+            with open(self.path, "rb") as fp:
+                await send(
+                    {
+                        "type": "http.response.zerocopy",
+                        "file": fp,
+                        "offset": start,
+                        "count": stop - start,
+                    }
+                )
+        else:
+            async with aiofiles.open(self.path, mode="rb") as fp:
+                await self.send_chunks(fp, send, start, stop)
+
+    async def send_multiple_ranges(
+        self, scope, send, headers: MutableHeaders, size: int, ranges
+    ):
+        boundary = secrets.token_hex(13)
+        content_type = headers["content-type"]
+        part_headers = [
+            (
+                f"--{boundary}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Range: bytes {start}-{stop - 1}/{size}\r\n\r\n"
+            ).encode("latin-1")
+            for start, stop in ranges
+        ]
+        ending = f"\r\n--{boundary}--\r\n".encode("latin-1")
+
+        length = len(ending) + 2 * (len(ranges) - 1)
+        length += sum(len(header) for header in part_headers)
+        length += sum(stop - start for start, stop in ranges)
+        headers["Content-Type"] = f"multipart/byteranges; boundary={boundary}"
+        headers["Content-Length"] = str(length)
+        await self.send_start(send, headers, 206)
+
+        if scope.get("method") == "HEAD":
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        async with aiofiles.open(self.path, mode="rb") as fp:
+            for idx, (start, stop) in enumerate(ranges):
+                header = part_headers[idx]
+                if idx:
+                    header = b"\r\n" + header
+                await send(
+                    {"type": "http.response.body", "body": header, "more_body": True}
+                )
+                await self.send_chunks(fp, send, start, stop, more_body=True)
+        await send({"type": "http.response.body", "body": ending})
+
+    async def send_chunks(self, fp, send, start: int, stop: int, more_body=False):
+        """从 start 开始按 chunk_size 分块发送到 stop，内存占用和文件大小无关"""
+        await fp.seek(start)
+        remaining = stop - start
+        while remaining > 0:
+            chunk = await fp.read(min(self.chunk_size, remaining))
+            if not chunk:
+                # 文件在 stat 之后被截短了，也要发出最后一条消息结束响应
+                if not more_body:
+                    await send({"type": "http.response.body", "body": b""})
+                break
+            remaining -= len(chunk)
+            await send(
+                {
+                    "type": "http.response.body",
+                    "body": chunk,
+                    "more_body": more_body or remaining > 0,
+                }
+            )
@@ -1,25 +1,65 @@
 import re
 import enum
+import time
 import typing
-import asyncio
 import inspect
+import functools
 
-from years.requests import Request
+from years.concurrency import BoundedExecutor, ExecutorSaturated, endpoint_handler
+from years.convertors import CONVERTOR_TYPES, Convertor, PathConvertor
+from years.formparsers import MultiPartException
+from years.metrics import UNMATCHED
+from years.requests import Request, RequestTooLarge, WebSocket, WebSocketDisconnect
 from years.responses import Response
 
 
-def request_response(endpoint: typing.Callable):
-    async def wrapper(scope, receive, send):
-        request = Request(scope, receive)
+def request_response(
+    endpoint: typing.Callable,
+    max_body_size: int = None,
+    executor: BoundedExecutor = None,
+    metrics=None,
+):
+    """
+    在注册路由时决定好怎么调用 endpoint，请求时不再做类型判断：
+    类只实例化一次并复用，协程直接 await，同步函数交给线程池。
 
-        if inspect.isclass(endpoint):
-            response = await endpoint()(request)
-        elif inspect.iscoroutinefunction(endpoint):
-            response = await endpoint(request)
+    metrics 是 years.metrics.RouteMetrics，给出时记录处理函数和发送响应的耗时。
+    """
+    if inspect.isclass(endpoint):
+        endpoint = endpoint()
+
+    handle = endpoint_handler(endpoint, executor)
+    if metrics is not None:
+        handle = metrics.time_handler(handle)
+
+    async def wrapper(scope, receive, send):
+        request = Request(scope, receive, max_body_size=max_body_size)
+
+        try:
+            response = await handle(request)
+        except RequestTooLarge:
+            response = Response("请求体过大", 413)
+        except MultiPartException as exc:
+            response = Response(str(exc), exc.status_code)
+        except ExecutorSaturated:
+            response = Response("服务繁忙", 503, headers={"retry-after": "1"})
+
+        if metrics is None:
+            await response(scope, receive, send)
         else:
-            response = await asyncio.to_thread(endpoint, request)
+            await metrics.send_response(response, scope, receive, send)
+
+    return wrapper
+
 
-        await response(scope, receive, send)
+def websocket_session(endpoint: typing.Callable):
+    async def wrapper(scope, receive, send):
+        websocket = WebSocket(scope, receive, send)
+        try:
+            await endpoint(websocket)
+        except WebSocketDisconnect:
+            # 客户端断开是会话的正常结束
+            pass
 
     return wrapper
 
@@ -30,8 +70,66 @@ class Mathched(enum.Enum):
     FULL = 2
 
 
+def normalize_path(path: str) -> str:
+    if not path.endswith("/"):
+        path += "/"
+
+    if not path.startswith("/"):
+        path = "/" + path
+
+    return path
+
+
+def split_path(path: str) -> list[str]:
+    """把规范化之后的路径切成段，"/a/b/" -> ["a", "b"]"""
+    if path == "/":
+        return []
+    return path[1:-1].split("/")
+
+
+PARAM_REGEX = re.compile(r"{([a-zA-Z_][a-zA-Z0-9_]*)(?::([a-zA-Z_][a-zA-Z0-9_]*))?}")
+
+
+@functools.cache
+def compile_path(path: str) -> tuple[re.Pattern | None, dict[str, Convertor]]:
+    """
+    把带参数的路径（或路径段）编译成正则，参数之外的部分按字面量处理，
+    "{id:int}" 这样的参数使用对应转换器的正则，默认是 str。
+    不带参数的路径返回 None，直接比较字符串即可。
+
+    结果按路径缓存，相同的路径模板在进程里只编译一次。
+    """
+    if "{" not in path:
+        return None, {}
+
+    regex = ""
+    idx = 0
+    convertors = {}
+    for match in PARAM_REGEX.finditer(path):
+        name, convertor_type = match.groups(default="str")
+        assert convertor_type in CONVERTOR_TYPES, f"未知的路径参数类型 '{convertor_type}'"
+        assert name not in convertors, f"路径 '{path}' 里的参数 '{name}' 重复了"
+        convertor = CONVERTOR_TYPES[convertor_type]
+        regex += re.escape(path[idx : match.start()])
+        regex += f"(?P<{name}>{convertor.regex})"
+        convertors[name] = convertor
+        idx = match.end()
+    regex += re.escape(path[idx:])
+    return re.compile(regex), convertors
+
+
+def convert_params(convertors: dict[str, Convertor], params: dict[str, str]):
+    """转换路径参数，转换失败返回 None，表示这条路由匹配不上"""
+    try:
+        return {
+            name: convertors[name].convert(value) for name, value in params.items()
+        }
+    except ValueError:
+        return None
+
+
 class BaseRoute:
-    def matches(self, scope):
+    def matches(self, scope, path: str = None):
         raise NotImplementedError()
 
     async def __call__(self, scope, receive, send):
@@ -40,46 +138,101 @@ class BaseRoute:
 
 class Route(BaseRoute):
     def __init__(
-        self, path: str, endpoint: typing.Callable, *, methods: list[str] = None
+        self,
+        path: str,
+        endpoint: typing.Callable,
+        *,
+        methods: list[str] = None,
+        max_body_size: int = None,
+        executor: BoundedExecutor = None,
     ):
         self.path = path
-        if not methods:
-            self.methods = ["GET"]
-        else:
-            self.methods = methods
-        self.endpoint = request_response(endpoint)
+        # 每次请求都要判断方法，用 frozenset 代替列表扫描
+        self.methods = frozenset(methods or ["GET"])
+        self.max_body_size = max_body_size
+        self.executor = executor
+        if inspect.isclass(endpoint):
+            endpoint = endpoint()
+        self.handler = endpoint
+        self.endpoint = request_response(endpoint, max_body_size, executor)
+        # 打开指标统计之后由 Router 设置，见 instrument()
+        self.metrics = None
+        self.instrumented = None
+
+        # 字面量路径不需要正则，pattern 为 None 时直接比较字符串
+        self.normalized = normalize_path(path)
+        self.pattern, self.param_convertors = compile_path(self.normalized)
+
+    def matches(self, scope: dict, path: str = None):
+        """path 是已经规范化的路径，Router 只规范化一次再传下来"""
+        if scope.get("type") == "websocket":
+            return Mathched.NONE, {}
 
-        if not path.endswith("/"):
-            path += "/"
+        if path is None:
+            path = normalize_path(scope["path"])
 
-        if not path.startswith("/"):
-            path = "/" + path
+        if self.pattern is None:
+            if path != self.normalized:
+                return Mathched.NONE, {}
+            params = {}
+        else:
+            res = self.pattern.fullmatch(path)
+            if not res:
+                return Mathched.NONE, {}
+            params = convert_params(self.param_convertors, res.groupdict())
+            if params is None:
+                return Mathched.NONE, {}
+
+        if "path_params" not in scope:
+            scope["path_params"] = {}
+        scope["path_params"].update(params)
+
+        if scope["method"] in self.methods:
+            return Mathched.FULL, scope
+        return Mathched.PARTICAL, scope
 
-        self.regex = path.replace("{", "(?P<").replace("}", ">[^/]+)")
+    def instrument(self, metrics):
+        """生成一个带计时的 endpoint，原来的 endpoint 不受影响"""
+        self.metrics = metrics
+        metrics.singleflight = getattr(self.handler, "singleflight", None)
+        self.instrumented = request_response(
+            self.handler, self.max_body_size, self.executor, metrics
+        )
 
-    def matches(self, scope: dict):
-        path: str = scope["path"]
+    async def __call__(self, scope, receive, send):
+        await self.endpoint(scope, receive, send)
 
-        if not path.endswith("/"):
-            path += "/"
 
-        if not path.startswith("/"):
-            path = "/" + path
+class WebSocketRoute(BaseRoute):
+    def __init__(self, path: str, endpoint: typing.Callable):
+        self.path = path
+        self.endpoint = websocket_session(endpoint)
+        self.normalized = normalize_path(path)
+        self.pattern, self.param_convertors = compile_path(self.normalized)
 
-        res = re.fullmatch(self.regex, path)
-        if res:
-            if scope["method"] in self.methods:
-                if "path_params" not in scope:
-                    scope["path_params"] = {}
-                scope["path_params"].update(res.groupdict())
-                return Mathched.FULL, scope
-            else:
-                if "path_params" not in scope:
-                    scope["path_params"] = {}
-                scope["path_params"].update(res.groupdict())
-                return Mathched.PARTICAL, scope
+    def matches(self, scope: dict, path: str = None):
+        if scope.get("type") != "websocket":
+            return Mathched.NONE, {}
+
+        if path is None:
+            path = normalize_path(scope["path"])
 
-        return Mathched.NONE, {}
+        if self.pattern is None:
+            if path != self.normalized:
+                return Mathched.NONE, {}
+            params = {}
+        else:
+            res = self.pattern.fullmatch(path)
+            if not res:
+                return Mathched.NONE, {}
+            params = convert_params(self.param_convertors, res.groupdict())
+            if params is None:
+                return Mathched.NONE, {}
+
+        if "path_params" not in scope:
+            scope["path_params"] = {}
+        scope["path_params"].update(params)
+        return Mathched.FULL, scope
 
     async def __call__(self, scope, receive, send):
         await self.endpoint(scope, receive, send)
@@ -90,76 +243,307 @@ class Mount(BaseRoute):
         self, path: str, routes: list[Route] = None, app: typing.Callable = None
     ):
         assert not (routes and app), "app 和 路径列表不可以同时存在的"
+        self.path = path
         self.router = Router(routes)
         self.app = app
-        if not path.endswith("/"):
-            path += "/"
+        # 挂载 ASGI 应用并打开指标统计时由 Router 设置，请求记在挂载前缀下面
+        self.metrics = None
+        self.normalized = normalize_path(path)
+        self.pattern, self.param_convertors = compile_path(self.normalized)
+
+    def matches(self, scope: dict, path: str = None):
+        if path is None:
+            path = normalize_path(scope["path"])
+
+        if self.pattern is None:
+            if not path.startswith(self.normalized):
+                return Mathched.NONE, {}
+            end = len(self.normalized)
+        else:
+            res = self.pattern.match(path)
+            if not res:
+                return Mathched.NONE, {}
+            end = res.end()
 
-        if not path.startswith("/"):
-            path = "/" + path
+        scope["path"] = path[end:]
+        return Mathched.FULL, scope
 
-        self.regex = "^" + path.replace("{", "(?P<").replace("}", ">[^/]+)")
+    async def __call__(self, scope, receive, send):
+        if self.app:
+            await self.app(scope, receive, send)
+        else:
+            await self.router(scope, receive, send)
 
-    def matches(self, scope: dict):
-        path: str = scope["path"]
 
-        if not path.endswith("/"):
-            path += "/"
+class _Edge(typing.NamedTuple):
+    pattern: re.Pattern
+    convertors: dict[str, Convertor]
+    # 带 path 转换器的边可以一次吃掉多个路径段
+    spans: bool
+    child: "_Node"
 
-        if not path.startswith("/"):
-            path = "/" + path
 
-        res = re.match(self.regex, path)
-        if res:
-            scope["path"] = path[res.span()[-1] :]  # noqa
-            return Mathched.FULL, scope
-        else:
-            return Mathched.NONE, {}
+class _Node:
+    __slots__ = ("static", "params", "routes", "mounts")
 
-    async def __call__(self, scope, receive, send):
-        if self.app:
-            await self.app(scope, receive, send)
+    def __init__(self):
+        # 静态段直接用字典查找，参数段是带正则和转换器的边
+        self.static: dict[str, _Node] = {}
+        self.params: dict[str, _Edge] = {}
+        # 在该节点结束的路由，以及前缀在该节点结束的挂载点，都带着注册顺序
+        self.routes: list[tuple[int, Route]] = []
+        self.mounts: list[tuple[int, Mount]] = []
+
+
+class RouteTree:
+    """
+    把一个 Router 的路由编译成前缀树，查找开销只和路径的段数有关，和路由数量无关。
+
+    线性扫描时靠前注册的路由优先，这里在所有命中的候选里取注册顺序最小的，
+    所以 FULL / PARTICAL 的结果以及 404 / 405 的判断和原来保持一致。
+    """
+
+    def __init__(self, routes: list[BaseRoute]):
+        self.root = _Node()
+        # 树里放不下的自定义路由，仍然调用它自己的 matches
+        self.fallback: list[tuple[int, BaseRoute]] = []
+
+        for order, route in enumerate(routes):
+            if isinstance(route, (Route, WebSocketRoute)):
+                self.insert(route.normalized).routes.append((order, route))
+            elif isinstance(route, Mount):
+                self.insert(route.normalized).mounts.append((order, route))
+            else:
+                self.fallback.append((order, route))
+
+    def insert(self, path: str) -> _Node:
+        node = self.root
+        for segment in split_path(path):
+            if "{" not in segment:
+                node = node.static.setdefault(segment, _Node())
+                continue
+
+            if segment not in node.params:
+                pattern, convertors = compile_path(segment)
+                spans = any(isinstance(c, PathConvertor) for c in convertors.values())
+                node.params[segment] = _Edge(pattern, convertors, spans, _Node())
+            node = node.params[segment].child
+
+        return node
+
+    def walk(self, node: _Node, segments: list[str], depth: int, params, found):
+        for order, mount in node.mounts:
+            found.append((order, mount, params, depth))
+
+        if depth == len(segments):
+            for order, route in node.routes:
+                found.append((order, route, params, depth))
+            return
+
+        segment = segments[depth]
+        child = node.static.get(segment)
+        if child is not None:
+            self.walk(child, segments, depth + 1, params, found)
+
+        for edge in node.params.values():
+            if edge.spans:
+                ends = range(depth + 1, len(segments) + 1)
+            else:
+                ends = (depth + 1,)
+
+            for end in ends:
+                value = segment if end == depth + 1 else "/".join(segments[depth:end])
+                res = edge.pattern.fullmatch(value)
+                if not res:
+                    continue
+                converted = convert_params(edge.convertors, res.groupdict())
+                if converted is not None:
+                    self.walk(edge.child, segments, end, params | converted, found)
+
+    def search(self, scope: dict, path: str = None):
+        if path is None:
+            path = normalize_path(scope["path"])
+        segments = split_path(path)
+        found = []
+        self.walk(self.root, segments, 0, {}, found)
+
+        websocket = scope.get("type") == "websocket"
+        method = scope.get("method")
+        best = None
+        partical = False
+        for candidate in found:
+            order, route = candidate[0], candidate[1]
+            if isinstance(route, Mount):
+                eligible = True
+            elif isinstance(route, WebSocketRoute):
+                # HTTP 请求不会因为同路径上的 WebSocket 路由得到 405，反之亦然
+                if not websocket:
+                    continue
+                eligible = True
+            elif websocket:
+                continue
+            else:
+                eligible = method in route.methods
+
+            if eligible:
+                if best is None or order < best[0]:
+                    best = candidate
+            else:
+                partical = True
+
+        for order, route in self.fallback:
+            if best is not None and order > best[0]:
+                break
+            ret, _ = route.matches(scope, path)
+            if ret is Mathched.FULL:
+                return Mathched.FULL, route
+            if ret is Mathched.PARTICAL:
+                partical = True
+
+        if best is None:
+            if partical:
+                return Mathched.PARTICAL, None
+            return Mathched.NONE, None
+
+        _, route, params, depth = best
+        if isinstance(route, Mount):
+            scope["path"] = "".join(segment + "/" for segment in segments[depth:])
         else:
-            await self.router(scope, receive, send)
+            if "path_params" not in scope:
+                scope["path_params"] = {}
+            scope["path_params"].update(params)
+
+        return Mathched.FULL, route
 
 
 class Router:
     def __init__(self, routes: list[Route] = None):
         self.routes = routes or []
-
-    def route(self, path: str, methods=None):
+        self.tree: RouteTree | None = None
+        # years.metrics.Metrics，为 None 时请求路径上没有任何统计代码
+        self.metrics = None
+        self.prefix = ""
+
+    def route(
+        self,
+        path: str,
+        methods=None,
+        max_body_size: int = None,
+        executor: BoundedExecutor = None,
+    ):
         if methods is None:
             methods = ["GET"]
 
         def decorate(endpoint):
-            route = Route(path, endpoint, methods=methods)
+            route = Route(
+                path,
+                endpoint,
+                methods=methods,
+                max_body_size=max_body_size,
+                executor=executor,
+            )
             self.add_route(route)
 
         return decorate
 
     def add_route(self, route: Route):
         self.routes.append(route)
+        self.tree = None
+
+    def websocket(self, path: str):
+        def decorate(endpoint):
+            self.add_websocket_route(WebSocketRoute(path, endpoint))
+
+        return decorate
+
+    def add_websocket_route(self, route: WebSocketRoute):
+        self.routes.append(route)
+        self.tree = None
 
     def add_mount(self, mount: Mount):
         self.routes.append(mount)
+        self.tree = None
 
-    async def __call__(self, scope, receive, send):
-        partical = False
+    def instrument(self, metrics, prefix: str = ""):
+        """打开指标统计，路由按 prefix + 路径模板记录，挂载的子路由一起打开"""
+        self.metrics = metrics
+        self.prefix = prefix
+        self.tree = None
 
+    def compile(self) -> RouteTree:
+        """编译路由树，第一次请求时会自动调用，之后添加路由会使其失效并重新编译"""
         for route in self.routes:
-            ret, new_scope = route.matches(scope)
+            if isinstance(route, Mount) and route.app is None:
+                if self.metrics is not None:
+                    prefix = self.prefix + route.path.rstrip("/")
+                    route.router.instrument(self.metrics, prefix)
+                route.router.compile()
+            elif isinstance(route, Mount) and self.metrics is not None:
+                route.metrics = self.metrics.route(self.prefix + route.path)
+            elif isinstance(route, Route) and self.metrics is not None:
+                route.instrument(self.metrics.route(self.prefix + route.path))
+
+        self.tree = RouteTree(self.routes)
+        return self.tree
+
+    async def call_instrumented(self, scope, receive, send):
+        start = time.perf_counter()
+        tree = self.tree or self.compile()
+        ret, route = tree.search(scope, normalize_path(scope["path"]))
+        elapsed = time.perf_counter() - start
+
+        if ret is Mathched.FULL and isinstance(route, Route):
+            metrics = route.metrics
+            metrics.match.observe(elapsed)
+            metrics.in_flight += 1
+            self.metrics.in_flight += 1
+            # 请求数由 time_handler / send_response 统计，出错时也只记一次
+            try:
+                await route.instrumented(scope, receive, send)
+            finally:
+                metrics.in_flight -= 1
+                self.metrics.in_flight -= 1
+        elif ret is Mathched.FULL and isinstance(route, Mount) and route.app:
+            if scope["type"] != "http":
+                await route(scope, receive, send)
+                return
+            route.metrics.match.observe(elapsed)
+            self.metrics.in_flight += 1
+            try:
+                await route.metrics.call_app(route.app, scope, receive, send)
+            finally:
+                self.metrics.in_flight -= 1
+        elif ret is Mathched.FULL:
+            # 挂载的子路由自己统计，WebSocket 和自定义路由只负责分发
+            await route(scope, receive, send)
+        else:
+            if scope["type"] == "http":
+                status = 405 if ret is Mathched.PARTICAL else 404
+                unmatched = self.metrics.route(self.prefix + UNMATCHED)
+                unmatched.match.observe(elapsed)
+                unmatched.count(scope["method"], status)
+            await self.not_found(ret, scope, receive, send)
+
+    async def not_found(self, ret: Mathched, scope, receive, send):
+        if scope["type"] == "websocket":
+            # 握手之前直接关闭，服务器会给客户端返回 403
+            await send({"type": "websocket.close", "code": 1000, "reason": ""})
+        elif ret is Mathched.PARTICAL:
+            response = Response("方法不匹配", 405)
+            await response(scope, receive, send)
+        else:
+            response = Response("路径找不到", 404)
+            await response(scope, receive, send)
 
-            if ret is Mathched.FULL:
-                await route(new_scope, receive, send)
-                break
+    async def __call__(self, scope, receive, send):
+        if self.metrics is not None:
+            await self.call_instrumented(scope, receive, send)
+            return
 
-            if ret is Mathched.PARTICAL:
-                partical = True
+        tree = self.tree or self.compile()
+        ret, route = tree.search(scope, normalize_path(scope["path"]))
 
+        if ret is Mathched.FULL:
+            await route(scope, receive, send)
         else:
-            if partical:
-                response = Response("方法不匹配", 405)
-                await response(scope, receive, send)
-            else:
-                response = Response("路径找不到", 404)
-                await response(scope, receive, send)
+            await self.not_found(ret, scope, receive, send)
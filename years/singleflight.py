@@ -0,0 +1,150 @@
+import typing
+import asyncio
+import functools
+
+from years.concurrency import endpoint_handler
+from years.datastructures import Headers, MutableHeaders
+from years.responses import Response
+
+
+class SingleFlight:
+    """
+    同一个键同时只执行一次：第一个调用者执行函数，之后到达的调用者等待它的结果，
+    结果或者异常会原样交给所有等待者。
+
+    timeout 限制的是整次调用，超时的 asyncio.TimeoutError 同样交给所有等待者。
+    执行函数的调用者被取消时（例如客户端断开），等待者里会有一个接替它重新执行。
+    """
+
+    def __init__(self):
+        self.calls: dict[typing.Hashable, asyncio.Future] = {}
+        self.executed = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.timeouts = 0
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "inflight": len(self.calls),
+            "executed": self.executed,
+            "coalesced": self.coalesced,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+        }
+
+    async def do(self, key, func, *args, timeout: float = None):
+        """返回 (结果, shared)，shared 为 True 表示结果来自别的调用者"""
+        while key in self.calls:
+            future = self.calls[key]
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(future), True
+            except asyncio.CancelledError:
+                # 执行函数的调用者被取消，不是自己被取消时接替它
+                if not future.cancelled():
+                    raise
+                self.coalesced -= 1
+
+        future = asyncio.get_running_loop().create_future()
+        self.calls[key] = future
+        self.executed += 1
+        try:
+            result = await asyncio.wait_for(func(*args), timeout)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as exc:
+            if isinstance(exc, asyncio.TimeoutError):
+                self.timeouts += 1
+            else:
+                self.errors += 1
+            future.set_exception(exc)
+            # 没有等待者时也不要出现 "exception was never retrieved" 的警告
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            del self.calls[key]
+        return result, False
+
+
+# 带这些请求头的请求可能拿到按用户生成的响应，默认不和别的请求合并
+CREDENTIAL_HEADERS = ("authorization", "cookie")
+
+
+def default_key(request) -> tuple | None:
+    """
+    按方法、Host 和完整的请求目标（路径和查询字符串）合并，带凭据的请求返回 None，
+    单独执行。经过 Mount 之后 scope["path"] 只剩挂载前缀后面的部分，
+    所以优先使用服务器给出的 raw_path。
+    """
+    headers = Headers(raw=request.get("headers"))
+    if any(name in headers for name in CREDENTIAL_HEADERS):
+        return None
+    path = request.get("raw_path")
+    if path is None:
+        path = request.get("root_path", "") + request["path"]
+    query_string = request.get("query_string", b"")
+    return request.method, headers.get("host"), path, query_string
+
+
+def shareable(response) -> bool:
+    """只有渲染好 body、并且不设置 Cookie 的响应可以交给别的请求"""
+    return hasattr(response, "body") and "set-cookie" not in response.headers
+
+
+def replay(response: Response) -> Response:
+    """给等待的请求复制一份响应，共享已经渲染好的 body 和响应头，不带后台任务"""
+    copy = Response(response.body, response.status_code)
+    copy.headers = MutableHeaders(raw=list(response.headers.raw))
+    return copy
+
+
+def singleflight(
+    key: typing.Callable = None, timeout: float = None, group: SingleFlight = None
+):
+    """
+    路由函数的请求合并，key(request) 相同的并发请求只执行一次路由函数，
+    默认按方法、Host、完整路径和查询字符串合并，带 Authorization / Cookie 的请求不合并；
+    key 返回 None 时这个请求单独执行。放在 @app.get / @router.route 下面：
+
+        @app.get("/hot")
+        @singleflight(key=lambda request: request.query_params.get("id"))
+        async def hot(request): ...
+
+    所有请求得到同样的响应字节；StreamingResponse 这类没有渲染好 body 的响应
+    和带 Set-Cookie 的响应不能共享，等待的请求会自己再执行一次。需要统计时传入 group，
+    从 group.stats() 读取，也可以通过被装饰函数的 singleflight 属性拿到；
+    打开 Years(metrics=...) 时合并的请求数按路由输出。
+    """
+    key = key or default_key
+    group = group or SingleFlight()
+
+    def decorate(endpoint):
+        def wrap(call):
+            @functools.wraps(endpoint)
+            async def wrapper(request):
+                flight_key = key(request)
+                if flight_key is None:
+                    return await call(request)
+
+                response, shared = await group.do(
+                    flight_key, call, request, timeout=timeout
+                )
+                if not shared:
+                    return response
+                if not shareable(response):
+                    return await call(request)
+                return replay(response)
+
+            wrapper.singleflight = group
+            # 路由上指定了 executor 时，同步的路由函数改用这个线程池，见 endpoint_handler
+            wrapper.bind_executor = lambda executor: wrap(
+                endpoint_handler(endpoint, executor)
+            )
+            return wrapper
+
+        return wrap(endpoint_handler(endpoint))
+
+    return decorate
@@ -0,0 +1,239 @@
+import asyncio
+import collections
+import typing
+
+from years.jsoncodec import get_json_codec
+from years.responses import StreamingResponse
+
+DROP_OLDEST = "drop_oldest"
+DISCONNECT = "disconnect"
+OVERFLOW_POLICIES = (DROP_OLDEST, DISCONNECT)
+
+
+class ServerSentEvent:
+    """
+    一条 SSE 事件，encode() 得到按 text/event-stream 格式编码好的字节。
+    data 不是 str / bytes 时用当前的 JSON 编解码器序列化，多行数据拆成多个 data 字段。
+    """
+
+    def __init__(
+        self,
+        data: typing.Any = None,
+        *,
+        event: str = None,
+        id: str = None,
+        retry: int = None,
+        comment: str = None,
+    ):
+        self.data = data
+        self.event = event
+        self.id = id
+        self.retry = retry
+        self.comment = comment
+
+    def encode(self) -> bytes:
+        lines = []
+        if self.comment is not None:
+            lines.extend(": " + line for line in str(self.comment).splitlines())
+        if self.id is not None:
+            lines.append(f"id: {self.id}")
+        if self.event is not None:
+            lines.append(f"event: {self.event}")
+        if self.retry is not None:
+            lines.append(f"retry: {int(self.retry)}")
+        if self.data is not None:
+            data = self.data
+            if isinstance(data, bytes):
+                data = data.decode()
+            elif not isinstance(data, str):
+                data = get_json_codec().dumps(data).decode()
+            lines.extend("data: " + line for line in data.splitlines() or [""])
+        return ("\n".join(lines) + "\n\n").encode()
+
+
+def encode_event(event) -> bytes:
+    """字节原样返回，字典当作 ServerSentEvent 的参数，其余的当作 data"""
+    if isinstance(event, bytes):
+        return event
+    if isinstance(event, ServerSentEvent):
+        return event.encode()
+    if isinstance(event, dict):
+        return ServerSentEvent(**event).encode()
+    return ServerSentEvent(event).encode()
+
+
+class EventQueue:
+    """
+    每个客户端一个的有界队列，放进来的是编码好的字节。
+
+    队列满了之后按 overflow 处理：drop_oldest 丢掉最旧的事件，dropped 记录丢弃数；
+    disconnect 直接关闭队列，对应的响应随之结束，客户端可以按 retry 重连。
+    """
+
+    def __init__(self, maxsize: int = 256, overflow: str = DROP_OLDEST):
+        assert overflow in OVERFLOW_POLICIES, f"未知的溢出策略 '{overflow}'"
+        assert maxsize > 0, "maxsize 必须大于 0"
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.items: collections.deque[bytes] = collections.deque()
+        self.dropped = 0
+        self.closed = False
+        self.hub: BroadcastHub | None = None
+        self._waiter = asyncio.Event()
+
+    def __len__(self):
+        return len(self.items)
+
+    def put_nowait(self, item: bytes) -> bool:
+        """放入一条事件，队列已经关闭（或因为溢出被关闭）时返回 False"""
+        if self.closed:
+            return False
+
+        if len(self.items) >= self.maxsize:
+            if self.overflow == DISCONNECT:
+                self.close()
+                return False
+            self.items.popleft()
+            self.dropped += 1
+
+        self.items.append(item)
+        self._waiter.set()
+        return True
+
+    async def get_batch(self, timeout: float = None) -> list[bytes]:
+        """
+        取出当前积压的所有事件，一次发送，没有事件时最多等 timeout 秒。
+        超时返回空列表，队列关闭且取空之后抛出 EOFError。
+        """
+        if not self.items and not self.closed:
+            self._waiter.clear()
+            try:
+                await asyncio.wait_for(self._waiter.wait(), timeout)
+            except asyncio.TimeoutError:
+                return []
+
+        if not self.items and self.closed:
+            raise EOFError()
+
+        batch = list(self.items)
+        self.items.clear()
+        return batch
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self._waiter.set()
+        if self.hub is not None:
+            self.hub.unsubscribe(self)
+
+
+class BroadcastHub:
+    """
+    进程内的广播中心，publish 只编码一次，然后同步放进每个订阅者的队列，
+    不需要为每个订阅者单独起协程，一个生产者可以扇出到上万个连接。
+    """
+
+    def __init__(self, maxsize: int = 256, overflow: str = DROP_OLDEST):
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.subscribers: set[EventQueue] = set()
+
+    def __len__(self):
+        return len(self.subscribers)
+
+    def subscribe(self, maxsize: int = None, overflow: str = None) -> EventQueue:
+        queue = EventQueue(maxsize or self.maxsize, overflow or self.overflow)
+        queue.hub = self
+        self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: EventQueue):
+        self.subscribers.discard(queue)
+
+    def publish(self, event) -> int:
+        """广播一条事件，返回成功投递的订阅者数量"""
+        data = encode_event(event)
+        delivered = 0
+        # 溢出断开的队列会在 put_nowait 里把自己从集合中移除，所以遍历一份拷贝
+        for queue in tuple(self.subscribers):
+            if queue.put_nowait(data):
+                delivered += 1
+        return delivered
+
+    def close(self):
+        for queue in tuple(self.subscribers):
+            queue.close()
+
+
+class EventSourceResponse(StreamingResponse):
+    """
+    SSE 响应，content 可以是异步迭代器，也可以是 BroadcastHub.subscribe() 得到的队列。
+
+    迭代器里的元素可以是 ServerSentEvent、字典、字符串或者编码好的字节。
+    迭代器会在单独的任务里推进，写进有界队列，客户端读得慢时按 overflow 处理；
+    发送时把队列里积压的事件合成一块，ping 秒内没有事件就发一个注释行保活。
+    """
+
+    media_type = "text/event-stream"
+
+    def __init__(
+        self,
+        content,
+        status_code: int = 200,
+        headers=None,
+        background=None,
+        ping: float | None = 15,
+        retry: int = None,
+        maxsize: int = 256,
+        overflow: str = DROP_OLDEST,
+    ):
+        if isinstance(content, EventQueue):
+            self.queue = content
+            self.source = None
+        else:
+            self.queue = EventQueue(maxsize, overflow)
+            self.source = content
+        self.ping = ping
+        self.retry = retry
+
+        super().__init__(
+            self.iter_events(),
+            status_code=status_code,
+            background=background,
+            headers=headers,
+        )
+        self.headers.setdefault("cache-control", "no-cache")
+        self.headers.setdefault("x-accel-buffering", "no")
+
+    async def produce(self):
+        try:
+            async for event in self.source:
+                if not self.queue.put_nowait(encode_event(event)):
+                    break
+        finally:
+            self.queue.close()
+
+    async def iter_events(self):
+        producer = None
+        if self.source is not None:
+            producer = asyncio.ensure_future(self.produce())
+
+        try:
+            if self.retry is not None:
+                yield ServerSentEvent(retry=self.retry).encode()
+
+            while True:
+                try:
+                    batch = await self.queue.get_batch(self.ping)
+                except EOFError:
+                    break
+                yield b"".join(batch) if batch else b": ping\n\n"
+
+            if producer is not None and producer.done() and producer.exception():
+                raise producer.exception()
+        finally:
+            self.queue.close()
+            if producer is not None:
+                producer.cancel()
+                await asyncio.gather(producer, return_exceptions=True)
@@ -0,0 +1,161 @@
+import os
+import time
+import stat
+import asyncio
+import posixpath
+import mimetypes
+import typing
+from email.utils import formatdate
+
+from years.datastructures import Headers, choose_encoding
+from years.responses import FileMetadata, FileMetadataCache, FileResponse, Response
+
+# 预压缩文件的后缀和对应的 Content-Encoding，按优先级排列
+PRECOMPRESSED = {".br": "br", ".gz": "gzip"}
+
+
+class StaticFile(typing.NamedTuple):
+    path: str
+    metadata: FileMetadata
+    # Content-Encoding -> (预压缩文件路径, 元数据)
+    variants: dict[str, tuple[str, FileMetadata]]
+
+
+class StaticFiles:
+    """
+    挂载到 Mount 下的静态文件应用：
+
+        app.mount("/static", StaticFiles(directory="statics"))
+
+    启动时把目录下的文件都索引到内存里（stat 结果、MIME 类型、ETag），
+    处理请求只需要一次字典查找加上流式发送。索引之外的路径一律 404，
+    所以 "../" 之类的路径穿越也不会读到目录之外的文件。
+
+    refresh_interval 不为 None 时，距离上次建索引超过这个秒数后，
+    下一个请求会在线程池里重新扫描目录。
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        *,
+        html: bool = False,
+        precompressed: bool = True,
+        refresh_interval: float = None,
+        chunk_size: int = None,
+    ):
+        self.directory = os.path.realpath(directory)
+        if not os.path.isdir(self.directory):
+            raise RuntimeError(f"{directory} is not a directory")
+
+        self.html = html
+        self.precompressed = precompressed
+        self.refresh_interval = refresh_interval
+        self.chunk_size = chunk_size
+        self.index: dict[str, StaticFile] = {}
+        self.indexed_at = 0.0
+        self._refreshing = False
+        self.refresh()
+
+    def refresh(self):
+        self.index = self.build_index()
+        self.indexed_at = time.monotonic()
+
+    def build_index(self) -> dict[str, StaticFile]:
+        found: dict[str, tuple[str, os.stat_result]] = {}
+        for root, dirs, files in os.walk(self.directory):
+            for name in files:
+                full_path = os.path.join(root, name)
+                # 指向目录之外的符号链接不对外提供
+                real_path = os.path.realpath(full_path)
+                if os.path.commonpath([self.directory, real_path]) != self.directory:
+                    continue
+                try:
+                    stat_result = os.stat(full_path)
+                except OSError:
+                    continue
+                if not stat.S_ISREG(stat_result.st_mode):
+                    continue
+                key = os.path.relpath(full_path, self.directory)
+                found[key.replace(os.sep, "/")] = (full_path, stat_result)
+
+        index = {}
+        for key, (full_path, stat_result) in found.items():
+            media_type, _ = mimetypes.guess_type(key)
+            metadata = self.build_metadata(stat_result, media_type)
+
+            variants = {}
+            if self.precompressed:
+                for suffix, encoding in PRECOMPRESSED.items():
+                    if key + suffix in found:
+                        variant_path, variant_stat = found[key + suffix]
+                        variant = self.build_metadata(variant_stat, media_type)
+                        variants[encoding] = (variant_path, variant)
+
+            index[key] = StaticFile(full_path, metadata, variants)
+        return index
+
+    @staticmethod
+    def build_metadata(stat_result: os.stat_result, media_type: str) -> FileMetadata:
+        return FileMetadata(
+            stat_result,
+            media_type,
+            formatdate(stat_result.st_mtime, usegmt=True),
+            FileMetadataCache.weak_etag(stat_result),
+        )
+
+    async def maybe_refresh(self):
+        if self.refresh_interval is None:
+            return
+        if time.monotonic() - self.indexed_at < self.refresh_interval:
+            return
+
+        # 同一时间只有一个请求去重新扫描目录，其余请求继续使用旧索引
+        if self._refreshing:
+            return
+
+        self._refreshing = True
+        try:
+            self.index = await asyncio.to_thread(self.build_index)
+            self.indexed_at = time.monotonic()
+        finally:
+            self._refreshing = False
+
+    def lookup(self, path: str) -> StaticFile | None:
+        # 先拼上根路径再规范化，"../" 最多退回到根目录
+        key = posixpath.normpath("/" + path).lstrip("/")
+        static_file = self.index.get(key)
+        if static_file is None and self.html:
+            static_file = self.index.get(posixpath.join(key, "index.html"))
+        return static_file
+
+    async def __call__(self, scope, receive, send):
+        assert scope["type"] == "http"
+
+        if scope["method"] not in ("GET", "HEAD"):
+            response = Response("方法不匹配", 405)
+            await response(scope, receive, send)
+            return
+
+        await self.maybe_refresh()
+        static_file = self.lookup(scope["path"])
+        if static_file is None:
+            response = Response("路径找不到", 404)
+            await response(scope, receive, send)
+            return
+
+        path, metadata = static_file.path, static_file.metadata
+        headers = {}
+        if static_file.variants:
+            headers["vary"] = "Accept-Encoding"
+            accept_encoding = Headers(raw=scope.get("headers")).get("accept-encoding", "")
+            # variants 按 PRECOMPRESSED 的优先级排列
+            encoding = choose_encoding(accept_encoding, static_file.variants)
+            if encoding is not None:
+                path, metadata = static_file.variants[encoding]
+                headers["content-encoding"] = encoding
+
+        response = FileResponse(
+            path, headers=headers, chunk_size=self.chunk_size, metadata=metadata
+        )
+        await response(scope, receive, send)